@@ -1,57 +1,280 @@
-import baostock as bs
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import pandas as pd
 from tqdm import tqdm
-import os
 
-DATA_START_DATE_INSAMPLE = '2022-04-01' 
-DATA_END_DATE_INSAMPLE = '2022-06-30'
-DATA_START_DATE_OUTSAMPLE = '2022-07-01' 
-DATA_END_DATE_OUTSAMPLE = '2022-07-31'
-FREQUENCY = "30"   #30 for 30min, 60 for 60min, d for day, m for month, and so on 
-ADJUSTFLAG = "3"   # default value for no adjustment. 
-
-if(not os.path.exists("./data/raw/insample")): 
-    os.makedirs("./data/raw/insample", exist_ok=True)
-if(not os.path.exists("./data/raw/outsample")): 
-    os.makedirs("./data/raw/outsample", exist_ok=True)
-
-# import os 
-# print(os.listdir())
-indexStocksDf = pd.read_csv('./data/raw/csi500_index_composition.csv', index_col=None, encoding='gbk') 
-print(indexStocksDf.head())
-
-
-lg = bs.login()
-print('login respond error_code:'+lg.error_code)
-print('login respond  error_msg:'+lg.error_msg)
-for stock in tqdm(indexStocksDf.code): 
-    stock_ticker = '-'.join(stock.split('.'))
-    # insample data download
-    rs = bs.query_history_k_data_plus(stock,
-        "date,time,code,open,high,low,close,volume,amount,adjustflag",
-        start_date=DATA_START_DATE_INSAMPLE, end_date=DATA_END_DATE_INSAMPLE,
-        frequency=FREQUENCY, adjustflag=ADJUSTFLAG)
-    print('query_history_k_data_plus respond error_code:'+rs.error_code)
-    print('query_history_k_data_plus respond  error_msg:'+rs.error_msg) 
-
-    data_list = []
-    while (rs.error_code == '0') & rs.next():
-        data_list.append(rs.get_row_data())
-    result = pd.DataFrame(data_list, columns=rs.fields) 
-    result.rename(columns = str.capitalize, inplace=True) 
-    result.to_csv(f"./data/raw/insample/history_stock_{stock_ticker}.csv", index=False)
-    
-    # outsample data download
-    rs = bs.query_history_k_data_plus(stock,
-        "date,time,code,open,high,low,close,volume,amount,adjustflag",
-        start_date=DATA_START_DATE_OUTSAMPLE, end_date=DATA_END_DATE_OUTSAMPLE,
-        frequency=FREQUENCY, adjustflag=ADJUSTFLAG)
-    print('query_history_k_data_plus respond error_code:'+rs.error_code)
-    print('query_history_k_data_plus respond  error_msg:'+rs.error_msg) 
-
-    data_list = []
-    while (rs.error_code == '0') & rs.next():
-        data_list.append(rs.get_row_data())
-    result = pd.DataFrame(data_list, columns=rs.fields) 
-    result.rename(columns = str.capitalize, inplace=True) 
-    result.to_csv(f"./data/raw/outsample/history_stock_{stock_ticker}.csv", index=False)
+# the script is run from the root of the repository, see README.md
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+from utils.datastore import writeStore, appendStore, storedRanges, openStore, storeFolder, SPLITS, PRECISIONS
+
+# one continuous history covering the in-sample and out-of-sample periods
+DATA_START_DATE = SPLITS['insample'][0]
+DATA_END_DATE = SPLITS['outsample'][1]
+FREQUENCY = "30"   #30 for 30min, 60 for 60min, d for day, m for month, and so on
+ADJUSTFLAG = "3"   # default value for no adjustment.
+FIELDS = "date,time,code,open,high,low,close,volume,amount,adjustflag"
+NUMERIC_FIELDS = ['open', 'high', 'low', 'close', 'volume', 'amount']
+
+
+class BaostockClient:
+    """
+        Thin wrapper around the baostock api. baostock keeps a single session per process, so every
+        worker process logs in with its own client.
+    """
+    def login(self):
+        import baostock as bs
+        self.bs = bs
+        lg = bs.login()
+        if lg.error_code != '0':
+            raise ConnectionError(f'baostock login failed: {lg.error_msg}')
+
+    def queryHistory(self, code, start_date, end_date):
+        rs = self.bs.query_history_k_data_plus(code, FIELDS, start_date=start_date, end_date=end_date,
+                                               frequency=FREQUENCY, adjustflag=ADJUSTFLAG)
+        if rs.error_code != '0':
+            raise IOError(f'{code}: {rs.error_msg}')
+        data_list = []
+        while (rs.error_code == '0') & rs.next():
+            data_list.append(rs.get_row_data())
+        return pd.DataFrame(data_list, columns=rs.fields)
+
+    def logout(self):
+        self.bs.logout()
+
+
+class SyntheticClient:
+    """
+        Offline stand-in for BaostockClient serving deterministic synthetic 30 minute bars, used to
+        exercise the pipeline (concurrency, retries, resume) without network access. fail_rate is
+        the probability of a query raising, to exercise the retries.
+    """
+    def __init__(self, fail_rate = 0.0):
+        self.fail_rate = fail_rate
+
+    def login(self):
+        pass
+
+    def queryHistory(self, code, start_date, end_date):
+        from utils.benchmark import syntheticOHLCV
+        if random.random() < self.fail_rate:
+            raise IOError(f'{code}: synthetic network error')
+        bars = syntheticOHLCV(8*300, seed=int(code.split('.')[-1]), code=code, start='2022-01-03')
+        bars = bars[(bars.Date >= start_date) & (bars.Date <= end_date)]
+        bars.columns = [column.lower() for column in bars.columns]
+        return bars.astype(str).reset_index(drop=True)
+
+    def logout(self):
+        pass
+
+
+CLIENTS = {
+    "baostock": BaostockClient,
+    "synthetic": SyntheticClient
+}
+
+# client of the worker process, set by _initWorker
+_client = None
+
+
+def _initWorker(client_factory):
+    global _client
+    _client = client_factory()
+    _client.login()
+
+
+def queryWithRetry(client, code, start_date, end_date, retries = 5, backoff = 1.0):
+    """
+        client.queryHistory with exponential backoff (backoff, 2*backoff, 4*backoff... seconds plus
+        jitter) between failed attempts. The last error is raised once all retries are used.
+    """
+    for attempt in range(retries + 1):
+        try:
+            return client.queryHistory(code, start_date, end_date)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff*2**attempt*(1 + random.random()))
+
+
+def toStockFrame(result):
+    """
+        Converts a baostock result (string columns) into the layout of the history_stock_*.csv files.
+    """
+    result = result.copy()
+    result[NUMERIC_FIELDS] = result[NUMERIC_FIELDS].apply(pd.to_numeric, errors='coerce')
+    result.rename(columns = str.capitalize, inplace=True)
+    return result
+
+
+def fetchTicker(code, start_date, end_date, retries = 5, backoff = 1.0):
+    """
+        Downloads the bars of one ticker from start_date to end_date with the client of the worker process.
+
+        Returns:
+        - (code, stock_df)
+    """
+    return code, toStockFrame(queryWithRetry(_client, code, start_date, end_date, retries, backoff))
+
+
+def _downloadsPath(data_folder):
+    return os.path.join(storeFolder(data_folder), 'downloads.json')
+
+
+def _day(timestamp):
+    return pd.Timestamp(timestamp).strftime('%Y-%m-%d')
+
+
+def loadDownloads(data_folder):
+    """
+        ticker -> [start date, end date] of the period downloaded so far for that ticker into the
+        store of data_folder. The downloads.json written before the start dates were recorded only
+        has the end dates, the day of the first stored bar is taken as the start.
+    """
+    if openStore(data_folder) is None or not os.path.exists(_downloadsPath(data_folder)):
+        return {}
+    with open(_downloadsPath(data_folder)) as f:
+        downloads = json.load(f)
+    stored = storedRanges(data_folder)
+    return {ticker: [_day(stored[ticker][0]) if ticker in stored else period, period] if isinstance(period, str) else period
+            for ticker, period in downloads.items()}
+
+
+def saveDownloads(data_folder, downloads):
+    with open(_downloadsPath(data_folder) + '.tmp', 'w') as f:
+        json.dump(downloads, f, indent=4, sort_keys=True)
+    os.replace(_downloadsPath(data_folder) + '.tmp', _downloadsPath(data_folder))
+
+
+def incrementalQueries(tickers, start_date, end_date, downloads, stored):
+    """
+    The queries of an incremental download (see downloadStocks): code -> (start date, end date) of
+    the bars to download for every code whose downloaded period does not cover start_date to end_date.
+
+    - a ticker never downloaded is downloaded from start_date to end_date.
+    - a start_date before the downloaded period (an earlier --start_date) downloads the missing head,
+      up to the first downloaded day, or up to end_date when the tail is missing as well.
+    - an end_date after the downloaded period downloads the tail, from the day of the last stored
+      bar (downloaded again in case it was incomplete).
+
+    Parameters:
+    - tickers (dict): code -> ticker of the store.
+    - downloads (dict): ticker -> [start date, end date] downloaded so far, see loadDownloads.
+    - stored (dict): ticker -> (first, last) timestamps of its bars in the store, see storedRanges.
+    """
+    queries = {}
+    for code, ticker in tickers.items():
+        if ticker not in downloads:
+            queries[code] = (start_date, end_date)
+            continue
+        downloaded_start, downloaded_end = downloads[ticker]
+        head, tail = start_date < downloaded_start, downloaded_end < end_date
+        if head:
+            queries[code] = (start_date, end_date if tail else downloaded_start)
+        elif tail:
+            queries[code] = (max(start_date, _day(stored[ticker][1])) if ticker in stored else start_date, end_date)
+    return queries
+
+
+def downloadStocks(codes, data_folder, start_date, end_date, client_factory = BaostockClient, workers = 4, retries = 5,
+                   backoff = 1.0, flush_every = 50, incremental = True, precision = None):
+    """
+    Downloads the bars of every code from start_date to end_date into the store of data_folder, one
+    continuous history per ticker. The in-sample and out-of-sample periods are selected when the data
+    is read (see SPLITS and dateRange in utils/datastore.py), not downloaded separately.
+
+    Tickers are queried concurrently by a pool of worker processes, every worker holding its own
+    logged in client. Failed queries are retried with exponential backoff. The downloaded frames are
+    written into the store in batches of flush_every tickers and the downloads.json of the store
+    records the period every ticker was downloaded for.
+
+    In incremental mode only the missing bars are downloaded (see incrementalQueries): tickers
+    already downloaded from start_date up to end_date are skipped, an earlier start_date downloads
+    the missing head of the history and a later end_date its missing tail, the new bars being
+    appended to the store and deduplicated on their date/time. Without incremental every ticker is
+    downloaded from start_date and replaces its stored history.
+
+    Parameters:
+    - codes (list): baostock codes, e.g. sh.600006
+    - data_folder (str): folder of the store, e.g. ./data/raw/history
+    - start_date, end_date (str): first and last day of the history, e.g. '2022-04-01', '2022-07-31'
+    - client_factory (callable): builds the client of every worker (BaostockClient, SyntheticClient...), must be picklable.
+    - workers (int): number of worker processes.
+    - retries (int), backoff (float): see queryWithRetry.
+    - flush_every (int): number of downloaded tickers between two writes of the store.
+    - incremental (bool): download only what is missing and append it.
+    - precision (str): precision of the prices of the store, see PRECISIONS in utils/datastore.py.
+      None keeps the precision of the existing store.
+
+    Returns:
+    - failed (dict): code -> error message of the tickers that could not be downloaded.
+    """
+    downloads = loadDownloads(data_folder)
+    tickers = {code: '-'.join(code.split('.')) for code in codes}
+    queries = {code: (start_date, end_date) for code in codes}
+    if incremental:
+        queries = incrementalQueries(tickers, start_date, end_date, downloads, storedRanges(data_folder))
+        print(f"{len(codes) - len(queries)} tickers already up to date, downloading {len(queries)} tickers")
+
+    pending = {}
+    def flush():
+        if not pending: return
+        (appendStore if incremental else writeStore)(data_folder, pending, precision)
+        for ticker in pending:
+            # the downloaded period grows with an incremental download, a full download replaces it
+            downloaded_start, downloaded_end = downloads[ticker] if incremental and ticker in downloads else (start_date, end_date)
+            downloads[ticker] = [min(start_date, downloaded_start), max(end_date, downloaded_end)]
+        saveDownloads(data_folder, downloads)
+        pending.clear()
+
+    failed = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(client_factory,)) as executor:
+        futures = {executor.submit(fetchTicker, code, query_start, query_end, retries, backoff): code
+                   for code, (query_start, query_end) in queries.items()}
+        for future in tqdm(as_completed(futures), total=len(futures)):
+            try:
+                code, stock_df = future.result()
+            except Exception as e:
+                failed[futures[future]] = str(e)
+                continue
+            pending[tickers[code]] = stock_df
+            if len(pending) >= flush_every:
+                flush()
+        flush()
+    return failed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='Stock Data Download',
+                    description='downloads the 30 minute bars of the CSI 500 constituents into the store of ./data/raw/history')
+    parser.add_argument('--index_composition', default='./data/raw/csi500_index_composition.csv')
+    parser.add_argument('--data_folder', default='./data/raw/history')
+    parser.add_argument('--start_date', default=DATA_START_DATE, help="move it earlier to extend the history back, only the missing bars are downloaded")
+    parser.add_argument('--end_date', default=DATA_END_DATE, help="extend it to update the history, only the new bars are downloaded")
+    parser.add_argument('--client', default='baostock', choices=list(CLIENTS.keys()), help="\
+                        synthetic serves random bars without network access, to try the pipeline offline")
+    parser.add_argument('--workers', default=4, type=int)
+    parser.add_argument('--retries', default=5, type=int)
+    parser.add_argument('--flush_every', default=50, type=int, help="tickers downloaded between two writes of the store")
+    parser.add_argument('--full', action='store_true', help="download the whole history of every ticker again instead of the missing bars only")
+    parser.add_argument('--precision', default=None, choices=list(PRECISIONS.keys()), help="\
+                        float32 stores float32 prices and integer volumes. By default the precision of the existing store, float64 for a new one")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_folder, exist_ok=True)
+    indexStocksDf = pd.read_csv(args.index_composition, index_col=None, encoding='gbk')
+    print(indexStocksDf.head())
+
+    failed = downloadStocks(list(indexStocksDf.code), args.data_folder, args.start_date, args.end_date, CLIENTS[args.client],
+                            args.workers, args.retries, flush_every=args.flush_every, incremental=not args.full,
+                            precision=args.precision)
+    if failed:
+        print(f"{len(failed)} tickers could not be downloaded, rerun the script to retry them:")
+        for code, error in failed.items():
+            print(f"{code}: {error}")
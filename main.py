@@ -1,32 +1,24 @@
-import pandas as pd 
-import matplotlib.pyplot as plt 
-
 import os 
-from glob import glob 
-from tqdm import tqdm
 import random
+import argparse 
+import traceback
 import warnings
+from itertools import repeat
+from dataclasses import asdict
+from concurrent.futures import ProcessPoolExecutor
 warnings.filterwarnings("ignore")
 
-import pandas as pd 
-import matplotlib.pyplot as plt
-
-from utils.indicators import movingAverageConverganceDivergance as macd 
-from utils.indicators import relativeStrengthIndex as rsi 
-from utils.indicators import averageTrueRange as atr 
-from utils.indicators import bollingerBands as bbands 
-from utils.indicators import stochasticIndicator as sti
-
-from utils.strategies import BollingerBandsStrategy 
-from utils.strategies import MACDStrategy 
-from utils.strategies import BuyAndHoldStrategy 
-from utils.strategies import SimpleMovingAverageStrategy
-
-from backtesting import Backtest, Strategy 
-from backtesting.lib import crossover, barssince, SignalStrategy, TrailingStrategy
+# only light modules are imported here so that --help, and every worker process, starts fast. backtesting
+# (which loads bokeh), the strategies and the engines are imported by the functions that use them
+from utils.datastore import tickerFromPath, listStockNames, dateRange, SPLITS, PRECISIONS
+from utils.cache import configureCache, cacheInfo
+from utils.params import ParamsTable, BollingerBandsParams, MACDParams, STRATEGY_PARAMS
+from utils.profiling import TickerProfile, stage, profiledStrategy, runProfiled, profileReport, dumpCProfile
+from utils.plots import plotPaths, savePlotInputs
+from utils.sharedpanel import SharedPanel, attachPanel, sharedStockData, sharedStockTimestamps
+from utils.results import RESULT_STATS
 
 
-import argparse 
 parser = argparse.ArgumentParser(
                     prog='Strategy Tester',
                     description='applies the strategy on test data available in data/outsample folder',
@@ -36,96 +28,83 @@ parser.add_argument('--strategy', default='bb', choices=['bb','macd','sma','bnh'
                         macd: MovingAverage Convergance Divergance; \
                             sma: Simple Moving Average;\
                                 bnh: Buy And Hold", dest="strategy")
-parser.add_argument('--data_folder', default="./data/raw/outsample") 
+parser.add_argument('--data_folder', default="./data/raw/history") 
+parser.add_argument('--split', default='outsample', choices=list(SPLITS.keys()) + ['all'], help="\
+                    period of the data the strategy is tested on, all for every bar of data_folder")
+parser.add_argument('--start_date', default=None, help="overrides the first day of the split, e.g. 2022-07-01")
+parser.add_argument('--end_date', default=None, help="overrides the last day of the split, e.g. 2022-07-31")
 parser.add_argument('--opt_params', default='./data/opt_params.csv')
 parser.add_argument('--num_stocks', default = 500, type=int)
 parser.add_argument('--random_seed', default=None, type = int, help="\
                     set to any integer otherwise None by Default")
 parser.add_argument('--ticker', default = None)
-parser.add_argument('--plots', default=False, type = bool)
-
-args = vars(parser.parse_args())
-strategy = None 
-if(args['strategy'] == 'bb'): 
-    strategy = BollingerBandsStrategy 
-elif(args['strategy'] == 'macd'): 
-    strategy = MACDStrategy 
-elif args['strategy'] == 'sma': 
-    strategy = SimpleMovingAverageStrategy 
-elif args['strategy'] == 'bnh': 
-    strategy = BuyAndHoldStrategy
-
-opt_param_file = args['opt_params'] 
-num_stocks = args['num_stocks'] 
-data_folder = args['data_folder']
-random_seed = args['random_seed']
-stock_name = args['ticker']
-trade_plots = args['plots']
+parser.add_argument('--plots', default=False, type = lambda value: value.lower() in ['true', '1', 'yes'], help="\
+                    True saves the equity and trades of every ticker and renders its plot in ./results/plots/<strategy> once the backtests are done")
+parser.add_argument('--plot_max_bars', default=None, type=int, help="\
+                    longer histories are merged into this many bars in the plots, None plots every bar")
+parser.add_argument('--workers', default=1, type=int, help="\
+                    number of processes used to backtest tickers in parallel. 1 runs serially")
+parser.add_argument('--engine', default='backtesting', choices=['backtesting','vectorized'], help="\
+                    backtesting: one backtesting.Backtest per ticker; \
+                        vectorized: numpy engine stepping all tickers at once (bb and macd only)")
+parser.add_argument('--shared_panel', action='store_true', help="\
+                    with --workers > 1, loads the bars of every ticker once into shared memory, the workers reading them as views instead of loading their own copy (see utils/sharedpanel.py)")
+parser.add_argument('--rerun', action='store_true', help="\
+                    recompute every ticker, by default the tickers whose strategy, parameters and data did not change since the last run are reused from ./results/runs")
+parser.add_argument('--precision', default='float64', choices=list(PRECISIONS.keys()), help="\
+                    float32 loads the prices as float32 (and the volume as integers), halving the memory of the bars. Results stay within a rounding tolerance of float64, see python -m utils.datastore --check")
+parser.add_argument('--indicator_cache', default=None, help="\
+                    folder where indicator results are cached across runs (e.g. ./results/indicator_cache). None keeps them in memory only")
+parser.add_argument('--profile', action='store_true', help="\
+                    records the time of every stage (load, Strategy.init, the per bar loop, stats, saving the plot inputs) and counts the bars, indicators and orders of every ticker, saved in ./results/profile_<strategy>.csv. Every ticker is rerun")
+parser.add_argument('--profile_top', default=10, type=int, help="\
+                    slowest tickers listed with --profile")
+parser.add_argument('--profile_dump', default=None, help="\
+                    with --profile, also runs every ticker under cProfile and merges the stats into this file (e.g. ./results/profile.prof), readable with pstats, snakeviz or flameprof")
 
 
-def runBuyAndHoldStrategy(stock_df): 
+def runBuyAndHoldStrategy(stock_df, profile = None): 
     """
         This function is utilized to simulate the buy and hold strategy. 
     """
+    from backtesting import Backtest
+    from utils.strategies import BuyAndHoldStrategy
+
     bt = Backtest(stock_df, BuyAndHoldStrategy, cash=10_000) 
-    stats = bt.run()
+    with stage(profile, 'buy_and_hold'):
+        stats = bt.run()
     profit_buy_and_hold = stats['Equity Final [$]'] - 10000 
     return stats , profit_buy_and_hold
 
 
-def runBollingerBandsStrategy(stock_name, stock_df, opt_params = None, plot_path = None): 
+def runBollingerBandsStrategy(stock_name, stock_df, opt_params = None, profile = None): 
     """
     This Function is used to Simulate the Bollinger Bands Strategy
     """
-    if opt_params is None: 
-        bt = Backtest(stock_df, BollingerBandsStrategy, cash = 10_000) 
-        stats = bt.run() 
-        if trade_plots: 
-             bt.plot(open_browser=False, filename = plot_path)
-        profit_strategy = stats['Equity Final [$]'] - 10000 
-        return stats, profit_strategy
-    
-    else: 
-        bt = Backtest(stock_df, BollingerBandsStrategy, cash = 10_000) 
-        name = stock_name.split('\\')[-1].split('.')[0].split('_')[-1]
-        params = opt_params.loc[opt_params_df.ticker == name]
-        stats = bt.run(bb_window = params['bb_window'].values[0] ,
-            rsi_window = params['rsi_window'].values[0],
-            rsi_smooth_window = params['rsi_smooth_window'].values[0],
-            rsi_upper_thres = params['rsi_upper_thres'].values[0] ,
-            rsi_lower_thres = params['rsi_lower_thres'].values[0] )
-        
-        if trade_plots: 
-             bt.plot(open_browser=False, filename = plot_path)
-        profit_strategy = stats['Equity Final [$]'] - 10000
-        return stats, profit_strategy
+    from backtesting import Backtest
+    from utils.strategies import BollingerBandsStrategy
+
+    # tickers missing from opt_params get the default parameters of the strategy
+    params = opt_params.get(tickerFromPath(stock_name), 'bb') if opt_params is not None else BollingerBandsParams()
+    bt = Backtest(stock_df, profiledStrategy(BollingerBandsStrategy, profile), cash = 10_000) 
+    stats = runProfiled(bt, profile, **asdict(params)) 
+    profit_strategy = stats['Equity Final [$]'] - 10000 
+    return stats, profit_strategy
     
 
 
-def runMACDStrategy(stock_name, stock_df, opt_params = None, plot_path = None): 
+def runMACDStrategy(stock_name, stock_df, opt_params = None, profile = None): 
     """
         This function is used to simulate the MACD Strategy. 
     """
-    if opt_params is None: 
-        bt = Backtest(stock_df, MACDStrategy, cash = 10_000) 
-        stats = bt.run() 
-        if trade_plots: 
-             bt.plot(open_browser=False, filename = plot_path)
-        profit_strategy = stats['Equity Final [$]'] - 10000 
-        return stats, profit_strategy
-    
-    else: 
-        bt = Backtest(stock_df, MACDStrategy, cash = 10_000) 
-        name = stock_name.split('\\')[-1].split('.')[0].split('_')[-1]
-        params = opt_params.loc[opt_params_df.ticker == name]
-        stats = bt.run(macd_fast_ma_length = params['macd_fast_ma_length'].values[0], 
-                macd_slow_ma_length = params['macd_slow_ma_length'].values[0],
-                macd_signal_ma_length = params['macd_signal_ma_length'].values[0] )
-        
-        if trade_plots: 
-             bt.plot(open_browser=False, filename = plot_path)
-        profit_strategy = stats['Equity Final [$]'] - 10000
-        return stats, profit_strategy
+    from backtesting import Backtest
+    from utils.strategies import MACDStrategy
+
+    params = opt_params.get(tickerFromPath(stock_name), 'macd') if opt_params is not None else MACDParams()
+    bt = Backtest(stock_df, profiledStrategy(MACDStrategy, profile), cash = 10_000) 
+    stats = runProfiled(bt, profile, **asdict(params)) 
+    profit_strategy = stats['Equity Final [$]'] - 10000 
+    return stats, profit_strategy
     
 
 def runSimpleMovingAverageStrategy(stock_name, stock_df, opt_params = None): 
@@ -135,13 +114,206 @@ def runSimpleMovingAverageStrategy(stock_name, stock_df, opt_params = None):
     pass 
 
 
+def runTicker(stock_name, strategy_name, opt_params = None, trade_plots = False, date_range = None, precision = 'float64', profile = False, cprofile = False): 
+    """
+        Runs Buy and Hold and the selected strategy on a single ticker. 
+        Everything it needs is passed in explicitly so that it can be executed inside a worker process. 
+
+        Parameters:
+        - stock_name (str): path to the history_stock_*.csv file of the ticker.
+        - strategy_name (str): one of 'bb', 'macd', 'sma'.
+        - opt_params (ParamsTable): optimized parameters, None to use the default parameters.
+        - trade_plots (bool): whether to save the bars, equity and trades the plot of the ticker is rendered from, see utils/plots.py. 
+        - date_range (tuple): (start_date, end_date) of the bars to test on, None for all, see utils.datastore.dateRange. 
+        - precision (str): precision the bars are loaded in, see utils.datastore.PRECISIONS. 
+        - profile (bool): whether to time the stages of the ticker, see utils/profiling.py. 
+        - cprofile (bool): with profile, also run the ticker under cProfile. 
+
+        Returns:
+        - None if the data file is empty, otherwise a tuple (result, profit_bnh, profit_strat, trades) 
+          where result is the row of the results csv and trades is the _trades DataFrame of the strategy. 
+          With profile the TickerProfile of the ticker is appended to the tuple. 
+    """
+    if not profile: 
+        return backtestTicker(stock_name, strategy_name, opt_params, trade_plots, date_range, precision)
+    ticker_profile = TickerProfile(tickerFromPath(stock_name), cprofile)
+    with ticker_profile: 
+        outcome = backtestTicker(stock_name, strategy_name, opt_params, trade_plots, date_range, precision, ticker_profile)
+    return None if outcome is None else (*outcome, ticker_profile)
+
+
+def resultRow(name, stats, plot_path = None): 
+    """
+        Row of the results csv of a ticker from its stats (the Series of Backtest.run or of 
+        utils.vectorized.computeStats), the same for both engines, see RESULT_STATS in utils/results.py. 
+    """
+    return {"ticker": name, **{column: stats[stat] for column, stat in RESULT_STATS.items()}, "plot_path": plot_path}
+
+
+def backtestTicker(stock_name, strategy_name, opt_params = None, trade_plots = False, date_range = None, precision = 'float64', profile = None): 
+    """
+        Body of runTicker, profile being the TickerProfile the stages are recorded in (None when not profiling). 
+    """
+    with stage(profile, 'load'):
+        stock_df = sharedStockData(stock_name, date_range, precision)
+    if(stock_df.shape[0]==0): return None
+    if profile is not None: profile.count('bars_loaded', stock_df.shape[0])
+
+    # note down the profit from buy and hold strategy
+    stats_bnh, profit_bnh = runBuyAndHoldStrategy(stock_df, profile)
+
+    # simulating other input strategy
+    name = tickerFromPath(stock_name)
+    if strategy_name == 'bb': 
+        stats_strat, profit_strat = runBollingerBandsStrategy(stock_name, stock_df, opt_params, profile)
+    elif strategy_name == 'macd': 
+        stats_strat, profit_strat = runMACDStrategy(stock_name, stock_df, opt_params, profile)
+    elif strategy_name == 'sma': 
+        stats_strat, profit_strat = runSimpleMovingAverageStrategy(stock_name, stock_df, opt_params)
+
+    # the plot itself is rendered after the backtests, by utils.plots.renderPlots
+    plot_path = None
+    if trade_plots: 
+        inputs_path, plot_path = plotPaths(strategy_name, name)
+        with stage(profile, 'plot'):
+            savePlotInputs(inputs_path, stock_df, sharedStockTimestamps(stock_name, date_range), 
+                           stats_strat._equity_curve['Equity'].values, stats_strat._trades)
+
+    # the stats Series holds the strategy instance, so only plain values are sent back to the parent process
+    result = resultRow(name, stats_strat, plot_path)
+    return result, profit_bnh, profit_strat, stats_strat._trades
+
+
+class TickerError: 
+    """
+        Outcome of a ticker whose run raised, the run continues with the other tickers. 
+    """
+    def __init__(self, stock_name, error): 
+        self.stock_name = stock_name
+        self.error = error
+
+
+def runTickerSafely(stock_name, *args): 
+    try: 
+        return runTicker(stock_name, *args)
+    except Exception: 
+        return TickerError(stock_name, traceback.format_exc())
+
+
+def initWorker(cache_bytes, indicator_cache = None, panel_spec = None): 
+    """
+        Initializer of the worker processes of runTickers: configures the indicator cache and attaches the shared panel. 
+    """
+    configureCache(cache_bytes, indicator_cache)
+    attachPanel(panel_spec)
+
+
+def runTickers(stock_names, strategy_name, opt_params = None, trade_plots = False, workers = 1, indicator_cache = None, date_range = None, precision = 'float64', profile = False, cprofile = False, shared_panel = False): 
+    """
+        Generator over the outcome of runTicker for every file in stock_names, a TickerError for the tickers that raised. 
+        With workers > 1 the tickers are spread over a process pool, the outcomes are still yielded 
+        in the order of stock_names so the merged results are identical to the serial run. 
+        indicator_cache is the disk folder of the indicator cache (utils/cache.py) shared by all workers. 
+        profile and cprofile are passed to runTicker, the profiles of the workers come back with their outcomes. 
+        With shared_panel the bars are loaded once into a SharedPanel the workers attach to (utils/sharedpanel.py). 
+    """
+    if workers <= 1: 
+        if indicator_cache is not None: configureCache(disk_folder=indicator_cache)
+        for stock_name in stock_names: 
+            yield runTickerSafely(stock_name, strategy_name, opt_params, trade_plots, date_range, precision, profile, cprofile)
+        return
+
+    chunksize = max(1, len(stock_names)//(workers*4))
+    panel = SharedPanel.create(stock_names, date_range, precision) if shared_panel else None
+    try: 
+        with ProcessPoolExecutor(max_workers=workers, initializer=initWorker, 
+                                 initargs=(256*2**20, indicator_cache, panel.spec if panel is not None else None)) as executor: 
+            yield from executor.map(runTickerSafely, stock_names, 
+                                    repeat(strategy_name), repeat(opt_params), repeat(trade_plots), repeat(date_range), repeat(precision), 
+                                    repeat(profile), repeat(cprofile), chunksize=chunksize)
+    finally: 
+        if panel is not None: panel.close()
+
+
+
+def runTickersVectorized(stock_names, strategy_name, opt_params = None, date_range = None, precision = 'float64', trade_plots = False): 
+    """
+        Same outcomes as runTickers, computed with the vectorized engine in utils/vectorized.py 
+        which evaluates all tickers at once instead of running a Backtest per ticker. 
+    """
+    from utils.vectorized import loadPanel, runVectorizedBacktest, buyAndHold, computeStats
+
+    panel, lengths = loadPanel({tickerFromPath(stock_name): stock_name for stock_name in stock_names}, date_range, precision)
+    equity, trades, _ = runVectorizedBacktest(panel, lengths, strategy_name, opt_params)
+    final_bnh = buyAndHold(panel, lengths)
+    trades_by_ticker = dict(list(trades.groupby('Ticker', sort=False)))
+    columns = {ticker: j for j, ticker in enumerate(panel['Close'].columns)}
+
+    for stock_name in stock_names: 
+        name = tickerFromPath(stock_name)
+        if name not in columns: 
+            yield None
+            continue
+        j, n = columns[name], lengths[columns[name]]
+        ticker_trades = trades_by_ticker.get(name, trades.iloc[:0]).drop(columns=['Ticker'])
+        stats_strat = computeStats(equity[:n, j], ticker_trades, panel['Close'][name].values[:n])
+
+        plot_path = None
+        if trade_plots: 
+            inputs_path, plot_path = plotPaths(strategy_name, name)
+            savePlotInputs(inputs_path, {column: panel[column][name].values[:n] for column in ['Open', 'High', 'Low', 'Close']}, 
+                           sharedStockTimestamps(stock_name, date_range), equity[:n, j], ticker_trades)
+        result = resultRow(name, stats_strat, plot_path)
+        yield result, final_bnh[j] - 10000, stats_strat['Equity Final [$]'] - 10000, ticker_trades
+
+
+
+def checkpointedOutcomes(stock_names, pending, outcomes, manifest, keys): 
+    """
+        Outcomes of every ticker of stock_names in order: the tickers not in pending are loaded from the 
+        manifest, the others are taken from outcomes (the run of pending) and checkpointed in the manifest. 
+    """
+    pending = set(pending)
+    outcomes = iter(outcomes)
+    for stock_name in stock_names: 
+        ticker = tickerFromPath(stock_name)
+        if stock_name not in pending: 
+            yield manifest.load(ticker)
+            continue
+        outcome = next(outcomes)
+        if not isinstance(outcome, TickerError): 
+            # a profile belongs to this run only, it is not checkpointed
+            manifest.save(ticker, keys[stock_name], outcome if outcome is None else outcome[:4])
+        yield outcome
+
 
 if __name__ == '__main__': 
-    opt_params_df = None
+    args = vars(parser.parse_args())
+    from tqdm import tqdm
+    from utils.results import ResultsWriter
+    from utils.manifest import RunManifest, tickerKeys
+
+    opt_param_file = args['opt_params'] 
+    num_stocks = args['num_stocks'] 
+    data_folder = args['data_folder']
+    random_seed = args['random_seed']
+    stock_name = args['ticker']
+    trade_plots = args['plots']
+    workers = args['workers']
+    engine = args['engine']
+    date_range = dateRange(None if args['split'] == 'all' else args['split'], args['start_date'], args['end_date'])
+    if engine == 'vectorized' and args['strategy'] not in ['bb', 'macd']: 
+        parser.error("the vectorized engine only supports the bb and macd strategies")
+    profile = args['profile'] and engine == 'backtesting'
+    if args['profile'] and not profile: 
+        print("Profiling is only available with the backtesting engine, continueing without profiling")
+
+    opt_params = None
     if not os.path.exists(opt_param_file): 
         print("Optimized Parameters not found, Continueing with Default Parameter Values")
     else:
-        opt_params_df = pd.read_csv(opt_param_file) 
+        # loaded and validated once, every ticker is then a dict lookup
+        opt_params = ParamsTable.read(opt_param_file, [args['strategy']] if args['strategy'] in STRATEGY_PARAMS else [])
         print("Using Optimized Params...")
 
     if not os.path.exists(data_folder): 
@@ -152,87 +324,79 @@ if __name__ == '__main__':
     if stock_name is not None: 
         stock_names.append(f'{data_folder}/history_stock_{stock_name}.csv') 
     else: 
-        stock_names = glob(f'{data_folder}/*') 
+        stock_names = listStockNames(data_folder) 
         if random_seed: 
             random.seed(random_seed) 
-        stock_names = random.sample(stock_names,k = num_stocks) 
+        stock_names = random.sample(stock_names,k = num_stocks)
+    if opt_params is not None and args['strategy'] in STRATEGY_PARAMS:
+        missing = opt_params.missing([tickerFromPath(name) for name in stock_names])
+        if missing:
+            print(f"{len(missing)} tickers have no optimized parameters, using the default parameters for them")
+
 
-    
     if not os.path.exists("./results"): 
         os.makedirs("./results", exist_ok=True)
-    if not os.path.exists("./results/plots"): 
-        os.makedirs("./results/plots", exist_ok= True)
-
-
-    results = {
-        "ticker": [],
-        "return": [], 
-        "buy and hold return": [], 
-        "Max. Drawdown [%]": [],
-        "Avg. Drawdown [%]": [],       
-        "Max. Drawdown Duration": [],  
-        "Avg. Drawdown Duration" : [], 
-        "Num Trades": [],                
-        "Win Rate [%]": [],            
-        "Best Trade [%]": [],          
-        "Worst Trade [%]": [],         
-        "Avg. Trade [%]": [],          
-        "Max. Trade Duration": [],     
-        "Avg. Trade Duration": [],
-        "plot_path": []
-    }
-    
+
+
+    # tickers whose inputs did not change since the last run are reused from the checkpoints
+    manifest = RunManifest(f"./results/runs/{args['strategy']}")
+    keys = tickerKeys(stock_names, args['strategy'], engine, opt_params, date_range, trade_plots, args['precision'])
+    # a profile times the run of every ticker, none is reused
+    pending = [name for name in stock_names if args['rerun'] or profile or not manifest.has(tickerFromPath(name), keys[name])]
+    print(f"{len(stock_names) - len(pending)} tickers unchanged since the last run, running {len(pending)} tickers")
+
     profit_buy_and_hold = 0
     profit_strategy = 0
-    all_trades = None 
-    for stock_name in tqdm(stock_names): 
-        stock_df = pd.read_csv(stock_name, index_col=False)
-        if(stock_df.shape[0]==0): continue
-        
-        # note down the profit from buy and hold strategy
-        stats_bnh, profit_bnh = runBuyAndHoldStrategy(stock_df)
-        profit_buy_and_hold += profit_bnh
-
-        # simulating other input strategy
-        name = stock_name.split('\\')[-1].split('.')[0].split('_')[-1]
-        plot_path = f"./results/plots/{name}.html" 
-        if args['strategy'] == 'bb': 
-            stats_strat, profit_strat = runBollingerBandsStrategy(stock_name, stock_df, opt_params_df, plot_path)
-        elif args['strategy'] == 'macd': 
-            stats_strat, profit_strat = runMACDStrategy(stock_name, stock_df, opt_params_df, plot_path)
-        elif args['strategy'] == 'sma': 
-            stats_strat, profit_strat = runSimpleMovingAverageStrategy(stock_name, stock_df, opt_params_df, plot_path)
-        profit_strategy += profit_strat 
-
-        # saving results in a dictionary
-        plot_path = f"./results/plots/{stock_name}.html" 
-        results['ticker'].append(name)
-        results['return'].append(stats_strat['Return [%]']) 
-        results['buy and hold return'].append(stats_strat['Buy & Hold Return [%]'])
-        results['plot_path'].append(plot_path) 
-        results['Avg. Drawdown [%]'].append(stats_strat['Avg. Drawdown [%]'])
-        results['Avg. Drawdown Duration'].append(stats_strat['Avg. Drawdown Duration']) 
-        results['Avg. Trade [%]'].append(stats_strat['Avg. Trade [%]'])
-        results['Avg. Trade Duration'].append(stats_strat['Avg. Trade Duration'])
-        results['Best Trade [%]'].append(stats_strat['Best Trade [%]'])
-        results['Max. Drawdown [%]'].append(stats_strat['Max. Drawdown [%]'])
-        results['Max. Drawdown Duration'].append(stats_strat['Max. Drawdown Duration'])
-        results['Max. Trade Duration'].append(stats_strat['Max. Trade Duration'])
-        results['Num Trades'].append(stats_strat['# Trades'])
-        results['Win Rate [%]'].append(stats_strat['Win Rate [%]'])
-        results['Worst Trade [%]'].append(stats_strat['Worst Trade [%]'])
-
-
-        if all_trades is not None: 
-            all_trades = pd.concat([all_trades, stats_strat._trades]) 
-        else: 
-            all_trades = stats_strat._trades
+    failed = []
+    profiles = []
+    plotted = []
+    if engine == 'vectorized': 
+        outcomes = runTickersVectorized(pending, args['strategy'], opt_params, date_range, args['precision'], trade_plots)
+    else: 
+        outcomes = runTickers(pending, args['strategy'], opt_params, trade_plots, workers, args['indicator_cache'], date_range, args['precision'], 
+                              profile, args['profile_dump'] is not None, args['shared_panel'])
+    outcomes = checkpointedOutcomes(stock_names, pending, outcomes, manifest, keys)
+
+    # every ticker is written out as soon as it is done, see utils/results.py
+    results_path = f"./results/results_{args['strategy']}.csv"
+    trades_path = f"./results/trades_{args['strategy']}.csv"
+    with ResultsWriter(results_path, trades_path) as writer: 
+        for outcome in tqdm(outcomes, total=len(stock_names)): 
+            if outcome is None: continue
+            if isinstance(outcome, TickerError): 
+                print(f"\n{outcome.stock_name} failed:\n{outcome.error}")
+                failed.append(outcome.stock_name)
+                continue
+            result, profit_bnh, profit_strat, trades = outcome[:4]
+            ticker_profile = outcome[4] if profile else None
+
+            profit_buy_and_hold += profit_bnh
+            profit_strategy += profit_strat 
+            with stage(ticker_profile, 'results'):
+                writer.write(result, trades)
+            if ticker_profile is not None: profiles.append(ticker_profile)
+            if result['plot_path'] is not None: plotted.append(result['ticker'])
 
 
     print(f"\n\nProfit from Simple Buy and Hold Strategy: {profit_buy_and_hold}. ") 
     print(f"Profit from {args['strategy']} strategy: {profit_strategy}")
+    if engine == 'backtesting' and workers <= 1: 
+        print(f"Indicator cache: {cacheInfo()}")
 
-    # converting dictionary to dataframe to save as a csv. 
-    pd.DataFrame(results).to_csv(f"./results/results_{args['strategy']}.csv", index = False)
-    print("Results saved in Results Folder. ")
-
+    print(f"Results saved in {results_path}, trades in {trades_path}")
+    if plotted: 
+        # rendered once every backtest is done, the plots whose inputs did not change are kept
+        from utils.plots import renderPlots
+        rendered, unchanged = renderPlots(args['strategy'], plotted, workers, args['plot_max_bars'])
+        print(f"{len(rendered)} plots rendered, {len(unchanged)} unchanged, in ./results/plots/{args['strategy']}")
+    if profile: 
+        profile_rows, profile_stages, slowest = profileReport(profiles, args['profile_top'])
+        profile_path = f"./results/profile_{args['strategy']}.csv"
+        profile_rows.to_csv(profile_path, index=False)
+        print(f"\nTime per stage over {len(profiles)} tickers:\n{profile_stages.to_string(index=False)}")
+        print(f"\n{args['profile_top']} slowest tickers:\n{slowest.to_string(index=False)}")
+        print(f"Profile saved in {profile_path}")
+        if args['profile_dump'] is not None and dumpCProfile(profiles, args['profile_dump']): 
+            print(f"cProfile stats saved in {args['profile_dump']}, e.g. snakeviz {args['profile_dump']}")
+    if failed: 
+        print(f"{len(failed)} tickers failed, rerun to retry them (the other tickers are reused): {failed}")
@@ -0,0 +1,43 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+
+# times of the eight 30 minute bars of a trading day, as in the baostock downloads
+BAR_TIMES = ['100000', '103000', '110000', '113000', '133000', '140000', '143000', '150000']
+
+
+def syntheticBars(n_bars = 1200, seed = 0, start_price = 10.0, volatility = 0.01, drift = 0.0):
+    """
+    OHLCV DataFrame of a random walk rounded to the cent like the A-share prices of the downloads,
+    with the baostock Date and Time columns of 30 minute bars on business days.
+    """
+    rng = np.random.default_rng(seed)
+    close = start_price*np.exp(np.cumsum(rng.normal(drift, volatility, n_bars)))
+    open_ = np.r_[start_price, close[:-1]]*np.exp(rng.normal(0, volatility/4, n_bars))
+    high = np.maximum(open_, close)*(1 + np.abs(rng.normal(0, volatility/2, n_bars)))
+    low = np.minimum(open_, close)*(1 - np.abs(rng.normal(0, volatility/2, n_bars)))
+    days = pd.bdate_range('2022-01-03', periods=-(-n_bars//len(BAR_TIMES)))
+    stamps = [(day, time) for day in days.strftime('%Y%m%d') for time in BAR_TIMES][:n_bars]
+    return pd.DataFrame({
+        "Date": [f"{day[:4]}-{day[4:6]}-{day[6:]}" for day, _ in stamps],
+        "Time": [int(f"{day}{time}000") for day, time in stamps],
+        "Open": open_.round(2),
+        "High": high.round(2),
+        "Low": low.round(2),
+        "Close": close.round(2),
+        "Volume": rng.integers(10_000, 1_000_000, n_bars).astype(float)
+    })
+
+
+@pytest.fixture
+def bars():
+    """
+        OHLCV columns of syntheticBars, the frame a Backtest runs on.
+    """
+    return syntheticBars()[['Open', 'High', 'Low', 'Close', 'Volume']]
+
+
+@pytest.fixture
+def make_bars():
+    return syntheticBars
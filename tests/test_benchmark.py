@@ -0,0 +1,13 @@
+import pytest
+
+import main
+from utils.benchmark import benchmarkEndToEnd
+
+
+def test_end_to_end_fails_on_ticker_errors(monkeypatch):
+    assert len(benchmarkEndToEnd(2, 300, strategies=('bb',))) == 2
+    def fail(*args):
+        raise ValueError("broken ticker")
+    monkeypatch.setattr(main, 'runTicker', fail)
+    with pytest.raises(RuntimeError, match="2 of 2 tickers failed"):
+        benchmarkEndToEnd(2, 300, strategies=('bb',), engines=('backtesting',))
@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+
+from utils import cache
+from utils.cache import IndicatorCache, cachedIndicator
+from utils.indicators import bollingerBands
+
+
+def test_disk_tier_evicts_the_least_recently_used_entries(tmp_path):
+    store = IndicatorCache(max_bytes=0, disk_folder=str(tmp_path), disk_max_bytes=3*8*1000 + 3*1024)
+    for k in range(5):
+        store.put(f'key{k}', ['value'], np.full((1000, 1), float(k)))
+        os.utime(os.path.join(tmp_path, f'key{k}.npz'), ns=(k*10**9, k*10**9))
+        if k == 2:
+            # a hit makes key0 the most recently used entry
+            assert store.get('key0') is not None
+    kept = sorted(os.listdir(tmp_path))
+    assert store.disk_evictions == 2 and len(kept) == 3 and 'key0.npz' in kept
+    assert sum(os.path.getsize(os.path.join(tmp_path, name)) for name in kept) <= store.disk_max_bytes
+
+
+def test_indicator_code_change_misses_the_cached_results(tmp_path, bars, monkeypatch):
+    store = IndicatorCache(disk_folder=str(tmp_path))
+    bbI = cachedIndicator(bollingerBands, store)
+    bbI(bars, 30)
+    bbI(bars, 30)
+    assert store.info()['hits'] == 1 and store.info()['misses'] == 1
+    monkeypatch.setattr(cache, 'codeHash', lambda module_name: 'changed')
+    bbI(bars, 30)
+    assert store.info()['misses'] == 2 and len(os.listdir(tmp_path)) == 2
@@ -0,0 +1,94 @@
+import os
+
+import numpy as np
+import pytest
+
+from utils import datastore
+from utils.datastore import writeStore, appendStore, openStore, readStockData, readStockTimestamps, listStockNames, comparePrecision, \
+    stockDataHash, storeFolder, PRECISION_TOLERANCE, OHLCV_COLUMNS, MAX_CHUNKS, STORE_ONLY
+
+
+@pytest.fixture
+def history(tmp_path, make_bars):
+    """
+        A float64 store of five synthetic tickers without csv files.
+    """
+    data_folder = str(tmp_path/'history')
+    writeStore(data_folder, {f"sh-60000{seed}": make_bars(seed=seed) for seed in range(5)}, 'float64')
+    return data_folder
+
+
+def test_store_round_trip(history, make_bars):
+    stock_name = listStockNames(history)[2]
+    expected = make_bars(seed=2)
+    stock_df = readStockData(stock_name, openStore(history))
+    for column in OHLCV_COLUMNS:
+        np.testing.assert_array_equal(stock_df[column].values, expected[column].values)
+    assert readStockTimestamps(stock_name, openStore(history))[0] == np.datetime64('2022-01-03T10:00', 'ns').astype('int64')
+
+
+def test_float32_frames(history):
+    stock_df = readStockData(listStockNames(history)[0], openStore(history), precision='float32')
+    assert all(stock_df[column].dtype == np.float32 for column in OHLCV_COLUMNS[:4])
+    assert stock_df['Volume'].dtype.kind == 'i'
+
+
+def test_float32_within_tolerance_of_float64(history):
+    memory, indicators, backtests = comparePrecision(listStockNames(history))
+    assert memory['float32'] < memory['float64']
+    assert indicators['max_rel_diff'].max() <= PRECISION_TOLERANCE['indicators']
+    assert (backtests['trade_count_differs'] == 0).all()
+    assert backtests['max_return_diff_pp'].max() <= PRECISION_TOLERANCE['return_pp']
+
+
+def test_append_writes_the_appended_tickers_only(history, make_bars):
+    stock_names = listStockNames(history)
+    hashes = {stock_name: stockDataHash(stock_name, openStore(history)) for stock_name in stock_names}
+    bars = make_bars(seed=1, n_bars=1300)
+    appendStore(history, {"sh-600001": bars.iloc[1100:]})
+
+    store = openStore(history)
+    assert sorted(os.listdir(storeFolder(history))) == ['CURRENT', 'gen-000001']
+    assert len(store['chunks']) == 2 and store['chunks'][1]['timestamps'].shape[0] == 1300
+    assert store['tickers']['sh-600001'][:3] == (1, 0, 1300)
+    # the bars downloaded again replace the stored ones
+    expected = np.concatenate([make_bars(seed=1)[OHLCV_COLUMNS].values[:1100], bars[OHLCV_COLUMNS].values[1100:]])
+    np.testing.assert_array_equal(readStockData(stock_names[1], store)[OHLCV_COLUMNS].values, expected)
+    for stock_name in stock_names:
+        assert (stockDataHash(stock_name, store) == hashes[stock_name]) == (stock_name != stock_names[1])
+
+
+def test_interrupted_write_keeps_the_previous_store(history, make_bars, monkeypatch):
+    expected = readStockData(listStockNames(history)[0], openStore(history))
+    def fail(*args):
+        raise OSError("disk full")
+    monkeypatch.setattr(datastore, '_saveChunk', fail)
+    with pytest.raises(OSError):
+        writeStore(history, {"sh-600000": make_bars(seed=9)})
+    datastore._stores.clear()
+    np.testing.assert_array_equal(readStockData(listStockNames(history)[0], openStore(history)).values, expected.values)
+
+
+def test_rewrites_keep_the_chunks_bounded(history, make_bars):
+    for seed in range(3*MAX_CHUNKS):
+        writeStore(history, {f"sh-60000{seed % 5}": make_bars(seed=seed, n_bars=100)})
+        assert len(openStore(history)['chunks']) <= MAX_CHUNKS
+    assert len(os.listdir(storeFolder(history))) == 2
+
+
+def test_flat_layout_is_read_and_migrated(tmp_path, make_bars):
+    data_folder = str(tmp_path/'history')
+    store_folder = storeFolder(data_folder)
+    os.makedirs(store_folder)
+    frames = {f"sh-60000{seed}": make_bars(seed=seed, n_bars=200) for seed in range(2)}
+    np.save(os.path.join(store_folder, 'ohlcv.npy'), np.concatenate([bars[OHLCV_COLUMNS].to_numpy(dtype=float) for bars in frames.values()]))
+    np.savez(os.path.join(store_folder, 'index.npz'), tickers=np.array(list(frames)), offsets=np.array([0, 200]), lengths=np.array([200, 200]),
+             timestamps=np.concatenate([datastore._timestamps(bars) for bars in frames.values()]),
+             mtimes=np.full(2, STORE_ONLY), sizes=np.full(2, STORE_ONLY), precision=np.array('float64'))
+
+    stock_names = listStockNames(data_folder)
+    hashes = [stockDataHash(stock_name, openStore(data_folder)) for stock_name in stock_names]
+    np.testing.assert_array_equal(readStockData(stock_names[1], openStore(data_folder)).values, frames["sh-600001"][OHLCV_COLUMNS].values)
+    appendStore(data_folder, {"sh-600002": make_bars(seed=2, n_bars=200)})
+    assert sorted(os.listdir(store_folder)) == ['CURRENT', 'gen-000000']
+    assert [stockDataHash(stock_name, openStore(data_folder)) for stock_name in stock_names] == hashes
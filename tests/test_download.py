@@ -0,0 +1,31 @@
+import numpy as np
+
+from data.scripts.download_stocks_data import downloadStocks, incrementalQueries, loadDownloads, SyntheticClient
+from utils.datastore import openStore, readStockData, readStockTimestamps, listStockNames, storedRanges, OHLCV_COLUMNS
+
+CODES = ['sh.600006', 'sz.000001']
+
+
+def test_incremental_queries():
+    tickers = {'sh.600006': 'sh-600006', 'sh.600007': 'sh-600007', 'sz.000001': 'sz-000001'}
+    downloads = {'sh-600006': ['2022-04-01', '2022-07-31'], 'sz-000001': ['2022-04-01', '2022-06-30']}
+    stored = {ticker: (np.datetime64('2022-04-01T10:00', 'ns').astype('int64'), np.datetime64(f'{end}T15:00', 'ns').astype('int64'))
+              for ticker, (_, end) in downloads.items()}
+    assert incrementalQueries(tickers, '2022-04-01', '2022-07-31', downloads, stored) == \
+        {'sh.600007': ('2022-04-01', '2022-07-31'), 'sz.000001': ('2022-06-30', '2022-07-31')}
+    assert incrementalQueries(tickers, '2022-01-03', '2022-07-31', downloads, stored) == \
+        {'sh.600006': ('2022-01-03', '2022-04-01'), 'sh.600007': ('2022-01-03', '2022-07-31'), 'sz.000001': ('2022-01-03', '2022-07-31')}
+
+
+def test_earlier_start_date_backfills_the_history(tmp_path):
+    incremental, full = str(tmp_path/'incremental'), str(tmp_path/'full')
+    for start_date in ['2022-03-01', '2022-01-03']:
+        assert downloadStocks(CODES, incremental, start_date, '2022-06-30', SyntheticClient, workers=1) == {}
+    assert downloadStocks(CODES, full, '2022-01-03', '2022-06-30', SyntheticClient, workers=1, incremental=False) == {}
+
+    assert loadDownloads(incremental) == {'sh-600006': ['2022-01-03', '2022-06-30'], 'sz-000001': ['2022-01-03', '2022-06-30']}
+    assert storedRanges(incremental) == storedRanges(full)
+    for stock_name, full_name in zip(listStockNames(incremental), listStockNames(full)):
+        np.testing.assert_array_equal(readStockData(stock_name, openStore(incremental))[OHLCV_COLUMNS].values,
+                                      readStockData(full_name, openStore(full))[OHLCV_COLUMNS].values)
+        np.testing.assert_array_equal(readStockTimestamps(stock_name, openStore(incremental)), readStockTimestamps(full_name, openStore(full)))
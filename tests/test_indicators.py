@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from numpy.lib.stride_tricks import sliding_window_view
+
+from utils.indicators import priceColumn, bollingerBandsBatch, bollingerBands, relativeStrengthIndex, \
+    movingAverageConverganceDivergance, averageTrueRange, stochasticIndicator
+
+
+def test_batch_bands_stay_accurate_on_long_drifting_histories():
+    rng = np.random.default_rng(0)
+    n_bars = 200_000
+    close = (1000 + np.cumsum(rng.normal(0, 0.05, n_bars)) + np.linspace(0, 5000, n_bars)).round(2)
+    basis, upper, _ = bollingerBandsBatch(close, (20, 300))
+    for k, window in enumerate((20, 300)):
+        windows = sliding_window_view(close, window)
+        np.testing.assert_allclose(basis[k, window - 1:], windows.mean(axis=-1), rtol=1e-12)
+        np.testing.assert_allclose((upper[k] - basis[k])[window - 1:]/2, windows.std(axis=-1, ddof=1), rtol=1e-8)
+        assert np.isnan(basis[k, :window - 1]).all()
+
+
+def test_batch_bands_of_a_panel_with_missing_bars():
+    rng = np.random.default_rng(1)
+    close = 10*np.exp(np.cumsum(rng.normal(0, 0.01, (700, 3)), axis=0))
+    close[:100, 1] = np.nan
+    close[400, 2] = np.nan
+    basis, upper, lower = bollingerBandsBatch(close, (30,))
+    assert np.isnan(basis[0, :129, 1]).all() and np.isfinite(basis[0, 129:, 1]).all()
+    assert np.isnan(basis[0, 400:430, 2]).all() and np.isfinite(basis[0, 430:, 2]).all()
+    windows = sliding_window_view(close[:, 0], 30)
+    np.testing.assert_allclose(basis[0, 29:, 0], windows.mean(axis=-1), rtol=1e-12)
+    np.testing.assert_allclose(upper[0] - basis[0], basis[0] - lower[0], rtol=1e-12)
+
+
+def test_price_columns_are_views_in_their_own_dtype(bars):
+    prices = {column: bars[column].values.astype(np.float32) for column in ['High', 'Low', 'Close']}
+    close = priceColumn(prices, 'Close')
+    assert close.dtype == np.float32 and np.shares_memory(close.values, prices['Close'])
+    assert priceColumn({"Close": np.arange(5)}, 'Close').dtype == np.float64
+
+
+@pytest.mark.parametrize("indicator", [
+    lambda df: bollingerBands(df, 30),
+    lambda df: relativeStrengthIndex(df, 14, 3),
+    lambda df: movingAverageConverganceDivergance(df, 'EMA', 'EMA', 26, 12, 9),
+    lambda df: averageTrueRange(df, 14),
+    lambda df: stochasticIndicator(df, 14, 3)
+])
+def test_float32_prices_give_the_indicators_of_their_float64_values(bars, indicator):
+    prices = {column: bars[column].values.astype(np.float32) for column in ['High', 'Low', 'Close']}
+    compact = indicator(prices)
+    exact = indicator({column: values.astype(np.float64) for column, values in prices.items()})
+    assert (compact.dtypes == np.float64).all()
+    np.testing.assert_allclose(compact.values, exact.values, rtol=1e-6, atol=1e-9)
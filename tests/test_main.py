@@ -0,0 +1,26 @@
+import pytest
+
+from main import runTickers, TickerError
+from utils.datastore import writeStore, listStockNames
+
+
+@pytest.fixture
+def stock_names(tmp_path, make_bars):
+    """
+        Six synthetic tickers of different lengths in a float64 store.
+    """
+    data_folder = str(tmp_path/'history')
+    writeStore(data_folder, {f"sh-60000{seed}": make_bars(n_bars=400 + 50*seed, seed=seed) for seed in range(6)}, 'float64')
+    return listStockNames(data_folder)
+
+
+@pytest.mark.parametrize("shared_panel", [False, True])
+def test_parallel_run_gives_the_serial_outcomes_in_order(stock_names, shared_panel):
+    serial = list(runTickers(stock_names, 'bb'))
+    parallel = list(runTickers(stock_names, 'bb', workers=2, shared_panel=shared_panel))
+    assert not any(isinstance(outcome, TickerError) for outcome in serial + parallel)
+    assert [result['ticker'] for result, *_ in parallel] == [f"sh-60000{seed}" for seed in range(6)]
+    for (result, profit_bnh, profit, trades), (expected, expected_bnh, expected_profit, expected_trades) in zip(parallel, serial):
+        assert result == expected
+        assert (profit_bnh, profit) == (expected_bnh, expected_profit)
+        assert trades.equals(expected_trades)
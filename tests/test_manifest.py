@@ -0,0 +1,20 @@
+from utils import manifest
+from utils.manifest import runKey, RunManifest
+
+
+def test_run_key_changes_with_the_library_and_the_schema(monkeypatch):
+    key = runKey('bb', 'backtesting', None, 'data')
+    assert runKey('bb', 'backtesting', None, 'data') == key
+    monkeypatch.setattr(manifest, 'libraryVersion', lambda name = 'backtesting': '0.6.4')
+    assert runKey('bb', 'backtesting', None, 'data') != key
+    monkeypatch.undo()
+    monkeypatch.setattr(manifest, 'RESULTS_SCHEMA', manifest.RESULTS_SCHEMA + 1)
+    assert runKey('bb', 'backtesting', None, 'data') != key
+
+
+def test_manifest_reuses_the_outcomes_of_the_same_key(tmp_path):
+    key = runKey('bb', 'backtesting', None, 'data')
+    RunManifest(str(tmp_path)).save('sh-600000', key, {"Return [%]": 1.0})
+    reopened = RunManifest(str(tmp_path))
+    assert reopened.has('sh-600000', key) and reopened.load('sh-600000') == {"Return [%]": 1.0}
+    assert not reopened.has('sh-600000', runKey('bb', 'vectorized', None, 'data'))
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.metrics import compareMetrics, computeMetrics, statsMetrics, sqnByColumn, sqn, METRICS, OBJECTIVE
+
+
+@pytest.mark.parametrize("strategy_name", ['bb', 'macd'])
+@pytest.mark.parametrize("seed", [0, 3])
+def test_lean_stats_match_backtest(make_bars, strategy_name, seed):
+    stock_df = make_bars(seed=seed)[['Open', 'High', 'Low', 'Close', 'Volume']]
+    mismatches, _ = compareMetrics(stock_df, strategy_name)
+    assert mismatches == []
+
+
+def test_no_trades():
+    equity = np.full(100, 10_000.0)
+    empty = np.array([], dtype=float)
+    metrics = computeMetrics(equity, empty, empty, empty, np.linspace(10, 11, 100))
+    assert set(metrics) == set(METRICS)
+    assert metrics["# Trades"] == 0 and metrics["Return [%]"] == 0
+    assert np.isnan(metrics["Win Rate [%]"]) and np.isnan(metrics["SQN"])
+
+
+def test_stats_without_trades_frame_keep_their_values():
+    stats = pd.Series({metric: float(k) for k, metric in enumerate(METRICS)}, dtype=object)
+    assert statsMetrics(stats, np.ones(3)) == {metric: float(k) for k, metric in enumerate(METRICS)}
+    assert statsMetrics(stats, np.ones(3), objective_only=True) == {OBJECTIVE: stats[OBJECTIVE]}
+
+
+def test_sqn_by_column():
+    rng = np.random.default_rng(0)
+    pnl = [rng.normal(1, 5, n) for n in (1, 2, 10, 0)]
+    trades = pd.DataFrame({"Ticker": np.repeat(np.arange(4), [len(p) for p in pnl]), "PnL": np.concatenate(pnl)})
+    expected = [sqn(p) for p in pnl]
+    np.testing.assert_allclose(sqnByColumn(trades, 4), expected, rtol=1e-12, equal_nan=True)
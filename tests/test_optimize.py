@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from utils.optimize import GRIDS, SEARCHES, gridCombinations, gridSearch, adaptiveSearch, bestParams
+
+
+@pytest.mark.parametrize("strategy_name", ['bb', 'macd'])
+def test_adaptive_search_respects_the_budget_and_the_constraint(make_bars, strategy_name):
+    grid, constraint = GRIDS[strategy_name]
+    combos = gridCombinations(grid, constraint)
+    candidates, sqn, cost = SEARCHES['adaptive'](make_bars(n_bars=520), strategy_name, combos, 30, 1)
+    assert cost['evaluations'] == len(candidates) == len(sqn) == 30
+    assert not candidates.duplicated().any()
+    assert all(constraint(p) for p in candidates.itertuples(index=False))
+
+
+def test_adaptive_search_scores_like_the_grid(make_bars):
+    stock_df = make_bars(n_bars=520, seed=3)
+    combos = gridCombinations(*GRIDS['macd'])
+    grid_candidates, grid_sqn, _ = gridSearch(stock_df, 'macd', combos)
+    candidates, sqn, _ = adaptiveSearch(stock_df, 'macd', combos, 40, 0)
+    scores = dict(zip(map(tuple, grid_candidates.values), grid_sqn))
+    np.testing.assert_array_equal(sqn, [scores[tuple(row)] for row in candidates.values])
+    # with the whole grid as budget every combination is scored
+    assert adaptiveSearch(stock_df, 'macd', combos, None, 0)[2]['evaluations'] == len(combos)
+
+
+@pytest.mark.parametrize("strategy_name, grid", [
+    ('bb', {"bb_window": [14, 30], "rsi_window": [6, 14], "rsi_smooth_window": [3, 5], "rsi_upper_thres": [70], "rsi_lower_thres": [25, 30]}),
+    ('macd', {"macd_fast_ma_length": [12, 16, 20], "macd_slow_ma_length": [30, 40], "macd_signal_ma_length": [9, 11]})
+])
+def test_best_params_match_backtest_optimize(bars, strategy_name, grid):
+    from backtesting import Backtest
+    from utils import strategies
+    from utils.vectorized import STRATEGIES
+
+    constraint = GRIDS[strategy_name][1]
+    stats, heatmap = Backtest(bars, getattr(strategies, STRATEGIES[strategy_name]), cash=10_000).optimize(
+        **grid, maximize='SQN', constraint=constraint, return_heatmap=True)
+    combos = gridCombinations(grid, constraint)
+    _, sqn, _ = gridSearch(bars, strategy_name, combos)
+    np.testing.assert_allclose(sqn, heatmap.loc[list(map(tuple, combos.values))].values, rtol=1e-9)
+    assert bestParams(bars, strategy_name, combos) == {key: getattr(stats._strategy, key) for key in grid}
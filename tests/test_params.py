@@ -0,0 +1,59 @@
+import pandas as pd
+import pytest
+
+from utils.params import ParamsTable, BollingerBandsParams, MACDParams, PARAM_COLUMNS
+
+
+def optParams(rows):
+    columns = ['ticker'] + PARAM_COLUMNS['bb'] + PARAM_COLUMNS['macd']
+    return pd.DataFrame(rows, columns=columns)
+
+
+def test_from_frame_indexes_the_rows_by_ticker():
+    table = ParamsTable.fromFrame(optParams([
+        ['sh.600000', 14, 6, 3, 75, 25, 16, 34, 11],
+        ['sz.000001', 21, 14, 5, 80, 20, 12, 30, 9]
+    ]))
+    assert len(table) == 2 and 'sh.600000' in table
+    assert table.get('sh.600000', 'bb') == BollingerBandsParams(14, 6, 3, 75, 25)
+    assert table.get('sz.000001', 'macd') == MACDParams(12, 30, 9)
+
+
+def test_first_row_of_a_duplicated_ticker_is_used():
+    table = ParamsTable.fromFrame(optParams([
+        ['sh.600000', 14, 6, 3, 75, 25, 16, 34, 11],
+        ['sh.600000', 21, 14, 5, 80, 20, 12, 30, 9]
+    ]))
+    assert len(table) == 1
+    assert table.get('sh.600000', 'macd') == MACDParams(16, 34, 11)
+
+
+def test_missing_ticker_gets_the_defaults():
+    table = ParamsTable.fromFrame(optParams([['sh.600000', 14, 6, 3, 75, 25, 16, 34, 11]]))
+    assert table.get('sz.000001', 'bb') == BollingerBandsParams()
+    assert table.get('sz.000001', 'macd') == MACDParams()
+    assert table.missing(['sz.000001', 'sh.600000', 'sz.000002']) == ['sz.000001', 'sz.000002']
+    assert list(table.frame(['sz.000001'], 'macd').iloc[0]) == [26, 12, 9]
+
+
+def test_missing_ticker_column_raises():
+    with pytest.raises(ValueError, match="'ticker'"):
+        ParamsTable.fromFrame(optParams([['sh.600000', 14, 6, 3, 75, 25, 16, 34, 11]]).drop(columns='ticker'))
+
+
+def test_missing_strategy_column_raises():
+    opt_params = optParams([['sh.600000', 14, 6, 3, 75, 25, 16, 34, 11]]).drop(columns='macd_signal_ma_length')
+    with pytest.raises(ValueError, match="macd_signal_ma_length"):
+        ParamsTable.fromFrame(opt_params)
+    # the columns of the strategies not read are not required
+    assert ParamsTable.fromFrame(opt_params, ['bb']).get('sh.600000', 'bb') == BollingerBandsParams(14, 6, 3, 75, 25)
+
+
+@pytest.mark.parametrize("value", ['x', 2.5, None])
+def test_non_integer_parameters_raise(value):
+    opt_params = optParams([
+        ['sh.600000', 14, 6, 3, 75, 25, 16, 34, 11],
+        ['sz.000001', 21, value, 5, 80, 20, 12, 30, 9]
+    ])
+    with pytest.raises(ValueError, match="sz.000001"):
+        ParamsTable.fromFrame(opt_params)
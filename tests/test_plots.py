@@ -0,0 +1,66 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.plots import savePlotInputs, plotPaths, downsampleBars, renderPlots
+
+
+def plotInputs(n_bars):
+    x = np.arange(n_bars, dtype=float)
+    return {
+        "timestamps": np.arange(n_bars, dtype=np.int64), "open": x, "high": x + 0.5, "low": x - 0.5,
+        "close": x + 0.25, "equity": 10_000 + x,
+        "EntryBar": np.array([1, 5]), "ExitBar": np.array([4, 9]),
+        "EntryPrice": np.array([1.0, 5.0]), "ExitPrice": np.array([4.0, 9.0]), "PnL": np.array([300.0, 400.0])
+    }
+
+
+def test_short_inputs_are_not_downsampled():
+    inputs = downsampleBars(plotInputs(10), 20)
+    np.testing.assert_array_equal(inputs['x'], np.arange(10))
+    np.testing.assert_array_equal(inputs['close'], plotInputs(10)['close'])
+
+
+def test_downsampled_bars_merge_the_bars_of_every_bucket():
+    inputs = downsampleBars(plotInputs(10), 4)
+    # buckets of three bars, the last one holding a single bar
+    np.testing.assert_array_equal(inputs['x'], [0, 3, 6, 9])
+    np.testing.assert_array_equal(inputs['open'], [0, 3, 6, 9])
+    np.testing.assert_array_equal(inputs['high'], [2.5, 5.5, 8.5, 9.5])
+    np.testing.assert_array_equal(inputs['low'], [-0.5, 2.5, 5.5, 8.5])
+    np.testing.assert_array_equal(inputs['close'], [2.25, 5.25, 8.25, 9.25])
+    np.testing.assert_array_equal(inputs['equity'], [10_002, 10_005, 10_008, 10_009])
+    np.testing.assert_array_equal(inputs['EntryBar'], [0, 3])
+    np.testing.assert_array_equal(inputs['ExitBar'], [3, 9])
+
+
+@pytest.fixture
+def plot_folder(tmp_path, bars):
+    """
+        Saved plot inputs of two tickers.
+    """
+    folder = str(tmp_path/'plots')
+    trades = pd.DataFrame({"EntryBar": [10, 50], "ExitBar": [30, 80], "EntryPrice": [10.0, 10.5],
+                           "ExitPrice": [10.2, 10.1], "PnL": [20.0, -40.0]})
+    for ticker in ['sh.600000', 'sh.600001']:
+        savePlotInputs(plotPaths('bb', ticker, folder)[0], bars, np.arange(bars.shape[0], dtype=np.int64)*1_800_000_000_000,
+                       np.full(bars.shape[0], 10_000.0), trades)
+    return folder
+
+
+def test_unchanged_plots_are_skipped(plot_folder, bars):
+    tickers = ['sh.600000', 'sh.600001', 'sh.600002']
+    assert renderPlots('bb', tickers, folder=plot_folder) == (['sh.600000', 'sh.600001'], [])
+    assert os.path.getsize(plotPaths('bb', 'sh.600000', plot_folder)[1]) > 0
+    assert renderPlots('bb', tickers, folder=plot_folder) == ([], ['sh.600000', 'sh.600001'])
+
+    # new inputs, a deleted plot, other options or force render the plots again
+    savePlotInputs(plotPaths('bb', 'sh.600000', plot_folder)[0], bars, np.arange(bars.shape[0], dtype=np.int64),
+                   np.full(bars.shape[0], 10_000.0), pd.DataFrame(columns=['EntryBar', 'ExitBar', 'EntryPrice', 'ExitPrice', 'PnL'], dtype=float))
+    assert renderPlots('bb', tickers, folder=plot_folder) == (['sh.600000'], ['sh.600001'])
+    os.remove(plotPaths('bb', 'sh.600001', plot_folder)[1])
+    assert renderPlots('bb', tickers, folder=plot_folder) == (['sh.600001'], ['sh.600000'])
+    assert renderPlots('bb', tickers, max_bars=100, folder=plot_folder) == (['sh.600000', 'sh.600001'], [])
+    assert renderPlots('bb', tickers, max_bars=100, folder=plot_folder, force=True) == (['sh.600000', 'sh.600001'], [])
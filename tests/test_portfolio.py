@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+
+from utils.portfolio import simulatePortfolio
+from utils.vectorized import TRADE_SIZE
+
+
+def handPanel(prices, lows = None, lengths = None):
+    """
+    Arguments of simulatePortfolio for (bars x tickers) prices used as open, high and close, every
+    ticker starting on the first row of the shared axis and keeping lengths bars (all by default).
+    """
+    prices = np.asarray(prices, dtype=float)
+    n_bars, n_tickers = prices.shape
+    lows = prices if lows is None else np.asarray(lows, dtype=float)
+    lengths = np.full(n_tickers, n_bars) if lengths is None else np.asarray(lengths)
+    tickers = [f"t{j}" for j in range(n_tickers)]
+    panel = {column: pd.DataFrame(values, columns=tickers) for column, values in
+             [('Open', prices), ('High', prices), ('Low', lows), ('Close', prices)]}
+    timestamps = pd.date_range('2022-01-03 10:00', periods=n_bars, freq='30min').values.astype('int64')
+    rows = [np.arange(n) for n in lengths]
+    return panel, lengths, timestamps, rows
+
+
+def signals(n_bars, n_tickers, entry_bars):
+    entries = np.zeros((n_bars, n_tickers), dtype=bool)
+    for j, i in entry_bars.items():
+        entries[i, j] = True
+    return np.zeros(n_tickers, dtype=int), entries, np.zeros_like(entries), np.full((n_bars, n_tickers), np.nan)
+
+
+def test_entries_share_one_cash_pool():
+    panel, lengths, timestamps, rows = handPanel(np.full((6, 3), 10.0))
+    start, entries, exits, stop_loss = signals(6, 3, {0: 1, 1: 1, 2: 1})
+    cash = 2*TRADE_SIZE*10.0
+    timeline, trades, rejected = simulatePortfolio(panel, lengths, timestamps, rows, start, entries, exits, stop_loss, cash)
+
+    # the first two tickers take all the cash, the third entry is cancelled
+    assert rejected == {"cash": 1, "positions": 0}
+    assert timeline['positions'].max() == 2
+    assert timeline['cash'].iloc[2] == 0
+    assert sorted(trades['Ticker']) == ['t0', 't1']
+
+
+def test_max_positions_limits_the_positions_held():
+    panel, lengths, timestamps, rows = handPanel(np.full((6, 3), 10.0))
+    start, entries, exits, stop_loss = signals(6, 3, {0: 1, 1: 1, 2: 3})
+    timeline, trades, rejected = simulatePortfolio(panel, lengths, timestamps, rows, start, entries, exits, stop_loss, max_positions=1)
+
+    assert rejected == {"cash": 0, "positions": 2}
+    assert timeline['positions'].max() == 1
+    assert list(trades['Ticker']) == ['t0']
+
+
+def test_stop_loss_fills_at_the_lower_of_open_and_stop():
+    prices = np.full((6, 2), 10.0)
+    lows = prices.copy()
+    # t0 gaps below its stop on the open, t1 trades through its stop within the bar
+    prices[3, 0], lows[3, 0] = 9.0, 8.9
+    lows[3, 1] = 9.0
+    panel, lengths, timestamps, rows = handPanel(prices, lows)
+    start, entries, exits, stop_loss = signals(6, 2, {0: 1, 1: 1})
+    stop_loss[1] = 9.5
+    _, trades, _ = simulatePortfolio(panel, lengths, timestamps, rows, start, entries, exits, stop_loss)
+
+    trades = trades.set_index('Ticker')
+    assert list(trades['ExitBar']) == [3, 3]
+    assert trades.loc['t0', 'ExitPrice'] == 9.0
+    assert trades.loc['t1', 'ExitPrice'] == 9.5
+
+
+def test_entry_on_the_last_bar_of_a_ticker_is_cancelled():
+    # t0 ends on row 3 with an entry signal on its last bar, t1 trades until row 5
+    panel, lengths, timestamps, rows = handPanel(np.full((6, 2), 10.0), lengths=[4, 6])
+    start, entries, exits, stop_loss = signals(6, 2, {0: 3, 1: 3})
+    cash = TRADE_SIZE*10.0
+    timeline, trades, rejected = simulatePortfolio(panel, lengths, timestamps, rows, start, entries, exits, stop_loss, cash, max_positions=1)
+
+    # neither the cash nor the position slot of t1 is taken by a position t0 could never close
+    assert rejected == {"cash": 0, "positions": 0}
+    assert list(trades['Ticker']) == ['t1']
+    assert timeline['positions'].iloc[-1] == 0
+    assert timeline['equity'].iloc[-1] == cash
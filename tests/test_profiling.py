@@ -0,0 +1,74 @@
+import time
+import pstats
+
+import numpy as np
+import pytest
+
+from utils.profiling import TickerProfile, STAGES, profiledStrategy, runProfiled, profileReport, dumpCProfile
+
+
+@pytest.mark.parametrize("strategy_name", ['BollingerBandsStrategy', 'MACDStrategy'])
+def test_profiled_run_gives_the_stats_of_the_plain_run(bars, strategy_name):
+    from backtesting import Backtest
+    from utils import strategies
+
+    strategy = getattr(strategies, strategy_name)
+    expected = Backtest(bars, strategy, cash=10_000).run()
+    profile = TickerProfile('sh.600000')
+    bt = Backtest(bars, profiledStrategy(strategy, profile), cash=10_000)
+    start = time.perf_counter()
+    stats = runProfiled(bt, profile)
+    elapsed = time.perf_counter() - start
+
+    assert stats['Return [%]'] == expected['Return [%]']
+    assert stats._trades.equals(expected._trades)
+    assert profile.counters['trades'] == expected['# Trades']
+    assert 0 < profile.counters['bars'] < bars.shape[0]
+    assert profile.counters['orders'] >= expected['# Trades']
+    # the stages split the wall time of bt.run
+    assert set(profile.timers) == {'setup', 'init', 'next_loop', 'stats'}
+    assert all(seconds >= 0 for seconds in profile.timers.values())
+    assert sum(profile.timers.values()) == pytest.approx(elapsed, rel=0.05)
+
+
+def test_unprofiled_run_is_the_plain_strategy(bars):
+    from utils.strategies import MACDStrategy
+    assert profiledStrategy(MACDStrategy, None) is MACDStrategy
+
+
+def test_profile_report_sums_the_stages():
+    profiles = []
+    for k, ticker in enumerate(['sh.600000', 'sh.600001', 'sh.600002']):
+        profile = TickerProfile(ticker)
+        profile.add('load', 0.1*(k + 1))
+        profile.add('next_loop', 0.3)
+        profile.count('bars', 100)
+        profiles.append(profile)
+    tickers, stages, slowest = profileReport(profiles, top=2)
+
+    assert list(tickers['ticker']) == ['sh.600000', 'sh.600001', 'sh.600002']
+    np.testing.assert_allclose(tickers['total_s'], [0.4, 0.5, 0.6])
+    stages = stages.set_index('stage')
+    assert list(stages.index) == STAGES
+    assert stages.loc['load', 'seconds'] == pytest.approx(0.6)
+    assert stages['share [%]'].sum() == pytest.approx(100)
+    assert stages.loc['next_loop', 'per bar [us]'] == pytest.approx(0.9/300*1e6)
+    assert list(slowest['ticker']) == ['sh.600002', 'sh.600001']
+
+
+def test_empty_profile_report():
+    tickers, stages, slowest = profileReport([])
+    assert tickers.empty and stages.empty and slowest.empty
+
+
+def test_cprofile_stats_are_merged(tmp_path):
+    profiles = []
+    for ticker in ['sh.600000', 'sh.600001']:
+        with TickerProfile(ticker, cprofile=True) as profile:
+            sorted(range(1000), key=lambda x: -x)
+        profiles.append(profile)
+    path = str(tmp_path/'run.pstats')
+    assert dumpCProfile(profiles, path)
+    calls = {func[2]: stat[0] for func, stat in pstats.Stats(path).stats.items()}
+    assert calls["<built-in method builtins.sorted>"] == 2
+    assert not dumpCProfile([TickerProfile('sh.600000')], str(tmp_path/'none.pstats'))
@@ -0,0 +1,48 @@
+import pandas as pd
+
+from utils.results import ResultsWriter, RESULT_COLUMNS
+
+
+def resultRow(ticker, value):
+    return {"ticker": ticker, **{column: value for column in RESULT_COLUMNS[1:-1]}, "plot_path": None}
+
+
+def tradesFrame(n, price):
+    return pd.DataFrame({"Size": [100]*n, "EntryPrice": [price]*n, "ExitPrice": [price + 1]*n})
+
+
+def test_rows_are_on_disk_after_every_write(tmp_path):
+    results_path, trades_path = str(tmp_path/'results.csv'), str(tmp_path/'trades.csv')
+    with ResultsWriter(results_path, trades_path) as writer:
+        writer.write(resultRow('sh.600000', 1.0), tradesFrame(2, 10.0))
+        # readable before the writer is closed, as after a crash
+        assert list(pd.read_csv(results_path).columns) == RESULT_COLUMNS
+        assert pd.read_csv(trades_path).shape[0] == 2
+        writer.write(resultRow('sh.600001', 2.0), tradesFrame(0, 0.0))
+        writer.write(resultRow('sh.600002', 3.0))
+        assert list(pd.read_csv(results_path)['ticker']) == ['sh.600000', 'sh.600001', 'sh.600002']
+
+
+def test_append_resumes_the_files(tmp_path):
+    results_path, trades_path = str(tmp_path/'results.csv'), str(tmp_path/'trades.csv')
+    with ResultsWriter(results_path, trades_path) as writer:
+        writer.write(resultRow('sh.600000', 1.0), tradesFrame(2, 10.0))
+    with ResultsWriter(results_path, trades_path, append=True) as writer:
+        # the trades of a resumed run keep the columns of the log, in its order
+        writer.write(resultRow('sh.600001', 2.0), tradesFrame(1, 20.0)[['ExitPrice', 'Size', 'EntryPrice']].assign(Tag='x'))
+
+    results = pd.read_csv(results_path)
+    assert list(results['ticker']) == ['sh.600000', 'sh.600001']
+    trades = pd.read_csv(trades_path)
+    assert list(trades.columns) == ['ticker', 'Size', 'EntryPrice', 'ExitPrice']
+    assert list(trades['ticker']) == ['sh.600000']*2 + ['sh.600001']
+    assert list(trades['EntryPrice']) == [10.0, 10.0, 20.0]
+
+
+def test_overwrite_starts_new_files(tmp_path):
+    results_path, trades_path = str(tmp_path/'out'/'results.csv'), str(tmp_path/'out'/'trades.csv')
+    for ticker in ['sh.600000', 'sh.600001']:
+        with ResultsWriter(results_path, trades_path) as writer:
+            writer.write(resultRow(ticker, 1.0), tradesFrame(1, 10.0))
+    assert list(pd.read_csv(results_path)['ticker']) == ['sh.600001']
+    assert list(pd.read_csv(trades_path)['ticker']) == ['sh.600001']
@@ -0,0 +1,10 @@
+from utils.benchmark import writeSyntheticUniverse
+from utils.datastore import tickerFromPath
+from utils.screener import checkScreener
+
+
+def test_screener_matches_the_batch_signals(tmp_path):
+    stock_files = {tickerFromPath(stock_name): stock_name for stock_name in writeSyntheticUniverse(str(tmp_path), 20, 600)}
+    screener, candidates, timings, mismatches = checkScreener(stock_files, warmup_bars=400, live_bars=100)
+    assert mismatches == [] and len(screener.tickers) == 20 and len(timings) == 100
+    assert not (candidates['strategy'] == 'bb').any() or (candidates[candidates['strategy'] == 'bb']['signal'] == 'entry').all()
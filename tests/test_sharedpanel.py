@@ -0,0 +1,63 @@
+from multiprocessing import shared_memory
+
+import numpy as np
+import pytest
+
+from utils import sharedpanel
+from utils.datastore import writeStore, openStore, readStockData, readStockTimestamps, listStockNames, OHLCV_COLUMNS
+from utils.sharedpanel import SharedPanel, attachPanel, sharedStockData, checkSharedPanel
+
+
+@pytest.fixture
+def stock_names(tmp_path, make_bars):
+    """
+        Three synthetic tickers of different lengths in a float64 store.
+    """
+    data_folder = str(tmp_path/'history')
+    writeStore(data_folder, {f"sh-60000{seed}": make_bars(n_bars=300 + 100*seed, seed=seed) for seed in range(3)}, 'float64')
+    return listStockNames(data_folder)
+
+
+@pytest.mark.parametrize("precision", [None, 'float32'])
+def test_attached_frames_are_views_of_the_bars(stock_names, precision):
+    with SharedPanel.create(stock_names, precision=precision) as panel:
+        attached = SharedPanel.attach(panel.spec)
+        for stock_name in stock_names:
+            store = openStore(stock_name.rsplit('/', 1)[0])
+            stock_df, shared = readStockData(stock_name, store, precision=precision), attached.frame(stock_name)
+            for column in OHLCV_COLUMNS:
+                assert shared[column].dtype == stock_df[column].dtype
+                np.testing.assert_array_equal(shared[column].values, stock_df[column].values)
+            np.testing.assert_array_equal(attached.tickerTimestamps(stock_name), readStockTimestamps(stock_name, store))
+            assert np.shares_memory(shared['Close'].values, attached.prices)
+        assert not attached.prices.flags.writeable
+        attached.close()
+
+
+def test_closing_the_creator_frees_the_block(stock_names):
+    with SharedPanel.create(stock_names) as panel:
+        name = panel.spec['name']
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=name)
+
+
+def test_shared_stock_data_falls_back_to_the_store(stock_names):
+    with SharedPanel.create(stock_names[:2], date_range=('2022-01-03', '2022-01-31')) as panel:
+        attachPanel(panel.spec)
+        try:
+            assert np.shares_memory(sharedStockData(stock_names[0], ('2022-01-03', '2022-01-31'))['Open'].values, sharedpanel._attached.prices)
+            # another date range or a ticker not in the panel is read from the store
+            for stock_name, date_range in [(stock_names[0], None), (stock_names[2], ('2022-01-03', '2022-01-31'))]:
+                stock_df = sharedStockData(stock_name, date_range)
+                assert not np.shares_memory(stock_df['Open'].values, sharedpanel._attached.prices)
+                assert stock_df.equals(readStockData(stock_name, openStore(stock_name.rsplit('/', 1)[0]), date_range))
+        finally:
+            sharedpanel._attached.close()
+            attachPanel(None)
+
+
+def test_workers_read_the_tickers_from_the_block(stock_names):
+    report, mismatches = checkSharedPanel(stock_names, workers=2)
+    assert mismatches == []
+    assert report['views'] == len(stock_names)
+    assert report['bars'] == 300 + 400 + 500
@@ -0,0 +1,29 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.statemachine import simulateStateMachine, experimentalColumns
+from utils.vectorized import validateAgainstBacktest, simulate, SIGNALS, tickerParams
+
+
+@pytest.mark.parametrize("strategy_name", ['bb', 'macd', 'experimental'])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_trades_match_backtest(make_bars, strategy_name, seed):
+    stock_df = experimentalColumns(make_bars(seed=seed)[['Open', 'High', 'Low', 'Close', 'Volume']])
+    assert validateAgainstBacktest(stock_df, strategy_name, simulator=simulateStateMachine) == []
+
+
+@pytest.mark.parametrize("strategy_name", ['bb', 'macd', 'experimental'])
+def test_same_as_simulate_on_a_panel(make_bars, strategy_name):
+    # tickers of different lengths, the shorter ones padded with NaN like utils.vectorized.loadPanel
+    frames = {f"t{seed}": experimentalColumns(make_bars(n_bars=600 + 150*seed, seed=seed)) for seed in range(4)}
+    panel = {column: pd.DataFrame({ticker: df[column] for ticker, df in frames.items()}, dtype=float)
+             for column in ['Open', 'High', 'Low', 'Close', 'Ema_100', 'Bb_basis']}
+    lengths = np.array([df.shape[0] for df in frames.values()])
+    entries, exits, stop_loss, start = SIGNALS[strategy_name](panel, tickerParams(panel['Close'].columns, strategy_name))
+
+    equity, trades = simulate(panel, lengths, start, entries, exits, stop_loss)
+    machine_equity, machine_trades = simulateStateMachine(panel, lengths, start, entries, exits, stop_loss)
+    assert len(trades) > 0
+    np.testing.assert_array_equal(machine_equity, equity)
+    pd.testing.assert_frame_equal(machine_trades, trades)
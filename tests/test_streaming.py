@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils import streaming
+from utils.streaming import replay
+from utils.indicators import bollingerBands, relativeStrengthIndex, movingAverageConverganceDivergance, averageTrueRange, stochasticIndicator
+
+
+def assertClose(streamed, batch):
+    # rolling deviations of identical prices differ from zero by rounding residue in pandas (~1e-8)
+    np.testing.assert_allclose(np.asarray(streamed, dtype=float), np.asarray(batch, dtype=float), rtol=1e-9, atol=1e-7, equal_nan=True)
+
+
+@pytest.mark.parametrize("window", [2, 20, 30])
+def test_bollinger_bands(bars, window):
+    streamed = np.array(replay(bars, streaming.BollingerBands(window)))
+    assertClose(streamed, bollingerBands(bars, window)[['bb_basis', 'bb_upper', 'bb_lower']].values)
+
+
+@pytest.mark.parametrize("smooth_signal", ['EMA', 'SMA'])
+def test_relative_strength_index(bars, smooth_signal):
+    streamed = np.array(replay(bars, streaming.RelativeStrengthIndex(14, 3, smooth_signal)))
+    assertClose(streamed, relativeStrengthIndex(bars, 14, 3, smooth_signal)[['rsi', 'rsi_signal']].values)
+
+
+def test_macd(bars):
+    streamed = np.array(replay(bars, streaming.MovingAverageConverganceDivergance(26, 12, 9)))
+    assertClose(streamed, movingAverageConverganceDivergance(bars, 'EMA', 'EMA', 26, 12, 9).values)
+
+
+def test_average_true_range(bars):
+    assertClose(replay(bars, streaming.AverageTrueRange(14)), averageTrueRange(bars, 14)['atr'].values)
+
+
+def test_stochastic(bars):
+    streamed = np.array(replay(bars, streaming.StochasticIndicator(14, 3)))
+    assertClose(streamed, stochasticIndicator(bars, 14, 3).values)
+
+
+def test_many_tickers_with_their_own_windows(make_bars):
+    # one array update per bar for all tickers, every ticker with its own window
+    frames = [make_bars(n_bars=500, seed=seed) for seed in range(3)]
+    windows = np.array([10, 20, 30])
+    bands = streaming.BollingerBands(windows)
+    streamed = np.array([bands.update({"Close": np.array([df['Close'].iloc[i] for df in frames])}) for i in range(500)])
+    for j, (df, window) in enumerate(zip(frames, windows)):
+        assertClose(streamed[:, :, j], bollingerBands(df, int(window)).values)
+
+
+def test_macd_signals(bars):
+    macd = movingAverageConverganceDivergance(bars, 'EMA', 'EMA', 26, 12, 9)
+    previous = macd.shift()
+    entries = (previous['macd'] < previous['macd_signal']) & (macd['macd'] > macd['macd_signal']) & (macd['macd'] <= 0)
+    exits = (previous['macd_signal'] < previous['macd']) & (macd['macd_signal'] > macd['macd']) & (macd['macd'] > 0)
+    streamed = np.array(replay(bars, streaming.MACDSignals(26, 12, 9)), dtype=bool)
+    np.testing.assert_array_equal(streamed, np.column_stack([entries, exits]))
+
+
+def test_bollinger_bands_signals(bars):
+    bands = bollingerBands(bars, 30)
+    rsi = relativeStrengthIndex(bars, 14, 3)
+    entries = (bars['Close'] < bands['bb_lower']) & (rsi['rsi_signal'] < 30)
+    band_exits = (bars['Close'] > bands['bb_upper']) & (rsi['rsi_signal'] > 70)
+    signals = streaming.BollingerBandsSignals(30, 14, 3, 70, 30)
+    streamed, streamed_band_exits = [], []
+    for bar in bars.to_dict('records'):
+        streamed.append(signals.update(bar))
+        streamed_band_exits.append(signals.band_exit)
+    streamed = np.array(streamed, dtype=bool)
+    # like BollingerBandsStrategy, whose exit rule never closes the position
+    np.testing.assert_array_equal(streamed, np.column_stack([entries, np.zeros(len(bars), dtype=bool)]))
+    np.testing.assert_array_equal(streamed_band_exits, band_exits)
+    assert band_exits.any()
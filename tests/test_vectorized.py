@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+
+from utils.vectorized import validateAgainstBacktest, requireBacktesting, buyAndHold, BACKTESTING_VERSION
+
+
+@pytest.mark.parametrize("strategy_name", ['bb', 'macd'])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_trades_match_backtest(make_bars, strategy_name, seed):
+    stock_df = make_bars(seed=seed)[['Open', 'High', 'Low', 'Close', 'Volume']]
+    assert validateAgainstBacktest(stock_df, strategy_name) == []
+
+
+@pytest.mark.parametrize("strategy_name, params", [
+    ('bb', {"bb_window": 20, "rsi_window": 10, "rsi_smooth_window": 5, "rsi_lower_thres": 40}),
+    ('macd', {"macd_fast_ma_length": 8, "macd_slow_ma_length": 21, "macd_signal_ma_length": 5})
+])
+def test_trades_match_backtest_with_params(bars, strategy_name, params):
+    assert validateAgainstBacktest(bars, strategy_name, params) == []
+
+
+@pytest.mark.parametrize("strategy_name", ['bb', 'macd'])
+def test_open_trade_closed_at_the_end(bars, strategy_name):
+    # the last trade of both strategies is still open on the last bar of the seed 0 bars
+    from backtesting import Backtest
+    from utils import strategies
+    from utils.vectorized import STRATEGIES
+
+    stats = Backtest(bars, getattr(strategies, STRATEGIES[strategy_name]), cash=10_000).run()
+    assert stats._trades['ExitBar'].iloc[-1] == bars.shape[0] - 1
+    assert validateAgainstBacktest(bars, strategy_name) == []
+
+
+def test_buy_and_hold_matches_backtest(bars):
+    from backtesting import Backtest
+    from utils.strategies import BuyAndHoldStrategy
+
+    stats = Backtest(bars, BuyAndHoldStrategy, cash=10_000).run()
+    panel = {column: bars[[column]].set_axis(['ticker'], axis=1) for column in ['Open', 'High', 'Low', 'Close']}
+    assert np.isclose(buyAndHold(panel, np.array([bars.shape[0]]))[0], stats['Equity Final [$]'])
+
+
+def test_other_backtesting_version_raises(monkeypatch, bars):
+    backtesting = requireBacktesting()
+    monkeypatch.setattr(backtesting, '__version__', BACKTESTING_VERSION + '.post1')
+    with pytest.raises(RuntimeError):
+        validateAgainstBacktest(bars, 'bb')
+
+
+@pytest.mark.parametrize("strategy_name", ['bb', 'macd'])
+def test_engines_give_the_same_result_rows(tmp_path, strategy_name):
+    from main import runTickers, runTickersVectorized
+    from utils.results import RESULT_STATS, RESULT_COLUMNS
+    from utils.benchmark import writeSyntheticUniverse
+
+    stock_names = writeSyntheticUniverse(str(tmp_path), 3, 600)
+    for (row, profit_bnh, profit, _), (vectorized_row, vectorized_bnh, vectorized_profit, _) in \
+            zip(runTickers(stock_names, strategy_name), runTickersVectorized(stock_names, strategy_name)):
+        assert list(row) == list(vectorized_row) == RESULT_COLUMNS
+        assert row["ticker"] == vectorized_row["ticker"]
+        np.testing.assert_allclose([row[column] for column in RESULT_STATS] + [profit_bnh, profit],
+                                   [vectorized_row[column] for column in RESULT_STATS] + [vectorized_bnh, vectorized_profit], rtol=1e-9)
@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.datastore import writeStore, openStore, readStockData, listStockNames
+from utils.optimize import bestParams
+from utils.walkforward import walkForwardFolds, walkForwardTicker
+
+
+@pytest.fixture
+def stock_name(tmp_path, make_bars):
+    """
+        One synthetic ticker in a store, its bars starting on 2022-01-03.
+    """
+    data_folder = str(tmp_path/'history')
+    writeStore(data_folder, {"sh-600000": make_bars(seed=4)}, 'float64')
+    return listStockNames(data_folder)[0]
+
+
+def test_test_windows_are_contiguous_and_cut_at_the_end_date():
+    folds = walkForwardFolds('2022-01-01', '2022-06-15', train_months=2, test_months=1)
+    assert [test for _, test in folds] == [('2022-03-01', '2022-03-31'), ('2022-04-01', '2022-04-30'),
+                                           ('2022-05-01', '2022-05-31'), ('2022-06-01', '2022-06-15')]
+    for train, test in folds:
+        assert pd.Timestamp(train[1]) + pd.Timedelta(days=1) == pd.Timestamp(test[0])
+    assert walkForwardFolds('2022-01-01', '2022-02-15', train_months=2) == []
+
+
+def test_first_fold_picks_the_params_of_best_params(stock_name):
+    folds = walkForwardFolds('2022-01-03', '2022-06-30', train_months=2, test_months=1)
+    rows, _ = walkForwardTicker(stock_name, 'bb', folds)
+    # the first train window starts on the first bar, its indicators are not warmed up on earlier bars
+    stock_df = readStockData(stock_name, openStore(stock_name.rsplit('/', 1)[0]), folds[0][0])
+    expected = bestParams(stock_df, 'bb')
+    assert {column: rows[0][column] for column in expected} == expected
+
+
+def test_stitched_equity_carries_the_pnl_of_the_previous_folds(stock_name):
+    cash = 10_000
+    folds = walkForwardFolds('2022-01-03', '2022-06-30', train_months=2, test_months=1)
+    rows, equity = walkForwardTicker(stock_name, 'bb', folds, cash)
+    assert equity.index.is_monotonic_increasing and equity.index[-1] < pd.Timestamp('2022-07-01')
+    # the last equity of every test window is the cash plus the returns of all the folds up to it
+    carried = cash*(1 + np.cumsum([row['test_return'] for row in rows])/100)
+    fold_ends = [equity[:pd.Timestamp(test_end) + pd.Timedelta(days=1)].iloc[-1] for _, (_, test_end) in folds]
+    np.testing.assert_allclose(fold_ends, carried, rtol=1e-12)
@@ -0,0 +1,352 @@
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import subprocess
+import statistics
+import warnings
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+
+# baostock 30 minute bar times, 8 bars per trading day
+BAR_TIMES = ['100000000', '103000000', '110000000', '113000000', '133000000', '140000000', '143000000', '150000000']
+
+
+def syntheticOHLCV(n_bars, seed = 0, code = 'sh.600000', start = '2022-04-01'):
+    """
+    Random walk 30 minute bars in the layout of the files written by data/scripts/download_stocks_data.py,
+    so that the benchmarks run without baostock data or network access.
+
+    Parameters:
+    - n_bars (int): number of bars.
+    - seed (int): seed of the random generator, the same seed always gives the same bars.
+    - code (str): baostock code written in the Code column.
+    - start (str): first trading day.
+
+    Returns:
+    - stock_df (DataFrame): Date, Time, Code, Open, High, Low, Close, Volume, Amount and Adjustflag columns.
+    """
+    rng = np.random.default_rng(seed)
+    first = rng.uniform(5, 150)
+    close = first*np.exp(np.cumsum(rng.normal(0, 0.01, n_bars)))
+    open_ = np.r_[first, close[:-1]]*np.exp(rng.normal(0, 0.002, n_bars))
+    high = np.maximum(open_, close)*(1 + np.abs(rng.normal(0, 0.004, n_bars)))
+    low = np.minimum(open_, close)*(1 - np.abs(rng.normal(0, 0.004, n_bars)))
+    volume = rng.integers(10_000, 1_000_000, n_bars)
+
+    days = pd.bdate_range(start, periods=n_bars//len(BAR_TIMES) + 1)
+    date = pd.Series(np.repeat(days.strftime('%Y-%m-%d'), len(BAR_TIMES))[:n_bars])
+    bar_time = pd.Series(np.repeat(days.strftime('%Y%m%d'), len(BAR_TIMES))[:n_bars]) + np.tile(BAR_TIMES, len(days))[:n_bars]
+    return pd.DataFrame({
+        "Date": date,
+        "Time": bar_time,
+        "Code": code,
+        "Open": open_.round(2),
+        "High": high.round(2),
+        "Low": low.round(2),
+        "Close": close.round(2),
+        "Volume": volume,
+        "Amount": (volume*close).round(2),
+        "Adjustflag": 3
+    })
+
+
+def writeSyntheticUniverse(data_folder, n_tickers, n_bars, seed = 0):
+    """
+        Writes n_tickers history_stock_*.csv files of n_bars synthetic bars into data_folder.
+    """
+    os.makedirs(data_folder, exist_ok=True)
+    stock_names = []
+    for k in range(n_tickers):
+        code = f'sh.{600000 + k}'
+        stock_name = f"{data_folder}/history_stock_{code.replace('.', '-')}.csv"
+        syntheticOHLCV(n_bars, seed + k, code).to_csv(stock_name, index=False)
+        stock_names.append(stock_name)
+    return stock_names
+
+
+def timeIt(func, repeat = 5):
+    """
+        Best and median wall time in seconds of repeat calls of func.
+    """
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {"best_s": min(timings), "median_s": statistics.median(timings), "repeat": repeat}
+
+
+def allocationsOf(func):
+    """
+        Memory blocks and bytes still allocated after one call of func and the peak of the memory
+        allocated during the call, traced with tracemalloc.
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        tracemalloc.reset_peak()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    allocated = [stat for stat in after.compare_to(before, 'traceback') if stat.count_diff > 0]
+    return {"retained_blocks": sum(stat.count_diff for stat in allocated), "retained_kb": sum(stat.size_diff for stat in allocated)/1024, "peak_kb": peak/1024}
+
+
+def benchmarkIndicators(bar_counts = (1_000, 10_000, 100_000, 1_000_000), repeat = 5):
+    """
+        Micro benchmarks of every indicator function of utils/indicators.py across bar counts.
+    """
+    from utils import indicators
+
+    cases = {
+        "bollingerBands": lambda df: indicators.bollingerBands(df, 30),
+        "relativeStrengthIndex": lambda df: indicators.relativeStrengthIndex(df, 14, 3),
+        "movingAverageConverganceDivergance": lambda df: indicators.movingAverageConverganceDivergance(df, 'EMA', 'EMA', 12, 26, 9),
+        "stochasticIndicator": lambda df: indicators.stochasticIndicator(df, 14, 3),
+        "averageTrueRange": lambda df: indicators.averageTrueRange(df, 14)
+    }
+    results = []
+    for n_bars in bar_counts:
+        stock_df = syntheticOHLCV(n_bars)
+        for name, case in cases.items():
+            results.append({"level": "indicators", "name": name, "params": {"bars": n_bars}, **timeIt(lambda: case(stock_df), repeat)})
+    return results
+
+
+def benchmarkStrategies(n_bars = 5_000, repeat = 5):
+    """
+        Wall time of one Backtest.run per ticker for the strategies run by main.py, with the memory
+        allocated by one extra, untimed, run.
+    """
+    from backtesting import Backtest
+    from utils.strategies import BollingerBandsStrategy, MACDStrategy, BuyAndHoldStrategy, ExperimentalStrategy
+
+    stock_df = syntheticOHLCV(n_bars)
+    results = []
+    for name, strategy in [("BollingerBandsStrategy", BollingerBandsStrategy), ("MACDStrategy", MACDStrategy), ("BuyAndHoldStrategy", BuyAndHoldStrategy)]:
+        bt = Backtest(stock_df, strategy, cash=10_000)
+        results.append({"level": "strategies", "name": name, "params": {"bars": n_bars}, **timeIt(bt.run, repeat), **allocationsOf(bt.run)})
+    for name, strategy in [("BollingerBandsStrategy", BollingerBandsStrategy), ("MACDStrategy", MACDStrategy), ("ExperimentalStrategy", ExperimentalStrategy)]:
+        init = strategyInit(Backtest(stock_df, strategy, cash=10_000))
+        results.append({"level": "strategies", "name": f"{name}.init", "params": {"bars": n_bars}, **timeIt(init, repeat*10), **allocationsOf(init)})
+    return results
+
+
+def strategyInit(bt):
+    """
+        The init of the strategy of bt on the data of bt, set up like Backtest.run does, to time the
+        indicator computation without the per bar loop.
+    """
+    from backtesting._util import _Data
+
+    data = _Data(bt._data.copy(deep=False))
+    strategy = bt._strategy(bt._broker(data=data), data, {})
+    def init():
+        strategy._indicators = []
+        strategy.init()
+    return init
+
+
+def benchmarkEndToEnd(n_tickers = 50, n_bars = 1_000, strategies = ('bb', 'macd'), engines = ('backtesting', 'vectorized'), workers = 1, repeat = 1):
+    """
+        Time of the main.py loop (data loading, buy and hold, strategy, results) over n_tickers
+        synthetic tickers, for every strategy and engine. Raises when a ticker fails, the time of a
+        run skipping failed tickers would not be comparable.
+    """
+    from main import runTickers, runTickersVectorized, TickerError
+
+    def checked(outcomes):
+        outcomes = list(outcomes)
+        errors = [outcome for outcome in outcomes if isinstance(outcome, TickerError)]
+        if errors:
+            raise RuntimeError(f"{len(errors)} of {len(outcomes)} tickers failed, first {errors[0].stock_name}:\n{errors[0].error}")
+        return outcomes
+
+    results = []
+    with tempfile.TemporaryDirectory() as data_folder:
+        stock_names = writeSyntheticUniverse(data_folder, n_tickers, n_bars)
+        for strategy_name in strategies:
+            for engine in engines:
+                if engine == 'vectorized':
+                    run = lambda: checked(runTickersVectorized(stock_names, strategy_name))
+                else:
+                    run = lambda: checked(runTickers(stock_names, strategy_name, workers=workers))
+                params = {"tickers": n_tickers, "bars": n_bars, "engine": engine, "workers": workers if engine == 'backtesting' else 1}
+                results.append({"level": "end_to_end", "name": strategy_name, "params": params, **timeIt(run, repeat)})
+    return results
+
+
+def benchmarkSearch(n_tickers = 10, n_bars = 520, budgets = (20, 40, 80), strategies = ('bb', 'macd'), searches = ('random', 'adaptive')):
+    """
+        Cost against the quality reached by the budgeted searches of utils/optimize.py (the random
+        and the adaptive search), relative to the exhaustive grid on n_tickers synthetic tickers of
+        n_bars (520 is about the insample period). For every search and budget: the wall time and
+        the evaluations as a fraction of the grid, the mean SQN of the chosen parameters on all
+        bars (sqn_ratio to the grid optimum, over the tickers where it is positive) and the share
+        of tickers where the grid optimum was found.
+    """
+    from utils.optimize import GRIDS, SEARCHES, gridCombinations, gridSearch, scoreGrid
+
+    results = []
+    for strategy_name in strategies:
+        combos = gridCombinations(*GRIDS[strategy_name])
+        stock_dfs = [syntheticOHLCV(n_bars, seed) for seed in range(n_tickers)]
+        grid = [gridSearch(stock_df, strategy_name, combos) for stock_df in stock_dfs]
+        grid_best = np.array([np.nanmax(sqn) if not np.all(np.isnan(sqn)) else np.nan for _, sqn, _ in grid])
+
+        runs = [('grid', None)] + [(search, budget) for search in searches for budget in budgets]
+        for search, budget in runs:
+            outcomes, found, evaluations = [], [], 0
+            start = time.perf_counter()
+            for seed, stock_df in enumerate(stock_dfs):
+                outcomes.append(SEARCHES[search](stock_df, strategy_name, combos, budget, seed))
+            elapsed = time.perf_counter() - start
+            if search == 'grid': grid_elapsed = elapsed
+            for stock_df, (candidates, sqn, cost) in zip(stock_dfs, outcomes):
+                evaluations += cost['evaluations']
+                # quality of the chosen parameters on all bars, whatever the bars the search scored them on
+                best = candidates.iloc[[int(np.nanargmax(sqn))]] if not np.all(np.isnan(sqn)) else None
+                found.append(scoreGrid(stock_df, strategy_name, best.reset_index(drop=True))[0] if best is not None else np.nan)
+            found = np.array(found)
+            positive = grid_best > 0
+            results.append({
+                "level": "search", "name": f"{strategy_name}/{search}",
+                "params": {"tickers": n_tickers, "bars": n_bars, "budget": budget},
+                "best_s": elapsed, "median_s": elapsed, "repeat": 1,
+                "evaluations": evaluations/n_tickers,
+                "evaluations_fraction": evaluations/(len(combos)*n_tickers),
+                "seconds_fraction": elapsed/grid_elapsed,
+                "sqn": float(np.nanmean(found)),
+                "grid_sqn": float(np.nanmean(grid_best)),
+                "sqn_ratio": float(np.nanmean(found[positive]/grid_best[positive])) if positive.any() else None,
+                "optimum_found": float(np.mean(np.isclose(found, grid_best, equal_nan=True)))
+            })
+    return results
+
+
+# modules imported in a fresh interpreter by the import benchmark, and the heavy libraries it reports
+IMPORT_TARGETS = ('main', 'utils.params', 'utils.vectorized', 'utils.optimize', 'utils.streaming', 'utils.strategies')
+HEAVY_MODULES = ('backtesting', 'bokeh', 'matplotlib', 'mplfinance')
+
+
+def benchmarkImports(modules = IMPORT_TARGETS, repeat = 5):
+    """
+        Startup time of the entry points: `python main.py --help` and the import of every module
+        of modules, each in a fresh interpreter so that nothing is cached by an earlier import. The
+        interpreter alone is timed as a baseline and the heavy libraries (HEAVY_MODULES) pulled in
+        by every import are listed.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    run = lambda command: subprocess.run(command, cwd=root, capture_output=True, text=True, check=True).stdout
+
+    cases = {"python": [sys.executable, '-c', 'pass'], "main.py --help": [sys.executable, 'main.py', '--help']}
+    cases.update({f"import {module}": [sys.executable, '-c', f"import sys, {module}; print(' '.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"]
+                  for module in modules})
+    results = []
+    for name, command in cases.items():
+        loaded = run(command).split() if name.startswith('import') else []
+        results.append({"level": "imports", "name": name, "params": {}, **timeIt(lambda: run(command), repeat), "heavy_modules": loaded})
+    return results
+
+
+def _gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def runBenchmarks(levels = ('indicators', 'strategies', 'end_to_end'), bar_counts = (1_000, 10_000, 100_000, 1_000_000),
+                  strategy_bars = 5_000, n_tickers = 50, ticker_bars = 1_000, workers = 1, repeat = 5, budgets = (20, 40, 80)):
+    """
+    Runs the selected benchmark levels. The indicator cache of utils/cache.py is disabled so that
+    repeated runs measure the computation and not the cache.
+
+    Returns:
+    - report (dict): environment of the run and one entry per benchmark with its best and median time.
+    """
+    from utils.cache import configureCache
+    configureCache(max_bytes=0)
+
+    results = []
+    if 'indicators' in levels:
+        results += benchmarkIndicators(bar_counts, repeat)
+    if 'strategies' in levels:
+        results += benchmarkStrategies(strategy_bars, repeat)
+    if 'end_to_end' in levels:
+        results += benchmarkEndToEnd(n_tickers, ticker_bars, workers=workers)
+    if 'search' in levels:
+        results += benchmarkSearch(budgets=budgets)
+    if 'imports' in levels:
+        results += benchmarkImports(repeat=repeat)
+    return {
+        "commit": _gitCommit(),
+        "created": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "results": results
+    }
+
+
+def _benchmarkKey(result):
+    return (result['level'], result['name'], json.dumps(result['params'], sort_keys=True))
+
+
+def compareBenchmarks(baseline, report):
+    """
+        Table of the benchmarks present in both reports, speedup > 1 meaning the report is faster
+        than the baseline.
+    """
+    baseline = {_benchmarkKey(result): result for result in baseline['results']}
+    rows = []
+    for result in report['results']:
+        key = _benchmarkKey(result)
+        if key not in baseline: continue
+        rows.append({"level": key[0], "name": key[1], "params": key[2],
+                     "baseline_s": baseline[key]['best_s'], "best_s": result['best_s'],
+                     "speedup": baseline[key]['best_s']/result['best_s']})
+    return pd.DataFrame(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='Benchmarks',
+                    description='times the indicators, the strategy backtests and the main.py loop on synthetic data')
+    parser.add_argument('--levels', nargs='+', default=['indicators', 'strategies', 'end_to_end'], choices=['indicators', 'strategies', 'end_to_end', 'search', 'imports'])
+    parser.add_argument('--bar_counts', nargs='+', default=[1_000, 10_000, 100_000, 1_000_000], type=int,
+                        help="bar counts of the indicator benchmarks")
+    parser.add_argument('--strategy_bars', default=5_000, type=int, help="bars of the single ticker strategy benchmarks")
+    parser.add_argument('--tickers', default=50, type=int, help="synthetic tickers of the end to end benchmark")
+    parser.add_argument('--ticker_bars', default=1_000, type=int, help="bars per ticker of the end to end benchmark")
+    parser.add_argument('--budgets', nargs='+', default=[20, 40, 80], type=int, help="evaluation budgets of the search benchmark")
+    parser.add_argument('--workers', default=1, type=int)
+    parser.add_argument('--repeat', default=5, type=int)
+    parser.add_argument('--output', default=None, help="json report, default is ./results/benchmarks/<commit>.json")
+    parser.add_argument('--compare', default=None, help="json report of a previous run to compare against")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    report = runBenchmarks(args.levels, args.bar_counts, args.strategy_bars, args.tickers, args.ticker_bars, args.workers, args.repeat, args.budgets)
+    output = args.output or f"./results/benchmarks/{report['commit'] or 'benchmark'}.json"
+    os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=4)
+
+    print(pd.DataFrame([{**result, "params": json.dumps(result['params'])} for result in report['results']]).to_string(index=False))
+    if args.compare is not None:
+        with open(args.compare) as f:
+            print(compareBenchmarks(json.load(f), report).to_string(index=False))
+    print(f"Benchmark report saved in {output}")
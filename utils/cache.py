@@ -0,0 +1,237 @@
+import os
+import sys
+import hashlib
+import functools
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# default bound of the disk tier of IndicatorCache
+DISK_MAX_BYTES = 2*2**30
+
+
+class IndicatorCache:
+    """
+    Two tier memoization of indicator results.
+
+    The first tier is an in-process LRU bounded by the number of bytes of the cached values, the
+    second an optional folder of .npz files shared by every process and every run. Entries are keyed
+    by the function, a hash of the code of its module, a content hash of the input data and the
+    parameters, so the same prices under another ticker name or in another backtest hit the same
+    entry and a change of the indicator code misses the entries computed before.
+
+    The disk tier is bounded as well: once its files exceed disk_max_bytes the least recently used
+    ones (a disk hit touches the mtime of its file) are removed. Every process counts the bytes it
+    writes from the size of the folder when it opened it and rescans the folder before evicting,
+    since the other processes write into it too.
+
+    Parameters:
+    - max_bytes (int): memory bound of the LRU tier. Default is 256MB, 0 disables it.
+    - disk_folder (str): folder of the disk tier, None to keep the cache in memory only.
+    - disk_max_bytes (int): bound of the disk tier, DISK_MAX_BYTES by default.
+    """
+    def __init__(self, max_bytes = 256*2**20, disk_folder = None, disk_max_bytes = DISK_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.disk_folder = disk_folder
+        self.disk_max_bytes = disk_max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+        if disk_folder is not None:
+            os.makedirs(disk_folder, exist_ok=True)
+            self.disk_bytes = sum(size for _, size, _ in self._diskFiles())
+
+    def _diskPath(self, key):
+        return os.path.join(self.disk_folder, f'{key}.npz')
+
+    def get(self, key):
+        """
+            Cached (columns, values) of key, None on a miss. Disk hits are promoted to memory.
+        """
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+        if self.disk_folder is not None and os.path.exists(self._diskPath(key)):
+            try:
+                with np.load(self._diskPath(key)) as entry:
+                    columns, values = [str(column) for column in entry['columns']], entry['values']
+            except OSError:
+                # evicted by another process meanwhile
+                self.misses += 1
+                return None
+            try:
+                os.utime(self._diskPath(key))
+            except OSError:
+                pass
+            self.disk_hits += 1
+            self._remember(key, (columns, values))
+            return columns, values
+        self.misses += 1
+        return None
+
+    def put(self, key, columns, values):
+        self._remember(key, (columns, values))
+        if self.disk_folder is not None:
+            # written under a temporary name and renamed, so concurrent workers never read half a file
+            tmp_path = os.path.join(self.disk_folder, f'{key}.{os.getpid()}.tmp.npz')
+            np.savez(tmp_path, columns=np.array(columns, dtype=str), values=values)
+            self.disk_bytes += os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._diskPath(key))
+            if self.disk_bytes > self.disk_max_bytes:
+                self._evictDisk()
+
+    def _diskFiles(self):
+        """
+            (path, size, mtime) of every entry of the disk tier.
+        """
+        files = []
+        for entry in os.scandir(self.disk_folder):
+            if not entry.name.endswith('.npz') or entry.name.endswith('.tmp.npz'): continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue
+            files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+        return files
+
+    def _evictDisk(self):
+        """
+            Removes the least recently used files of the disk tier until it fits in disk_max_bytes.
+        """
+        files = sorted(self._diskFiles(), key=lambda file: file[2])
+        self.disk_bytes = sum(size for _, size, _ in files)
+        for path, size, _ in files:
+            if self.disk_bytes <= self.disk_max_bytes: break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self.disk_bytes -= size
+            self.disk_evictions += 1
+
+    def _remember(self, key, entry):
+        size = entry[1].nbytes
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self.nbytes -= self.entries.pop(key)[1].nbytes
+        self.entries[key] = entry
+        self.nbytes += size
+        while self.nbytes > self.max_bytes:
+            _, (_, values) = self.entries.popitem(last=False)
+            self.nbytes -= values.nbytes
+            self.evictions += 1
+
+    def clear(self):
+        """
+            Empties the memory tier and resets the counters, the disk tier is kept.
+        """
+        self.entries.clear()
+        self.nbytes = 0
+        self.hits = self.disk_hits = self.misses = self.evictions = self.disk_evictions = 0
+
+    def info(self):
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "disk_evictions": self.disk_evictions,
+            "entries": len(self.entries),
+            "bytes": self.nbytes
+        }
+
+
+# cache used by cachedIndicator unless another one is given, one per process
+INDICATOR_CACHE = IndicatorCache()
+
+
+def configureCache(max_bytes = 256*2**20, disk_folder = None, disk_max_bytes = DISK_MAX_BYTES):
+    """
+        Replaces the process wide cache, e.g. as the initializer of a process pool so that every
+        worker uses the same disk tier.
+    """
+    global INDICATOR_CACHE
+    INDICATOR_CACHE = IndicatorCache(max_bytes, disk_folder, disk_max_bytes)
+    return INDICATOR_CACHE
+
+
+def cacheInfo():
+    return INDICATOR_CACHE.info()
+
+
+def _hasColumn(stock_df, column):
+    if isinstance(stock_df, (pd.DataFrame, dict)):
+        return column in stock_df
+    return hasattr(stock_df, column)
+
+
+def dataHash(stock_df):
+    """
+        Content hash of the price columns of stock_df (a DataFrame or the arrays accepted by the
+        indicators, see priceColumn in utils/indicators.py). Column names, dtypes and lengths are
+        part of the hash, the index is not since the indicators only depend on the values.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for column in PRICE_COLUMNS:
+        if not _hasColumn(stock_df, column): continue
+        values = np.asarray(stock_df[column] if isinstance(stock_df, (pd.DataFrame, dict)) else getattr(stock_df, column))
+        digest.update(f'{column}:{values.dtype.str}:{values.shape[0]};'.encode())
+        digest.update(np.ascontiguousarray(values).data)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def codeHash(module_name):
+    """
+        Hash of the source file of the module module_name, so that cached results are not reused
+        once the code of the indicators (or of the helpers of their module) changed.
+    """
+    path = getattr(sys.modules[module_name], '__file__', None)
+    if path is None:
+        return module_name
+    with open(path, 'rb') as f:
+        return hashlib.blake2b(f.read(), digest_size=8).hexdigest()
+
+
+def cachedIndicator(func, cache = None):
+    """
+    Memoizes an indicator function of utils/indicators.py (stock_df first, parameters after, a
+    DataFrame returned). The wrapper keeps the name of func, so it can be passed to Strategy.I
+    without changing the indicator labels of the plots.
+
+    Parameters:
+    - func (callable): the indicator function.
+    - cache (IndicatorCache): cache to use, None for the process wide INDICATOR_CACHE.
+    """
+    @functools.wraps(func)
+    def wrapper(stock_df, *args, **kwargs):
+        store = cache if cache is not None else INDICATOR_CACHE
+        # numpy scalars (parameters read from opt_params) are keyed like the python numbers they hold
+        params = repr(tuple(arg.item() if isinstance(arg, np.generic) else arg for arg in args)
+                      + tuple((name, value.item() if isinstance(value, np.generic) else value) for name, value in sorted(kwargs.items())))
+        key = f'{func.__module__}.{func.__name__}|{codeHash(func.__module__)}|{dataHash(stock_df)}|{params}'
+        key = hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+        entry = store.get(key)
+        if entry is None:
+            result = func(stock_df, *args, **kwargs)
+            if not isinstance(result, pd.DataFrame):
+                return result
+            entry = (list(result.columns), result.to_numpy(dtype=np.float64))
+            store.put(key, *entry)
+        columns, values = entry
+        # a copy, callers (Strategy.I) keep views on what they receive
+        index = stock_df.index if isinstance(stock_df, pd.DataFrame) else None
+        return pd.DataFrame(values.copy(), index=index, columns=columns)
+    return wrapper
@@ -0,0 +1,633 @@
+import os
+import json
+import shutil
+import hashlib
+import argparse
+from glob import glob
+
+import numpy as np
+import pandas as pd
+
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# precision of the prices of a store and of the frames read from it. float64 stores keep the OHLCV of
+# all tickers in one float64 array, float32 stores keep float32 prices and an integer volume array
+PRECISIONS = {
+    "float64": np.float64,
+    "float32": np.float32
+}
+
+# stores opened by this process, so that worker processes map every store only once
+_stores = {}
+
+# mtime/size recorded for the tickers written directly into the store, which have no csv file
+STORE_ONLY = -1
+
+# chunks a store can have before a write rewrites it into a single chunk, see _saveStore
+MAX_CHUNKS = 16
+
+# in-sample (optimization) and out-of-sample (evaluation) periods, applied when the data is read
+SPLITS = {
+    "insample": ('2022-04-01', '2022-06-30'),
+    "outsample": ('2022-07-01', '2022-07-31')
+}
+
+# differences between float32 and float64 bars accepted by comparePrecision: relative difference of
+# the indicators and difference of the return of a backtest in percentage points
+PRECISION_TOLERANCE = {
+    "indicators": 1e-4,
+    "return_pp": 0.01
+}
+
+
+def tickerFromPath(stock_name):
+    """
+        Extracts the ticker (e.g. sh-600006) from a path like ./data/raw/history/history_stock_sh-600006.csv
+    """
+    file_name = os.path.basename(stock_name.replace('\\', '/'))
+    return os.path.splitext(file_name)[0].split('_')[-1]
+
+
+def storeFolder(data_folder):
+    """
+        The store of ./data/raw/history lives next to it in ./data/raw/history.store
+    """
+    return os.path.normpath(data_folder) + '.store'
+
+
+def _fileSignature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _timestamps(stock_df):
+    """
+        Bar timestamps as int64 nanoseconds since epoch, taken from the baostock 'Time' column
+        (yyyymmddHHMMSSfff) or the 'Date' column for daily data.
+    """
+    if 'Time' in stock_df:
+        return pd.to_datetime(stock_df.Time.astype(str), format='%Y%m%d%H%M%S%f').values.astype('datetime64[ns]').astype('int64')
+    if 'Date' in stock_df:
+        return pd.to_datetime(stock_df.Date).values.astype('datetime64[ns]').astype('int64')
+    return np.arange(stock_df.shape[0], dtype='int64')
+
+
+def _volumeArray(volume):
+    """
+        Volumes as integers: int32, or int64 when a volume does not fit. Missing volumes become 0.
+    """
+    volume = np.rint(np.nan_to_num(np.asarray(volume, dtype=np.float64)))
+    fits = volume.size == 0 or np.abs(volume).max() <= np.iinfo(np.int32).max
+    return volume.astype(np.int32 if fits else np.int64)
+
+
+def _generationName(store_folder):
+    """
+        Name of the current generation of the store (e.g. gen-000003), read from its CURRENT file.
+        None for a store written before the generations (the flat layout) or not written yet.
+    """
+    try:
+        with open(os.path.join(store_folder, 'CURRENT')) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _saveChunk(folder, chunk, entries, precision):
+    """
+        Writes the bars of entries stacked one after the other as the chunk files of folder, the
+        prices in precision. Returns the offsets of the entries in the chunk.
+    """
+    blocks = [ohlcv for _, ohlcv, _, _, _ in entries if ohlcv.shape[0]]
+    timestamps = [stamps for _, ohlcv, stamps, _, _ in entries if ohlcv.shape[0]]
+    ohlcv = np.concatenate(blocks) if blocks else np.empty((0, len(OHLCV_COLUMNS)))
+    lengths = np.array([entry[1].shape[0] for entry in entries], dtype=np.int64)
+    arrays = {"ohlcv": ohlcv} if precision == 'float64' else \
+        {"prices": ohlcv[:, :4].astype(PRECISIONS[precision]), "volume": _volumeArray(ohlcv[:, 4])}
+    arrays["timestamps"] = np.concatenate(timestamps).astype(np.int64) if timestamps else np.empty(0, dtype=np.int64)
+    for name, array in arrays.items():
+        np.save(os.path.join(folder, f'{name}-{chunk}.npy'), array)
+    return np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+
+
+def _chunkFiles(chunk, precision):
+    return [f'{name}-{chunk}.npy' for name in (['ohlcv'] if precision == 'float64' else ['prices', 'volume']) + ['timestamps']]
+
+
+def _linkFile(source, destination):
+    """
+        Hard links source to destination, copies it on file systems without hard links.
+    """
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copy2(source, destination)
+
+
+def _reusableStore(store, written, precision):
+    """
+        store when a write of the tickers written can keep the chunks of its other tickers, None
+        when the whole store has to be rewritten: store in the flat layout or in another precision,
+        too many chunks, or more bars of replaced tickers left in the chunks than bars still used.
+    """
+    if store is None or store['folder'] is None or store['precision'] != precision or len(store['chunks']) >= MAX_CHUNKS:
+        return None
+    live = sum(length for ticker, (_, _, length, _, _) in store['tickers'].items() if ticker not in written)
+    total = sum(chunk['timestamps'].shape[0] for chunk in store['chunks'].values())
+    return store if total - live <= live else None
+
+
+def _saveStore(store_folder, data_folder, entries, precision = 'float64', store = None):
+    """
+    Writes a new generation of the store from entries, a list of (ticker, ohlcv, timestamps, mtime,
+    size) tuples, with the prices in precision (see PRECISIONS). The other tickers of store (the
+    opened previous store, None to write entries only) are kept.
+
+    Every generation is a directory of its own (gen-000000, gen-000001...) holding the index, the
+    store.json and the chunk files of its tickers, and the CURRENT file of the store names the
+    current one. The new generation is complete before CURRENT is replaced, a single os.replace, so
+    a reader (see openStore) sees either the previous store or the new one and an interrupted write
+    leaves the previous store intact. The entries are written into one new chunk and the chunks of
+    the kept tickers are hard linked from the previous generation, so a write costs the bars of the
+    written tickers only. The whole store is rewritten into a single chunk when the chunks of the
+    previous generation cannot be kept, see _reusableStore.
+    """
+    os.makedirs(store_folder, exist_ok=True)
+    written = {entry[0] for entry in entries}
+    reusable = _reusableStore(store, written, precision)
+    if reusable is None and store is not None:
+        entries = entries + _storeEntries(store, [ticker for ticker in store['tickers'] if ticker not in written])
+    entries = sorted(entries, key=lambda entry: entry[0])
+
+    previous = _generationName(store_folder)
+    name = f'gen-{int(previous.split("-")[-1]) + 1 if previous else 0:06d}'
+    generation = os.path.join(store_folder, name)
+    # left by an interrupted write
+    shutil.rmtree(generation, ignore_errors=True)
+    os.makedirs(generation)
+
+    locations = {}
+    if reusable is not None:
+        locations = {ticker: location for ticker, location in reusable['tickers'].items() if ticker not in written}
+        for chunk in {location[0] for location in locations.values()}:
+            for file_name in _chunkFiles(chunk, precision):
+                _linkFile(os.path.join(reusable['folder'], file_name), os.path.join(generation, file_name))
+    chunk = max(reusable['chunks'], default=-1) + 1 if reusable is not None else 0
+    offsets = _saveChunk(generation, chunk, entries, precision)
+    for (ticker, ohlcv, _, mtime, size), offset in zip(entries, offsets):
+        locations[ticker] = (chunk, int(offset), ohlcv.shape[0], mtime, size)
+
+    tickers = sorted(locations)
+    columns = np.array([locations[ticker] for ticker in tickers], dtype=np.int64).reshape(-1, 5)
+    np.savez(os.path.join(generation, 'index.npz'),
+             tickers=np.array(tickers, dtype=str),
+             chunks=columns[:, 0],
+             offsets=columns[:, 1],
+             lengths=columns[:, 2],
+             mtimes=columns[:, 3],
+             sizes=columns[:, 4],
+             precision=np.array(precision))
+    with open(os.path.join(generation, 'store.json'), 'w') as f:
+        json.dump({"data_folder": data_folder, "columns": OHLCV_COLUMNS, "precision": precision,
+                   "tickers": len(tickers), "bars": int(columns[:, 2].sum()), "chunks": len(set(columns[:, 0]))}, f, indent=4)
+
+    with open(os.path.join(store_folder, 'CURRENT.tmp'), 'w') as f:
+        f.write(name)
+    os.replace(os.path.join(store_folder, 'CURRENT.tmp'), os.path.join(store_folder, 'CURRENT'))
+    _stores.pop(store_folder, None)
+
+    # the previous generations and the files of the flat layout. Mapped files stay readable by the
+    # processes that opened them, a file still in use on Windows is removed by a later write
+    for folder in glob(os.path.join(store_folder, 'gen-*')):
+        if os.path.basename(folder) != name:
+            shutil.rmtree(folder, ignore_errors=True)
+    for file_name in ['index.npz', 'ohlcv.npy', 'prices.npy', 'volume.npy', 'store.json']:
+        try:
+            os.remove(os.path.join(store_folder, file_name))
+        except OSError:
+            pass
+
+
+def _tickerArray(store, ticker, name):
+    """
+        The bars of ticker in the array name (prices, volume, ohlcv or timestamps) of its chunk.
+    """
+    chunk, offset, length, _, _ = store['tickers'][ticker]
+    return store['chunks'][chunk][name][offset:offset + length]
+
+
+def _storeEntries(store, tickers = None):
+    """
+        The tickers of an opened store (all of them, or those of tickers) as in-memory entries for _saveStore.
+    """
+    if store is None:
+        return []
+    return [(ticker, np.column_stack([_tickerArray(store, ticker, 'prices'), _tickerArray(store, ticker, 'volume')]).astype(np.float64),
+             np.array(_tickerArray(store, ticker, 'timestamps')), *store['tickers'][ticker][3:])
+            for ticker in (store['tickers'] if tickers is None else tickers)]
+
+
+def storePrecision(data_folder, precision = None):
+    """
+        precision when given, otherwise the precision of the existing store of data_folder, float64
+        for a new store. Writes keep the precision of the store unless asked otherwise.
+    """
+    if precision is not None:
+        return precision
+    store = openStore(data_folder)
+    return store['precision'] if store is not None else 'float64'
+
+
+def buildStore(data_folder, store_folder = None, precision = None):
+    """
+    Converts every history_stock_*.csv of data_folder into a typed columnar store.
+
+    The store holds the OHLCV and the int64 timestamps of all tickers stacked one after the other,
+    saved as .npy so that they can be memory mapped, and an index with the ticker names, the offset
+    and length of every ticker in those arrays and the mtime/size of the csv every ticker was built
+    from. Tickers written directly into the store with writeStore and without a csv file are kept.
+    The string columns of the csv files (date, time, code, adjustflag) are not stored. Later writes
+    of some tickers (writeStore, appendStore) add chunks of arrays, see _saveStore.
+
+    A float64 store is a single float64 (bars x 5) OHLCV array. A float32 store is a float32
+    (bars x 4) price array and an int32 volume array (int64 when a volume does not fit), 20 bytes
+    per bar instead of 40 (plus the 8 bytes of the timestamp).
+
+    Parameters:
+    - data_folder (str): folder containing the csv files, e.g. ./data/raw/history
+    - store_folder (str): where to write the store. Default is storeFolder(data_folder).
+    - precision (str): one of PRECISIONS, None keeps the precision of the existing store.
+
+    Returns:
+    - store_folder (str): folder the store was written to.
+    """
+    store_folder = store_folder or storeFolder(data_folder)
+
+    entries = []
+    for stock_name in sorted(glob(f'{data_folder}/*.csv')):
+        # the signature is taken before reading so a file rewritten meanwhile is seen as stale
+        mtime, size = _fileSignature(stock_name)
+        stock_df = pd.read_csv(stock_name, index_col=False)
+        ohlcv = stock_df[OHLCV_COLUMNS].to_numpy(dtype=np.float64) if stock_df.shape[0] else np.empty((0, len(OHLCV_COLUMNS)))
+        entries.append((tickerFromPath(stock_name), ohlcv, _timestamps(stock_df), mtime, size))
+
+    from_csv = {entry[0] for entry in entries}
+    existing = openStore(data_folder) if store_folder == storeFolder(data_folder) else None
+    entries += [entry for entry in _storeEntries(existing) if entry[3] == STORE_ONLY and entry[0] not in from_csv]
+    _saveStore(store_folder, data_folder, entries, storePrecision(data_folder, precision))
+    return store_folder
+
+
+def _stockArrays(stock_df):
+    ohlcv = stock_df[OHLCV_COLUMNS].to_numpy(dtype=np.float64) if stock_df.shape[0] else np.empty((0, len(OHLCV_COLUMNS)))
+    return ohlcv, _timestamps(stock_df)
+
+
+def writeStore(data_folder, frames, precision = None):
+    """
+    Writes downloaded histories directly into the store of data_folder, without csv files. The
+    other tickers of the store are kept, the tickers of frames are replaced.
+
+    Parameters:
+    - data_folder (str): folder the store belongs to, e.g. ./data/raw/history
+    - frames (dict): ticker (e.g. sh-600006) -> DataFrame with the OHLCV columns and the baostock
+      Date/Time columns.
+    - precision (str): one of PRECISIONS, None keeps the precision of the existing store.
+
+    Returns:
+    - store_folder (str): folder the store was written to.
+    """
+    store_folder = storeFolder(data_folder)
+    entries = [(ticker, *_stockArrays(stock_df), STORE_ONLY, STORE_ONLY) for ticker, stock_df in frames.items()]
+    _saveStore(store_folder, data_folder, entries, storePrecision(data_folder, precision), openStore(data_folder))
+    return store_folder
+
+
+def appendStore(data_folder, frames, precision = None):
+    """
+    Appends newly downloaded bars to the tickers of the store of data_folder. Bars are deduplicated
+    on their timestamp (the baostock Date/Time columns), a bar downloaded again replacing the stored
+    one, and kept sorted in time. Only the tickers of frames are read and written again, the other
+    tickers keep their chunks (see _saveStore), and an interrupted append leaves the previous store
+    intact.
+
+    Parameters:
+    - data_folder (str): folder the store belongs to, e.g. ./data/raw/history
+    - frames (dict): ticker -> DataFrame of new bars with the OHLCV and Date/Time columns.
+    - precision (str): one of PRECISIONS, None keeps the precision of the existing store.
+
+    Returns:
+    - store_folder (str): folder the store was written to.
+    """
+    store_folder = storeFolder(data_folder)
+    store = openStore(data_folder)
+    stored = {entry[0]: entry for entry in _storeEntries(store, [ticker for ticker in frames if ticker in store['tickers']])} if store is not None else {}
+    entries = []
+    for ticker, stock_df in frames.items():
+        ohlcv, timestamps = _stockArrays(stock_df)
+        if ticker in stored:
+            ohlcv = np.concatenate([stored[ticker][1], ohlcv])
+            timestamps = np.concatenate([stored[ticker][2], timestamps])
+        # stable sort: of equal timestamps the newly downloaded bar comes last and is the one kept
+        order = np.argsort(timestamps, kind='stable')
+        ohlcv, timestamps = ohlcv[order], timestamps[order]
+        last = np.r_[timestamps[1:] != timestamps[:-1], True]
+        entries.append((ticker, ohlcv[last], timestamps[last], STORE_ONLY, STORE_ONLY))
+    _saveStore(store_folder, data_folder, entries, storePrecision(data_folder, precision), store)
+    return store_folder
+
+
+def storedRanges(data_folder):
+    """
+        ticker -> (first, last) timestamps (int64 nanoseconds) of the bars of every non empty ticker of the store of data_folder.
+    """
+    store = openStore(data_folder)
+    if store is None:
+        return {}
+    return {ticker: (int(timestamps[0]), int(timestamps[-1])) for ticker, timestamps in
+            ((ticker, _tickerArray(store, ticker, 'timestamps')) for ticker in store['tickers']) if len(timestamps)}
+
+
+def dateRange(split = None, start_date = None, end_date = None):
+    """
+        (start_date, end_date) of a split of SPLITS, start_date/end_date overriding its bounds. None
+        when neither a split nor a date is given (no filter).
+    """
+    start, end = SPLITS[split] if split is not None else (None, None)
+    start, end = start_date or start, end_date or end
+    if start is None and end is None:
+        return None
+    return start, end
+
+
+def _dateMask(timestamps, date_range):
+    """
+        Bars of timestamps within date_range, both dates included.
+    """
+    start, end = date_range
+    mask = np.ones(timestamps.shape[0], dtype=bool)
+    if start is not None:
+        mask &= timestamps >= pd.Timestamp(start).value
+    if end is not None:
+        mask &= timestamps < (pd.Timestamp(end) + pd.Timedelta(days=1)).value
+    return mask
+
+
+def _openChunk(folder, chunk, precision):
+    arrays = {"timestamps": np.load(os.path.join(folder, f'timestamps-{chunk}.npy'), mmap_mode='r')}
+    if precision == 'float64':
+        ohlcv = np.load(os.path.join(folder, f'ohlcv-{chunk}.npy'), mmap_mode='r')
+        return {**arrays, "ohlcv": ohlcv, "prices": ohlcv[:, :4], "volume": ohlcv[:, 4]}
+    return {**arrays, **{name: np.load(os.path.join(folder, f'{name}-{chunk}.npy'), mmap_mode='r') for name in ['prices', 'volume']}}
+
+
+def _openGeneration(store_folder):
+    """
+        The store of the current generation of store_folder, or of its flat layout (the store
+        written before the generations: one index.npz holding the timestamps and the array files
+        in store_folder, read as a single chunk 0). None if there is neither.
+    """
+    name = _generationName(store_folder)
+    folder = os.path.join(store_folder, name) if name is not None else None
+    if folder is None and not os.path.exists(os.path.join(store_folder, 'index.npz')):
+        return None
+    index = np.load(os.path.join(folder or store_folder, 'index.npz'))
+    # stores written before the precision was recorded are float64
+    precision = str(index['precision']) if 'precision' in index.files else 'float64'
+    if folder is not None:
+        chunks = {int(chunk): _openChunk(folder, int(chunk), precision) for chunk in np.unique(index['chunks'])}
+    else:
+        if precision == 'float64':
+            ohlcv = np.load(os.path.join(store_folder, 'ohlcv.npy'), mmap_mode='r')
+            arrays = {"ohlcv": ohlcv, "prices": ohlcv[:, :4], "volume": ohlcv[:, 4]}
+        else:
+            arrays = {name: np.load(os.path.join(store_folder, f'{name}.npy'), mmap_mode='r') for name in ['prices', 'volume']}
+        chunks = {0: {**arrays, "timestamps": index['timestamps']}}
+    ticker_chunks = index['chunks'] if folder is not None else np.zeros(len(index['tickers']), dtype=np.int64)
+    return {
+        "precision": precision,
+        "folder": folder,
+        "chunks": chunks,
+        "tickers": {
+            str(ticker): (int(chunk), int(offset), int(length), int(mtime), int(size))
+            for ticker, chunk, offset, length, mtime, size in zip(index['tickers'], ticker_chunks, index['offsets'], index['lengths'],
+                                                                  index['mtimes'], index['sizes'])
+        }
+    }
+
+
+def openStore(data_folder):
+    """
+    Opens the store built from data_folder, None if it has not been built yet.
+
+    Returns:
+    - store (dict): 'precision', 'folder' (of the generation, None for the flat layout), 'chunks'
+      mapping every chunk to its 'prices' ((bars x 4) Open/High/Low/Close), 'volume' (read-only
+      memmaps, views of the single 'ohlcv' memmap of a float64 store) and 'timestamps', and
+      'tickers' mapping every ticker to (chunk, offset, length, mtime, size), mtime and size being
+      STORE_ONLY for tickers without csv file.
+    """
+    store_folder = storeFolder(data_folder)
+    if store_folder in _stores:
+        return _stores[store_folder]
+    for attempt in range(3):
+        try:
+            store = _openGeneration(store_folder)
+            break
+        except FileNotFoundError:
+            # a write replaced the generation between reading CURRENT and opening its files
+            if attempt == 2:
+                raise
+    if store is not None:
+        _stores[store_folder] = store
+    return store
+
+
+def _barsFrame(prices, volume, precision = None):
+    """
+        OHLCV DataFrame of the price and volume arrays of a ticker in precision: None keeps the dtypes
+        of the arrays, float64 gives the float64 frame of a csv file, float32 float32 prices and an
+        integer volume.
+    """
+    if precision == 'float64':
+        volume = np.asarray(volume, dtype=np.float64)
+    elif precision is not None:
+        volume = _volumeArray(volume) if volume.dtype.kind == 'f' else volume
+    dtype = PRECISIONS[precision] if precision is not None else prices.dtype
+    columns = {column: np.asarray(prices[:, k], dtype=dtype) for k, column in enumerate(OHLCV_COLUMNS[:4])}
+    return pd.DataFrame({**columns, "Volume": np.asarray(volume)})
+
+
+def readStockData(stock_name, store = None, date_range = None, precision = None):
+    """
+    Loads the history of one ticker, from the store when it is up to date with the csv file and
+    from the csv file otherwise. Tickers written with writeStore have no csv file and are always
+    read from the store.
+
+    Parameters:
+    - stock_name (str): path to the history_stock_*.csv file of the ticker.
+    - store (dict): store opened with openStore, None to always read the csv.
+    - date_range (tuple): (start_date, end_date) of the bars to load, both included, see dateRange.
+      None loads every bar. This is how the in-sample and out-of-sample periods are taken from one
+      continuous history.
+    - precision (str): one of PRECISIONS. float64 loads float64 OHLCV whatever the store holds,
+      float32 loads float32 prices and an integer volume. None keeps the dtypes of the store (or
+      of the csv file).
+
+    Returns:
+    - stock_df (DataFrame): with at least the Open, High, Low, Close and Volume columns.
+    """
+    ticker = tickerFromPath(stock_name)
+    if store is not None and ticker in store['tickers']:
+        _, _, _, mtime, size = store['tickers'][ticker]
+        if mtime == STORE_ONLY or _fileSignature(stock_name) == (mtime, size):
+            prices, volume = _tickerArray(store, ticker, 'prices'), _tickerArray(store, ticker, 'volume')
+            if date_range is not None:
+                mask = _dateMask(_tickerArray(store, ticker, 'timestamps'), date_range)
+                prices, volume = prices[mask], volume[mask]
+            return _barsFrame(prices, volume, precision)
+    stock_df = pd.read_csv(stock_name, index_col=False)
+    if date_range is not None and stock_df.shape[0]:
+        stock_df = stock_df[_dateMask(_timestamps(stock_df), date_range)].reset_index(drop=True)
+    if precision is None or stock_df.shape[0] == 0:
+        return stock_df
+    stock_df = stock_df.astype({column: PRECISIONS[precision] for column in OHLCV_COLUMNS[:4]})
+    return stock_df if precision == 'float64' else stock_df.assign(Volume=_volumeArray(stock_df['Volume']))
+
+
+def readStockTimestamps(stock_name, store = None, date_range = None):
+    """
+        Timestamps (int64 nanoseconds since epoch) of the bars readStockData(stock_name, store,
+        date_range) loads, in the same order.
+    """
+    ticker = tickerFromPath(stock_name)
+    if store is not None and ticker in store['tickers']:
+        _, _, _, mtime, size = store['tickers'][ticker]
+        if mtime == STORE_ONLY or _fileSignature(stock_name) == (mtime, size):
+            timestamps = _tickerArray(store, ticker, 'timestamps')
+            return timestamps if date_range is None else timestamps[_dateMask(timestamps, date_range)]
+    timestamps = _timestamps(pd.read_csv(stock_name, index_col=False))
+    return timestamps if date_range is None else timestamps[_dateMask(timestamps, date_range)]
+
+
+def stockDataHash(stock_name, store = None, date_range = None):
+    """
+        Content hash of the data readStockData(stock_name, store, date_range) loads: the bytes of
+        its csv file (the store is built from it) or of the ticker in the store for the tickers
+        written directly into the store, plus the date range. Used to recognize tickers whose data
+        did not change since a previous run.
+    """
+    digest = hashlib.blake2b(repr(date_range).encode(), digest_size=16)
+    ticker = tickerFromPath(stock_name)
+    if store is not None and ticker in store['tickers']:
+        if store['tickers'][ticker][3] == STORE_ONLY:
+            # the arrays of the store, so the hash also changes with the precision of the store
+            for name in ['ohlcv'] if store['precision'] == 'float64' else ['prices', 'volume']:
+                digest.update(np.ascontiguousarray(_tickerArray(store, ticker, name)).data)
+            digest.update(np.ascontiguousarray(_tickerArray(store, ticker, 'timestamps')).data)
+            return digest.hexdigest()
+    with open(stock_name, 'rb') as f:
+        digest.update(f.read())
+    return digest.hexdigest()
+
+
+def listStockNames(data_folder):
+    """
+        Paths of the history_stock_*.csv files of data_folder, including the tickers that only
+        exist in its store (their path is where their csv would be, see readStockData).
+    """
+    stock_names = {tickerFromPath(stock_name): stock_name for stock_name in glob(f'{data_folder}/*.csv')}
+    store = openStore(data_folder)
+    if store is not None:
+        for ticker, (_, _, _, mtime, _) in store['tickers'].items():
+            if mtime == STORE_ONLY and ticker not in stock_names:
+                stock_names[ticker] = f'{data_folder}/history_stock_{ticker}.csv'
+    return sorted(stock_names.values())
+
+
+def comparePrecision(stock_names, date_range = None, strategies = ('bb', 'macd')):
+    """
+    Compares the float32 bars to the float64 ones on every ticker of stock_names: the memory of the
+    bars (csv DataFrame, float64 and float32 frames, timestamps included), the largest difference
+    of the indicators used by the strategies relative to the float64 values and the backtests of
+    the vectorized engine run on a float64 and on a float32 panel. The float64 bars are only exact
+    when read from the csv files or a float64 store.
+
+    Returns:
+    - memory (dict): bytes of the bars of all tickers in every representation.
+    - indicators (DataFrame): max relative difference of every indicator column over the tickers.
+    - backtests (DataFrame): per strategy, the tickers whose trade count differs and the largest
+      difference of the return [%] and of the final equity.
+    """
+    from utils.indicators import bollingerBands, relativeStrengthIndex, movingAverageConverganceDivergance
+    from utils.vectorized import loadPanel, runVectorizedBacktest
+
+    indicators = {
+        "bollingerBands": lambda df: bollingerBands(df, 30),
+        "relativeStrengthIndex": lambda df: relativeStrengthIndex(df, 14, 3),
+        "movingAverageConverganceDivergance": lambda df: movingAverageConverganceDivergance(df, 'EMA', 'EMA', 26, 12, 9)
+    }
+    memory = {"csv": 0, "float64": 0, "float32": 0}
+    errors = {}
+    for stock_name in stock_names:
+        store = openStore(os.path.dirname(stock_name))
+        frames = {precision: readStockData(stock_name, store, date_range, precision) for precision in PRECISIONS}
+        if frames['float64'].shape[0] == 0: continue
+        if os.path.exists(stock_name):
+            memory['csv'] += int(readStockData(stock_name, None, date_range).memory_usage(deep=True).sum())
+        for precision, stock_df in frames.items():
+            memory[precision] += int(stock_df[OHLCV_COLUMNS].memory_usage(index=False).sum()) + 8*stock_df.shape[0]
+        for name, indicator in indicators.items():
+            exact, compact = (pd.DataFrame(indicator(frames[precision])).reset_index(drop=True) for precision in PRECISIONS)
+            scale = exact.abs().max().replace(0, np.nan)
+            for column in exact.columns:
+                error = ((compact[column] - exact[column]).abs().max()/scale[column])
+                errors[(name, column)] = np.nanmax([errors.get((name, column), 0), error])
+
+    files = {tickerFromPath(stock_name): stock_name for stock_name in stock_names}
+    panels = {precision: loadPanel(files, date_range, precision) for precision in PRECISIONS}
+    backtests = []
+    for strategy_name in strategies:
+        outcomes = {}
+        for precision, (panel, lengths) in panels.items():
+            equity, trades, _ = runVectorizedBacktest(panel, lengths, strategy_name)
+            final = equity[lengths - 1, np.arange(len(lengths))]
+            outcomes[precision] = (final, trades.groupby('Ticker').size().reindex(panel['Close'].columns, fill_value=0).values)
+        (final64, count64), (final32, count32) = outcomes['float64'], outcomes['float32']
+        backtests.append({
+            "strategy": strategy_name,
+            "tickers": len(final64),
+            "trade_count_differs": int((count64 != count32).sum()),
+            "max_return_diff_pp": float(np.max(np.abs(final32 - final64))/10_000*100) if len(final64) else 0.0,
+            "max_equity_diff": float(np.max(np.abs(final32 - final64))) if len(final64) else 0.0
+        })
+    indicators = pd.DataFrame([{"indicator": name, "column": column, "max_rel_diff": error} for (name, column), error in errors.items()])
+    return memory, indicators, pd.DataFrame(backtests)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='Stock Data Store',
+                    description='converts the downloaded csv files into a memory mappable store read by main.py')
+    parser.add_argument('--data_folders', nargs='+', default=["./data/raw/history"])
+    parser.add_argument('--precision', default=None, choices=list(PRECISIONS.keys()), help="\
+                        precision of the prices of the store, by default the precision of the existing store (float64 for a new one)")
+    parser.add_argument('--check', action='store_true', help="\
+                        compares the float32 bars to the float64 ones (memory, indicators, backtests) instead of building the stores")
+    args = parser.parse_args()
+
+    for data_folder in args.data_folders:
+        if not os.path.exists(data_folder) and openStore(data_folder) is None:
+            print(f"{data_folder} not found, skipping")
+            continue
+        if not args.check:
+            print(f"{data_folder} -> {buildStore(data_folder, precision=args.precision)}")
+            continue
+        memory, indicators, backtests = comparePrecision(listStockNames(data_folder))
+        print(f"{data_folder}: bars in memory, " + ", ".join(f"{name} {size/2**20:.2f} MB" for name, size in memory.items() if size))
+        print(indicators.to_string(index=False))
+        print(backtests.to_string(index=False))
+        within = indicators['max_rel_diff'].max() <= PRECISION_TOLERANCE['indicators'] and \
+            (backtests['trade_count_differs'] == 0).all() and backtests['max_return_diff_pp'].max() <= PRECISION_TOLERANCE['return_pp']
+        print(f"float32 {'within' if within else 'NOT within'} the tolerance of float64 {PRECISION_TOLERANCE}")
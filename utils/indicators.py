@@ -1,5 +1,28 @@
+import numpy as np
 import pandas as pd 
 
+
+# bars of the blocks the rolling sums of bollingerBandsBatch restart their cumulative sums on, see _rollingSums 
+ROLLING_BLOCK = 256
+
+
+def priceColumn(stock_df, name): 
+    """
+    Returns the column name ('Open', 'High', 'Low', 'Close' or 'Volume') of the prices as a Series without copying it. 
+
+    The indicators below read their prices through this function, so stock_df can be a DataFrame, a dict of 
+    arrays or any object exposing the columns as array attributes, like the self.data of a backtesting.Strategy. 
+    Float arrays are wrapped in a Series sharing their memory, in their own dtype, instead of being copied into 
+    a new DataFrame: the float32 prices of a float32 store are not copied either, the rolling and ewm kernels 
+    of pandas accumulating in float64 whatever the dtype of their input. Integer arrays are converted to float64. 
+    """
+    column = stock_df[name] if isinstance(stock_df, (pd.DataFrame, dict)) else getattr(stock_df, name)
+    if isinstance(column, pd.Series): 
+        return column
+    values = np.asarray(column)
+    return pd.Series(values if values.dtype.kind == 'f' else values.astype(np.float64), copy=False)
+
+
 def movingAverageConverganceDivergance(stock_df, source_ma_type = 'EMA', 
                                        signal_ma_type = 'EMA', fast_ma_length = 12,
                                         slow_ma_length = 26, signal_ma_length = 9): 
@@ -7,7 +30,7 @@ def movingAverageConverganceDivergance(stock_df, source_ma_type = 'EMA',
         Calculate Moving Average Convergence Divergence (MACD) and related indicators.
 
         Parameters:
-        - stock_df (DataFrame): Pandas containing stock data with 'Close' prices.
+        - stock_df (DataFrame): Pandas containing stock data with 'Close' prices (or arrays, see priceColumn).
         - source_ma_type (str): Type of smoothing for source data. Default is 'EMA' (Exponential Moving Average).
         - signal_ma_type (str): Type of smoothing for signal data. Default is 'EMA' (Exponential Moving Average).
         - fast_ma_length (int): Time period for the fast moving average. Default is 12.
@@ -19,8 +42,9 @@ def movingAverageConverganceDivergance(stock_df, source_ma_type = 'EMA',
         - signal (Series): Signal line.
         - hist (Series): MACD histogram.
     """
-    fast_src = stock_df.Close.ewm(span = fast_ma_length, adjust=False).mean() if source_ma_type == 'EMA' else stock_df.Close.rolling(fast_ma_length).mean()  
-    slow_src = stock_df.Close.ewm(span = slow_ma_length, adjust=False).mean() if source_ma_type == 'EMA' else stock_df.Close.rolling(slow_ma_length).mean()
+    close = priceColumn(stock_df, 'Close')
+    fast_src = close.ewm(span = fast_ma_length, adjust=False).mean() if source_ma_type == 'EMA' else close.rolling(fast_ma_length).mean()  
+    slow_src = close.ewm(span = slow_ma_length, adjust=False).mean() if source_ma_type == 'EMA' else close.rolling(slow_ma_length).mean()
 
     macd = fast_src - slow_src 
     signal = macd.ewm(span = signal_ma_length, adjust=False).mean() if signal_ma_type == 'EMA' else macd.rolling(signal_ma_length).mean()
@@ -44,7 +68,7 @@ def bollingerBands(stock_df, ma_window = 20):
     reversal points.
 
     Parameters:
-    - stock_df (DataFrame): A pandas DataFrame containing stock data, with at least 'Close' prices.
+    - stock_df (DataFrame): A pandas DataFrame containing stock data, with at least 'Close' prices (or arrays, see priceColumn).
     - ma_window (int): The window size for the moving average calculation. default value is 20.
 
     Returns:
@@ -53,8 +77,9 @@ def bollingerBands(stock_df, ma_window = 20):
         - (upper_band, lower_band) (tuple of Series): The upper and lower Bollinger Bands, calculated as 
           deviations from the middle band.
     """
-    basis_ma = stock_df.Close.rolling(ma_window).mean() 
-    deviation = stock_df.Close.rolling(ma_window).std() 
+    close = priceColumn(stock_df, 'Close')
+    basis_ma = close.rolling(ma_window).mean() 
+    deviation = close.rolling(ma_window).std() 
 
     upper_band = basis_ma + 2*deviation 
     lower_band = basis_ma - 2*deviation 
@@ -71,7 +96,7 @@ def relativeStrengthIndex(stock_df, rsi_window = 14, ma_length = 14, smooth_sign
     Calculates the Relative Strength Index (RSI) of a given stock DataFrame.
 
     Parameters:
-    - stock_df (DataFrame): DataFrame containing stock data with at least a 'Close' column.
+    - stock_df (DataFrame): DataFrame containing stock data with at least a 'Close' column (or arrays, see priceColumn).
     - rsi_window (int): Window size for computing the average gain and average loss.
     - ma_length (int): Length of the moving average used for smoothing the RSI.
     - smooth_signal (str): Smoothing technique for the RSI. Options: 'EMA' (Exponential Moving Average)
@@ -82,7 +107,7 @@ def relativeStrengthIndex(stock_df, rsi_window = 14, ma_length = 14, smooth_sign
     - rsi_smooth (Series): Series containing the smoothed RSI values based on the chosen smoothing technique.
     """
 
-    delta = stock_df.Close.diff() 
+    delta = priceColumn(stock_df, 'Close').diff() 
     gains = delta.where(delta>0,0) 
     losses = -delta.where(delta<0,0)
 
@@ -126,9 +151,9 @@ def stochasticIndicator(stock_df, k_period = 14, d_period = 3):
     k_period = 14 
     d_period = 3 
 
-    high_rolling = stock_df.High.rolling(k_period).max() 
-    low_rolling = stock_df.Low.rolling(k_period).min() 
-    percent_k = 100 * (stock_df.Close - low_rolling)/(high_rolling - low_rolling)  
+    high_rolling = priceColumn(stock_df, 'High').rolling(k_period).max() 
+    low_rolling = priceColumn(stock_df, 'Low').rolling(k_period).min() 
+    percent_k = 100 * (priceColumn(stock_df, 'Close') - low_rolling)/(high_rolling - low_rolling)  
 
     smooth_k = percent_k.rolling(d_period).mean() 
     return pd.DataFrame({
@@ -155,9 +180,9 @@ def averageTrueRange(stock_df, period = 14) -> pd.Series:
     Returns:
         pd.Series: A Series containing the Average True Range values.
     """
-    high = stock_df.High 
-    low = stock_df.Low 
-    Close = stock_df.Close 
+    high = priceColumn(stock_df, 'High') 
+    low = priceColumn(stock_df, 'Low') 
+    Close = priceColumn(stock_df, 'Close') 
 
     todays_range = abs(high - low) 
     todays_high_vs_yesterdays_close = abs(high - Close.shift()) 
@@ -169,4 +194,233 @@ def averageTrueRange(stock_df, period = 14) -> pd.Series:
     return pd.DataFrame({
         "atr": atr
     })
-    # return atr 
\ No newline at end of file
+    # return atr 
+
+
+# Batched kernels. 
+# The functions below are companions of the indicators above for parameter sweeps and universe wide runs: 
+# they take a 1-D series or a 2-D (bars x tickers) array of many tickers plus a list of windows and return 
+# stacked numpy arrays of shape (windows x bars x tickers), (windows x bars) for 1-D input. 
+
+def _asPanel(values): 
+    """
+    Returns values as a 2-D float64 (bars x tickers) array and whether the input was 1-D. 
+    """
+    values = np.asarray(values, dtype=np.float64)
+    return (values[:, None], True) if values.ndim == 1 else (values, False)
+
+
+def _unstack(stacked, is_1d): 
+    return stacked[..., 0] if is_1d else stacked
+
+
+def selectPerTicker(stacked, idx): 
+    """
+    Picks one parameterization per ticker out of a (windows x bars x tickers) array. 
+
+    Parameters:
+    - stacked (ndarray): output of one of the batch functions. 
+    - idx (array of int): for every ticker, the position of its window in the windows list. 
+
+    Returns:
+    - ndarray: (bars x tickers) array with column j taken from stacked[idx[j], :, j]. 
+    """
+    idx = np.asarray(idx, dtype=int)
+    return stacked[idx, :, np.arange(len(idx))].T
+
+
+def _rollingSums(values, window, block = ROLLING_BLOCK): 
+    """
+    Rolling sum, rolling sum of squares and number of valid values over window bars, obtained from 
+    cumulative sums restarted every block bars. Every block (with the window - 1 bars before it) is 
+    demeaned on its own mean first, so the sums of squares keep the precision of block bars around 
+    their local level instead of losing it with the length and the drift of the series. The sums are 
+    those of the demeaned values, the means are returned as the offset to add back. 
+    """
+    valid = np.isfinite(values)
+    sums = np.full(values.shape, np.nan)
+    sums_sq = np.full(values.shape, np.nan)
+    counts = np.zeros(values.shape)
+    offset = np.zeros(values.shape)
+    zeros = np.zeros((1, values.shape[1]))
+    for start in range(window - 1, values.shape[0], block): 
+        stop = min(start + block, values.shape[0])
+        segment, segment_valid = values[start - window + 1:stop], valid[start - window + 1:stop]
+        n_valid = segment_valid.sum(axis=0)
+        mean = np.where(segment_valid, segment, 0.0).sum(axis=0)/np.maximum(n_valid, 1)
+        centered = np.where(segment_valid, segment - mean, 0.0)
+        cum = np.concatenate([zeros, np.cumsum(centered, axis=0)])
+        cum_sq = np.concatenate([zeros, np.cumsum(centered**2, axis=0)])
+        cum_n = np.concatenate([zeros, np.cumsum(segment_valid, axis=0)])
+        sums[start:stop] = cum[window:] - cum[:-window]
+        sums_sq[start:stop] = cum_sq[window:] - cum_sq[:-window]
+        counts[start:stop] = cum_n[window:] - cum_n[:-window]
+        offset[start:stop] = mean
+    return sums, sums_sq, counts, offset
+
+
+def bollingerBandsBatch(close, ma_windows = (20,)): 
+    """
+    Bollinger Bands for several windows and many tickers at once. 
+
+    Each window costs one cumulative sum pass over all tickers: the moving average and the standard 
+    deviation come from rolling sums of the closes and of their squares, demeaned block by block (see 
+    _rollingSums) so that the standard deviation stays accurate on long drifting histories. Results 
+    equal bollingerBands up to floating point rounding. A window containing a NaN gives NaN. 
+
+    Parameters:
+    - close (array-like): 1-D close prices or 2-D (bars x tickers) close prices. 
+    - ma_windows (list of int): the moving average windows. 
+
+    Returns:
+    - tuple: (bb_basis, bb_upper, bb_lower), each of shape (windows x bars x tickers). 
+    """
+    values, is_1d = _asPanel(close)
+    basis = np.full((len(ma_windows),) + values.shape, np.nan)
+    deviation = np.full((len(ma_windows),) + values.shape, np.nan)
+    for i, window in enumerate(ma_windows): 
+        if window > values.shape[0]: continue
+        sums, sums_sq, counts, offset = _rollingSums(values, window)
+        complete = counts == window
+        mean = sums/window
+        variance = np.maximum(sums_sq - sums*mean, 0)/(window - 1) if window > 1 else np.full(values.shape, np.nan)
+        basis[i] = np.where(complete, mean + offset, np.nan)
+        deviation[i] = np.where(complete, np.sqrt(variance), np.nan)
+
+    return (_unstack(basis, is_1d), 
+            _unstack(basis + 2*deviation, is_1d), 
+            _unstack(basis - 2*deviation, is_1d))
+
+
+def exponentialMovingAverageBatch(values, spans = (14,), adjust = True, alpha = False): 
+    """
+    Exponential moving averages of many tickers for several spans, one vectorized pass per span. 
+
+    Parameters:
+    - values (array-like): 1-D or 2-D (bars x tickers) values. 
+    - spans (list of int): the spans, or the smoothing factors when alpha is True. 
+    - adjust (bool): same as the adjust argument of pandas ewm. 
+    - alpha (bool): interpret spans as alpha = 1/span (Wilder's smoothing, used by the ATR). 
+
+    Returns:
+    - ndarray: (spans x bars x tickers) 
+    """
+    values, is_1d = _asPanel(values)
+    frame = pd.DataFrame(values)
+    stacked = np.stack([
+        (frame.ewm(alpha = 1/span, adjust=adjust) if alpha else frame.ewm(span = span, adjust=adjust)).mean().values 
+        for span in spans
+    ]) if len(spans) else np.empty((0,) + values.shape)
+    return _unstack(stacked, is_1d)
+
+
+def relativeStrengthIndexBatch(close, rsi_windows = (14,), ma_lengths = (14,), smooth_signal = 'EMA'): 
+    """
+    Relative Strength Index for every rsi_window and its smoothing for every (rsi_window, ma_length) pair. 
+    Average gains and losses are computed once per rsi_window for all tickers. 
+
+    Parameters:
+    - close (array-like): 1-D or 2-D (bars x tickers) close prices. 
+    - rsi_windows (list of int): windows for the average gain and average loss. 
+    - ma_lengths (list of int): lengths of the smoothing moving average. 
+    - smooth_signal (str): 'EMA' or 'SMA', as in relativeStrengthIndex. 
+
+    Returns:
+    - rsi (ndarray): (rsi_windows x bars x tickers) 
+    - rsi_smooth (ndarray): (rsi_windows x ma_lengths x bars x tickers) 
+    """
+    values, is_1d = _asPanel(close)
+    delta = np.diff(values, axis=0, prepend=np.nan)
+    gains = np.where(delta > 0, delta, 0.0)
+    losses = -np.where(delta < 0, delta, 0.0)
+
+    avg_gain = exponentialMovingAverageBatch(gains, rsi_windows)
+    avg_loss = exponentialMovingAverageBatch(losses, rsi_windows)
+    with np.errstate(divide='ignore', invalid='ignore'): 
+        rsi = 100 - (100/(1 + avg_gain/avg_loss))
+
+    rsi_smooth = np.stack([
+        exponentialMovingAverageBatch(rsi_i, ma_lengths) if smooth_signal == 'EMA' else 
+        np.stack([pd.DataFrame(rsi_i).rolling(ma_length).mean().values for ma_length in ma_lengths]) 
+        for rsi_i in rsi
+    ]) if len(rsi_windows) else np.empty((0, len(ma_lengths)) + values.shape)
+    return _unstack(rsi, is_1d), _unstack(rsi_smooth, is_1d)
+
+
+def movingAverageConverganceDiverganceBatch(close, fast_ma_lengths = (12,), slow_ma_lengths = (26,), 
+                                            signal_ma_lengths = (9,), source_ma_type = 'EMA', signal_ma_type = 'EMA'): 
+    """
+    MACD for a list of (fast, slow, signal) combinations, the i-th combination being 
+    (fast_ma_lengths[i], slow_ma_lengths[i], signal_ma_lengths[i]). 
+
+    Each distinct moving average length of the close is computed once for all tickers, then every 
+    combination only subtracts two of them and smooths the difference. 
+
+    Returns:
+    - tuple: (macd, macd_signal, macd_hist), each of shape (combinations x bars x tickers). 
+    """
+    values, is_1d = _asPanel(close)
+    lengths = sorted(set(fast_ma_lengths) | set(slow_ma_lengths))
+    if source_ma_type == 'EMA': 
+        sources = exponentialMovingAverageBatch(values, lengths, adjust=False)
+    else: 
+        sources = np.stack([pd.DataFrame(values).rolling(length).mean().values for length in lengths])
+    position = {length: i for i, length in enumerate(lengths)}
+
+    macd = np.stack([sources[position[fast]] - sources[position[slow]] for fast, slow in zip(fast_ma_lengths, slow_ma_lengths)])
+    signal = np.empty_like(macd)
+    for length in set(signal_ma_lengths): 
+        combos = [i for i, signal_length in enumerate(signal_ma_lengths) if signal_length == length]
+        # all combinations sharing a signal length are smoothed together as columns of one 2-D array
+        lines = np.concatenate(macd[combos], axis=1)
+        if signal_ma_type == 'EMA': 
+            smoothed = exponentialMovingAverageBatch(lines, [length], adjust=False)[0]
+        else: 
+            smoothed = pd.DataFrame(lines).rolling(length).mean().values
+        signal[combos] = np.stack(np.split(smoothed, len(combos), axis=1))
+
+    return _unstack(macd, is_1d), _unstack(signal, is_1d), _unstack(macd - signal, is_1d)
+
+
+def stochasticIndicatorBatch(high, low, close, k_periods = (14,), d_period = 3): 
+    """
+    Stochastic Oscillator of many tickers for several lookback periods. 
+    Unlike stochasticIndicator, which always uses k_period = 14 and d_period = 3, the given periods are used. 
+
+    Parameters:
+    - high, low, close (array-like): 1-D or 2-D (bars x tickers) prices. 
+    - k_periods (list of int): lookback periods of the highest high and lowest low. 
+    - d_period (int): smoothing period of %K. 
+
+    Returns:
+    - tuple: (percent_k, smooth_k), each of shape (k_periods x bars x tickers). 
+    """
+    high, is_1d = _asPanel(high)
+    low, _ = _asPanel(low)
+    close, _ = _asPanel(close)
+    high, low = pd.DataFrame(high), pd.DataFrame(low)
+
+    percent_k = np.stack([
+        100 * (close - low.rolling(k_period).min().values)/(high.rolling(k_period).max().values - low.rolling(k_period).min().values) 
+        for k_period in k_periods
+    ])
+    smooth_k = np.stack([pd.DataFrame(k).rolling(d_period).mean().values for k in percent_k])
+    return _unstack(percent_k, is_1d), _unstack(smooth_k, is_1d)
+
+
+def averageTrueRangeBatch(high, low, close, periods = (14,)): 
+    """
+    Average True Range of many tickers for several periods. The true range is computed once, 
+    then smoothed (rma) once per period. 
+
+    Returns:
+    - ndarray: (periods x bars x tickers) 
+    """
+    high, is_1d = _asPanel(high)
+    low, _ = _asPanel(low)
+    close, _ = _asPanel(close)
+    prev_close = np.vstack([np.full((1, close.shape[1]), np.nan), close[:-1]])
+
+    # max over the three ranges skipping NaN, like DataFrame.max(axis = 1) 
+    tr = np.fmax(np.fmax(np.abs(high - low), np.abs(high - prev_close)), np.abs(low - prev_close))
+    return _unstack(exponentialMovingAverageBatch(tr, periods, alpha=True), is_1d)
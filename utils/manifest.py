@@ -0,0 +1,114 @@
+import os
+import json
+import pickle
+import hashlib
+from dataclasses import asdict
+from importlib import metadata
+
+from utils.params import STRATEGY_PARAMS
+from utils.datastore import tickerFromPath, openStore, stockDataHash
+
+
+# version of the outcomes checkpointed by RunManifest, part of every runKey. Bump it whenever a
+# change of the code changes the outcome of a ticker (stats, trades, result columns), so that the
+# outcomes computed before are not reused
+RESULTS_SCHEMA = 1
+
+
+def strategyParams(strategy_name, ticker, opt_params = None):
+    """
+        Optimized parameters the run of a ticker uses (its entry of the ParamsTable opt_params),
+        None when the defaults of the strategy are used.
+    """
+    if opt_params is None or strategy_name not in STRATEGY_PARAMS:
+        return None
+    if ticker not in opt_params:
+        return "missing"
+    return asdict(opt_params.get(ticker, strategy_name))
+
+
+def libraryVersion(name = 'backtesting'):
+    """
+        Installed version of the package name (read from its metadata, without importing it), None when it is not installed.
+    """
+    try:
+        return metadata.version(name)
+    except metadata.PackageNotFoundError:
+        return None
+
+
+def runKey(strategy_name, engine, params, data_hash, trade_plots = False, precision = 'float64'):
+    """
+        Key of the outcome of one ticker: it only changes when the strategy, the engine, the
+        parameters of the ticker, its data, the plotting option, the precision, the installed
+        backtesting or the RESULTS_SCHEMA change.
+    """
+    fields = [RESULTS_SCHEMA, libraryVersion(), strategy_name, engine, params, data_hash, bool(trade_plots), precision]
+    key = json.dumps(fields, sort_keys=True, default=str)
+    return hashlib.blake2b(key.encode(), digest_size=16).hexdigest()
+
+
+class RunManifest:
+    """
+    Checkpoints of a main.py run, one folder per strategy (e.g. ./results/runs/bb).
+
+    The outcome of every completed ticker is pickled into the folder and recorded in manifest.jsonl
+    with the key it was computed under (see runKey). A rerun reuses the outcomes whose key did not
+    change and only recomputes the new or changed tickers, so an interrupted run continues where it
+    stopped. The manifest is append only: a record is written once its outcome file is complete and
+    the last record of a ticker wins.
+
+    Parameters:
+    - folder (str): folder of the checkpoints.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, 'manifest.jsonl')
+        os.makedirs(folder, exist_ok=True)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # a record cut by a crash, the ticker is simply computed again
+                        continue
+                    self.entries[record['ticker']] = record
+
+    def _outcomePath(self, ticker, key):
+        return os.path.join(self.folder, f'{ticker}-{key}.pkl')
+
+    def has(self, ticker, key):
+        entry = self.entries.get(ticker)
+        return entry is not None and entry['key'] == key and os.path.exists(self._outcomePath(ticker, key))
+
+    def load(self, ticker):
+        with open(self._outcomePath(ticker, self.entries[ticker]['key']), 'rb') as f:
+            return pickle.load(f)
+
+    def save(self, ticker, key, outcome):
+        previous = self.entries.get(ticker)
+        tmp_path = self._outcomePath(ticker, key) + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(outcome, f)
+        os.replace(tmp_path, self._outcomePath(ticker, key))
+
+        record = {"ticker": ticker, "key": key}
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+        self.entries[ticker] = record
+        if previous is not None and previous['key'] != key and os.path.exists(self._outcomePath(ticker, previous['key'])):
+            os.remove(self._outcomePath(ticker, previous['key']))
+
+
+def tickerKeys(stock_names, strategy_name, engine, opt_params = None, date_range = None, trade_plots = False, precision = 'float64'):
+    """
+        stock_name -> runKey of every ticker of the run.
+    """
+    keys = {}
+    for stock_name in stock_names:
+        store = openStore(os.path.dirname(stock_name))
+        params = strategyParams(strategy_name, tickerFromPath(stock_name), opt_params)
+        keys[stock_name] = runKey(strategy_name, engine, params, stockDataHash(stock_name, store, date_range), trade_plots, precision)
+    return keys
@@ -0,0 +1,231 @@
+import os
+import time
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from utils.datastore import tickerFromPath, openStore, readStockData, listStockNames, dateRange, SPLITS
+
+
+# the stats the project reads (the results csv of main.py, the profits and the SQN objective of the
+# optimizer), keyed like the stats Series of Backtest.run
+METRICS = [
+    "Equity Final [$]",
+    "Return [%]",
+    "Buy & Hold Return [%]",
+    "Max. Drawdown [%]",
+    "Avg. Drawdown [%]",
+    "Max. Drawdown Duration",
+    "Avg. Drawdown Duration",
+    "# Trades",
+    "Win Rate [%]",
+    "Best Trade [%]",
+    "Worst Trade [%]",
+    "Avg. Trade [%]",
+    "Max. Trade Duration",
+    "Avg. Trade Duration",
+    "SQN"
+]
+
+# objective of the parameter sweeps, see utils/optimize.py
+OBJECTIVE = "SQN"
+
+
+def drawdownDurationPeaks(dd):
+    """
+    Durations (in bars) and peaks of the drawdown periods of the drawdown curve dd, as computed by
+    backtesting._stats, one value per period instead of a Series aligned on the bars. Without any
+    drawdown period both are dd with its zeros replaced by NaN, like backtesting.
+    """
+    iloc = np.unique(np.r_[(dd == 0).nonzero()[0], len(dd) - 1])
+    prev, iloc = iloc[:-1], iloc[1:]
+    keep = iloc > prev + 1
+    prev, iloc = prev[keep], iloc[keep]
+    if not len(iloc):
+        dd = np.where(dd == 0, np.nan, dd)
+        return dd, dd
+    # maximum over every [prev, iloc] period, the bounds interleaved for reduceat
+    bounds = np.column_stack([prev, iloc + 1]).ravel()
+    peaks = np.maximum.reduceat(np.r_[dd, 0.0], bounds)[::2]
+    return (iloc - prev).astype(float), peaks
+
+
+def geometricMean(returns):
+    returns = np.nan_to_num(returns) + 1
+    if np.any(returns <= 0):
+        return 0
+    return np.exp(np.log(returns).sum()/(len(returns) or np.nan)) - 1
+
+
+def _nanStat(func, values):
+    values = values[~np.isnan(values)]
+    return func(values) if len(values) else np.nan
+
+
+def sqn(pnl):
+    """
+        System Quality Number (sqrt(#trades)*mean(PnL)/std(PnL)) of the PnL of the trades, NaN with
+        fewer than two trades or no PnL variation, like backtesting's stats.
+    """
+    if len(pnl) < 2:
+        return np.nan
+    std = np.std(pnl, ddof=1)
+    return np.sqrt(len(pnl))*np.mean(pnl)/std if std else np.nan
+
+
+def sqnByColumn(trades, n_columns):
+    """
+    SQN (see sqn) of every column of a simulation at once, trades being the trades of all columns
+    with the column in 'Ticker' (see utils.vectorized.simulate).
+    """
+    column = trades['Ticker'].values.astype(int)
+    pl = trades['PnL'].values
+    count = np.bincount(column, minlength=n_columns)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.bincount(column, weights=pl, minlength=n_columns)/count
+        var = np.bincount(column, weights=(pl - mean[column])**2, minlength=n_columns)/(count - 1)
+        sqn = np.sqrt(count)*mean/np.sqrt(var)
+    sqn[(count < 2) | ~np.isfinite(sqn)] = np.nan
+    return sqn
+
+
+def computeMetrics(equity, pnl, returns, durations, close, objective_only = False):
+    """
+    The METRICS of one backtest from its raw arrays, without building the DataFrames and the Series
+    of backtesting's stats.
+
+    Parameters:
+    - equity (ndarray): equity curve, one value per bar.
+    - pnl, returns, durations (ndarray): PnL, return (fraction) and duration (bars) of every closed trade.
+    - close (ndarray): close prices of the bars, the buy and hold return runs from the first to the
+      last one like in backtesting 0.3.3 (see utils.vectorized.BACKTESTING_VERSION).
+    - objective_only (bool): only compute the OBJECTIVE, for parameter sweeps.
+
+    Returns:
+    - dict: keyed like the stats Series returned by Backtest.run.
+    """
+    if objective_only:
+        return {OBJECTIVE: sqn(pnl)}
+    dd = 1 - equity/np.maximum.accumulate(equity)
+    dd_dur, dd_peaks = drawdownDurationPeaks(dd)
+    n_trades = len(pnl)
+    return {
+        "Equity Final [$]": equity[-1],
+        "Return [%]": (equity[-1] - equity[0])/equity[0]*100,
+        "Buy & Hold Return [%]": (close[-1] - close[0])/close[0]*100,
+        "Max. Drawdown [%]": -np.nan_to_num(dd.max())*100,
+        "Avg. Drawdown [%]": -_nanStat(np.mean, dd_peaks)*100,
+        "Max. Drawdown Duration": _nanStat(np.max, dd_dur),
+        "Avg. Drawdown Duration": _nanStat(np.mean, dd_dur),
+        "# Trades": n_trades,
+        "Win Rate [%]": np.nan if not n_trades else (pnl > 0).mean()*100,
+        "Best Trade [%]": _nanStat(np.max, returns)*100,
+        "Worst Trade [%]": _nanStat(np.min, returns)*100,
+        "Avg. Trade [%]": geometricMean(returns)*100,
+        # integer durations stay integers, like the max of backtesting's trade durations
+        "Max. Trade Duration": durations.max() if n_trades else np.nan,
+        "Avg. Trade Duration": durations.mean() if n_trades else np.nan,
+        "SQN": sqn(pnl)
+    }
+
+
+def statsMetrics(stats, close, objective_only = False):
+    """
+    The METRICS (or the OBJECTIVE only) recomputed with computeMetrics from the equity curve and the
+    trades of the stats Series of Backtest.run, the lean counterpart of backtesting.lib.compute_stats.
+    Only the Equity column of _equity_curve and the PnL, ReturnPct and Duration columns of _trades
+    are read, which backtesting 0.3.3 has as well. Stats without them return their own values.
+
+    Parameters:
+    - stats (Series): as returned by Backtest.run.
+    - close (ndarray): close prices of the bars the stats were obtained on.
+    """
+    trades = stats.get('_trades')
+    equity_curve = stats.get('_equity_curve')
+    if trades is None or equity_curve is None or 'Equity' not in equity_curve \
+            or any(column not in trades for column in ['PnL', 'ReturnPct', 'Duration']):
+        return {metric: stats[metric] for metric in ([OBJECTIVE] if objective_only else METRICS)}
+    durations = trades['Duration'].values if len(trades) else np.array([], dtype=float)
+    return computeMetrics(equity_curve['Equity'].values, trades['PnL'].values.astype(float), trades['ReturnPct'].values.astype(float),
+                          durations, np.asarray(close), objective_only)
+
+
+def compareMetrics(stock_df, strategy_name):
+    """
+    Runs one ticker through Backtest.run and compares its stats with the METRICS statsMetrics
+    recomputes from them. Recomputing the full stats with backtesting.lib.compute_stats and the lean
+    ones with statsMetrics (all of them and the OBJECTIVE only) is timed on the same run, the full
+    stats with the compute_stats of backtesting called the way Backtest.run calls it.
+
+    Returns:
+    - mismatches (list of str): one line per metric that differs.
+    - seconds (dict): full_s, lean_s and objective_s.
+    """
+    from backtesting._stats import compute_stats
+    from utils import strategies
+    from utils.vectorized import STRATEGIES, requireBacktesting
+
+    Backtest = requireBacktesting().Backtest
+    stats = Backtest(stock_df, getattr(strategies, STRATEGIES[strategy_name]), cash=10_000).run()
+    close = stock_df['Close'].values
+    begin = time.perf_counter()
+    compute_stats(trades=stats._trades, equity=stats._equity_curve['Equity'].values, ohlc_data=stock_df,
+                  strategy_instance=stats._strategy, risk_free_rate=0.0)
+    full_s = time.perf_counter() - begin
+    begin = time.perf_counter()
+    lean = statsMetrics(stats, close)
+    lean_s = time.perf_counter() - begin
+    begin = time.perf_counter()
+    objective = statsMetrics(stats, close, objective_only=True)
+    objective_s = time.perf_counter() - begin
+
+    mismatches = []
+    expected = [(metric, stats[metric], lean[metric]) for metric in METRICS] + [("objective", stats[OBJECTIVE], objective[OBJECTIVE])]
+    for metric, value, lean_value in expected:
+        if not (value == lean_value or (pd.isna(value) and pd.isna(lean_value)) or np.isclose(value, lean_value, rtol=1e-12, atol=0)):
+            mismatches.append(f"{strategy_name} {metric}: backtesting {value}, lean {lean_value}")
+    return mismatches, {"full_s": full_s, "lean_s": lean_s, "objective_s": objective_s}
+
+
+def checkMetrics(stock_names, strategy_names = ('bb', 'macd'), date_range = None):
+    """
+    Parity check of the lean stats on every ticker and strategy, see compareMetrics. Raises when
+    backtesting is not the pinned version (utils.vectorized.BACKTESTING_VERSION).
+
+    Returns:
+    - mismatches (list of str): one line per ticker, strategy and metric that differs.
+    - timings (DataFrame): seconds of the full and the lean stats per strategy.
+    """
+    mismatches = []
+    timings = {strategy_name: {"strategy": strategy_name, "tickers": 0, "full_s": 0.0, "lean_s": 0.0, "objective_s": 0.0}
+               for strategy_name in strategy_names}
+    for stock_name in stock_names:
+        stock_df = readStockData(stock_name, openStore(os.path.dirname(stock_name)), date_range)
+        if stock_df.shape[0] == 0: continue
+        for strategy_name in strategy_names:
+            differences, seconds = compareMetrics(stock_df, strategy_name)
+            mismatches += [f"{tickerFromPath(stock_name)} {difference}" for difference in differences]
+            row = timings[strategy_name]
+            row["tickers"] += 1
+            for column, value in seconds.items():
+                row[column] += value
+    return mismatches, pd.DataFrame(list(timings.values()))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='Lean Metrics Parity',
+                    description='checks the lean stats against the stats of backtesting.Backtest and times computing both')
+    parser.add_argument('--data_folder', default="./data/raw/history")
+    parser.add_argument('--split', default='outsample', choices=list(SPLITS.keys()) + ['all'])
+    parser.add_argument('--strategies', nargs='+', default=['bb', 'macd'], choices=['bb', 'macd'])
+    parser.add_argument('--num_stocks', default=20, type=int, help="tickers checked, the first ones of data_folder")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    date_range = dateRange(None if args.split == 'all' else args.split)
+    mismatches, timings = checkMetrics(listStockNames(args.data_folder)[:args.num_stocks], tuple(args.strategies), date_range)
+    print(timings.to_string(index=False))
+    print("\n".join(mismatches) if mismatches else "lean stats identical to backtesting's stats")
@@ -0,0 +1,305 @@
+import os
+import time
+import argparse
+from dataclasses import asdict
+from itertools import product
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from utils.datastore import tickerFromPath, listStockNames, dateRange, SPLITS
+from utils.sharedpanel import SharedPanel, attachPanel, sharedStockData
+from utils.params import PARAM_COLUMNS, STRATEGY_PARAMS
+from utils.metrics import sqnByColumn
+from utils.vectorized import STOP_LOSS
+from utils.vectorized import _crossover, _warmupBars, _positions, simulate
+from utils.indicators import bollingerBandsBatch, relativeStrengthIndexBatch, movingAverageConverganceDiverganceBatch
+
+
+# the grids searched by parameter_optimization.ipynb
+BB_GRID = {
+    "bb_window": [14,21,30],
+    "rsi_window": [6,14,18],
+    "rsi_smooth_window": [3,5],
+    "rsi_upper_thres": [70,75,80],
+    "rsi_lower_thres": [20,25,30]
+}
+
+MACD_GRID = {
+    "macd_fast_ma_length": list(range(12,30,2)),
+    "macd_slow_ma_length": list(range(26,50,2)),
+    "macd_signal_ma_length": list(range(9,21,2))
+}
+
+
+def bbConstraint(p):
+    return p.rsi_window >= 2*p.rsi_smooth_window
+
+
+def macdConstraint(p):
+    return p.macd_fast_ma_length*2 < p.macd_slow_ma_length and p.macd_fast_ma_length > p.macd_signal_ma_length
+
+
+GRIDS = {
+    "bb": (BB_GRID, bbConstraint),
+    "macd": (MACD_GRID, macdConstraint)
+}
+
+
+def gridCombinations(grid, constraint = None):
+    """
+    All combinations of the grid that satisfy the constraint, as a DataFrame with one row per
+    combination in itertools.product order. The constraint receives a row (attribute access like
+    the constraint of Backtest.optimize).
+    """
+    combos = pd.DataFrame(list(product(*grid.values())), columns=list(grid.keys()))
+    if constraint is not None:
+        combos = combos[[bool(constraint(p)) for p in combos.itertuples(index=False)]]
+    return combos.reset_index(drop=True)
+
+
+def bollingerBandsSignals(close, combos):
+    """
+    Entry signals of BollingerBandsStrategy for every combination on a single ticker.
+
+    The bands are computed once per distinct bb_window and the smoothed RSI once per distinct
+    (rsi_window, rsi_smooth_window) with the batch kernels of utils/indicators.py, every combination
+    then only indexes into them.
+
+    Parameters:
+    - close (Series): close prices of the ticker.
+    - combos (DataFrame): one row per combination, see gridCombinations.
+
+    Returns:
+    - entries, exits, stop_loss, start: as utils.vectorized.bollingerBandsSignals with one column per combination.
+    """
+    close = close.values
+    windows, window_idx = _positions(combos.bb_window)
+    rsi_windows, rsi_idx = _positions(combos.rsi_window)
+    smooth_windows, smooth_idx = _positions(combos.rsi_smooth_window)
+
+    bands = [band.T[:, window_idx] for band in bollingerBandsBatch(close, windows)]
+    rsi, rsi_smooth = relativeStrengthIndexBatch(close, rsi_windows, smooth_windows)
+    rsi = rsi.T[:, rsi_idx]
+    rsi_signal = rsi_smooth[rsi_idx, smooth_idx].T
+
+    with np.errstate(invalid='ignore'):
+        entries = (close[:, None] < bands[2]) & (rsi_signal < combos.rsi_lower_thres.values)
+    exits = np.zeros_like(entries)
+    stop_loss = np.repeat(close[:, None]*STOP_LOSS, len(combos), axis=1)
+    start = _warmupBars(bands + [rsi, rsi_signal])
+    return entries, exits, stop_loss, start
+
+
+def macdSignals(close, combos):
+    """
+    Entry and exit signals of MACDStrategy for every combination on a single ticker.
+
+    Every distinct EMA span is computed once and the signal lines of all combinations sharing a
+    signal length are smoothed together, see movingAverageConverganceDiverganceBatch.
+    """
+    macd, macd_signal, hist = movingAverageConverganceDiverganceBatch(close.values,
+                                    list(combos.macd_fast_ma_length),
+                                    list(combos.macd_slow_ma_length),
+                                    list(combos.macd_signal_ma_length))
+    macd, macd_signal, hist = macd.T, macd_signal.T, hist.T
+
+    with np.errstate(invalid='ignore'):
+        entries = _crossover(macd, macd_signal) & (macd <= 0)
+        exits = _crossover(macd_signal, macd) & (macd > 0)
+    stop_loss = np.full(macd.shape, np.nan)
+    start = _warmupBars([macd, macd_signal, hist])
+    return entries, exits, stop_loss, start
+
+
+SIGNALS = {
+    "bb": bollingerBandsSignals,
+    "macd": macdSignals
+}
+
+
+def scoreGrid(stock_df, strategy_name, combos, cash = 10_000):
+    """
+    SQN of every parameter combination of a strategy on a single ticker, all combinations being
+    simulated together as the columns of one panel.
+
+    Returns:
+    - sqn (ndarray): one value per row of combos.
+    """
+    close = stock_df.Close.astype(float).reset_index(drop=True)
+    entries, exits, stop_loss, start = SIGNALS[strategy_name](close, combos)
+
+    columns = range(len(combos))
+    panel = {column: pd.DataFrame(np.repeat(stock_df[column].values.astype(float)[:, None], len(combos), axis=1), columns=columns)
+             for column in ['Open', 'High', 'Low', 'Close']}
+    lengths = np.full(len(combos), stock_df.shape[0])
+    _, trades = simulate(panel, lengths, start, entries, exits, stop_loss, cash)
+    return sqnByColumn(trades, len(combos))
+
+
+def gridSearch(stock_df, strategy_name, combos):
+    """
+    Scores every combination on all bars.
+
+    Returns:
+    - candidates (DataFrame): the combinations scored, in grid order.
+    - sqn (ndarray): their SQN.
+    - cost (dict): evaluations (combinations simulated) and seconds (wall time of the search).
+    """
+    start = time.perf_counter()
+    sqn = scoreGrid(stock_df, strategy_name, combos)
+    return combos, sqn, {"evaluations": len(combos), "seconds": time.perf_counter() - start}
+
+
+def randomSearch(stock_df, strategy_name, combos, budget = None, seed = 0):
+    """
+    Scores budget combinations drawn at random from the grid on all bars, see gridSearch.
+    """
+    budget = len(combos) if budget is None else min(budget, len(combos))
+    sample = np.sort(np.random.default_rng(seed).choice(len(combos), budget, replace=False))
+    return gridSearch(stock_df, strategy_name, combos.iloc[sample].reset_index(drop=True))
+
+
+def _gridSteps(combos):
+    """
+        Position of the value of every parameter of every combination among the values of that
+        parameter in the grid, the coordinates of the combinations on the grid.
+    """
+    return np.column_stack([np.searchsorted(np.unique(combos[column]), combos[column]) for column in combos.columns])
+
+
+def adaptiveSearch(stock_df, strategy_name, combos, budget = None, seed = 0, rounds = 3, elite = 3):
+    """
+    Scores budget combinations in rounds, every round adapting to the SQN of the rounds before it.
+    The first round scores half the budget drawn at random from the grid, every later round the
+    unscored combinations closest on the grid (see _gridSteps, ties drawn at random) to the elite
+    best combinations scored so far, the rest of the budget being split evenly over the rounds.
+    Candidates are drawn from combos, the constrained grid, so they satisfy the constraint, and
+    every round is one column-batched simulation like gridSearch.
+
+    Returns:
+    - candidates, sqn, cost: as gridSearch, the candidates being the combinations scored in grid order.
+    """
+    start = time.perf_counter()
+    budget = len(combos) if budget is None else min(budget, len(combos))
+    rng = np.random.default_rng(seed)
+    steps = _gridSteps(combos)
+    first = (budget + 1)//2 if rounds > 1 else budget
+    sizes = [first] + list(np.diff(np.linspace(0, budget - first, rounds).round().astype(int)))
+
+    sqn = np.full(len(combos), np.nan)
+    scored = np.zeros(len(combos), dtype=bool)
+    for size in sizes:
+        unscored = np.flatnonzero(~scored)
+        if size <= 0 or not len(unscored): continue
+        ranking = np.where(scored & ~np.isnan(sqn), sqn, -np.inf)
+        best = np.argsort(-ranking, kind='stable')[:elite]
+        best = best[np.isfinite(ranking[best])]
+        if len(best):
+            # grid distance to the closest elite combination, the random tie break spreads the batch
+            distance = np.abs(steps[unscored][:, None, :] - steps[best][None, :, :]).sum(axis=2).min(axis=1)
+            batch = unscored[np.lexsort((rng.random(len(unscored)), distance))[:size]]
+        else:
+            batch = rng.choice(unscored, min(size, len(unscored)), replace=False)
+        batch = np.sort(batch)
+        sqn[batch] = scoreGrid(stock_df, strategy_name, combos.iloc[batch].reset_index(drop=True))
+        scored[batch] = True
+    return combos[scored].reset_index(drop=True), sqn[scored], {"evaluations": int(scored.sum()), "seconds": time.perf_counter() - start}
+
+
+# every search called as search(stock_df, strategy_name, combos, budget, seed), the grid ignoring the budget and the seed
+SEARCHES = {
+    "grid": lambda stock_df, strategy_name, combos, budget = None, seed = 0: gridSearch(stock_df, strategy_name, combos),
+    "random": randomSearch,
+    "adaptive": adaptiveSearch
+}
+
+
+def bestParams(stock_df, strategy_name, combos = None, search = 'grid', budget = None, seed = 0):
+    """
+    Parameters maximizing the SQN of the strategy on one ticker. Combinations without an SQN (less
+    than two trades) are skipped like in Backtest.optimize, ties go to the first combination of the
+    grid. Falls back to the defaults of the Strategy class when no combination has an SQN.
+
+    search is one of SEARCHES: 'grid' scores every combination, 'random' only budget of them drawn
+    from combos (the constrained grid by default) and 'adaptive' budget of them drawn in rounds
+    around the best ones scored so far. The combinations are simulated together as the columns of
+    one panel, whose per bar loop costs about the same for any number of columns, so a budgeted
+    search saves less wall time than evaluations (python -m utils.benchmark --levels search).
+    """
+    if combos is None:
+        combos = gridCombinations(*GRIDS[strategy_name])
+    candidates, sqn, _ = SEARCHES[search](stock_df, strategy_name, combos, budget, seed)
+    if np.all(np.isnan(sqn)):
+        return asdict(STRATEGY_PARAMS[strategy_name]())
+    return {column: int(value) for column, value in candidates.iloc[int(np.nanargmax(sqn))].items()}
+
+
+def optimizeTicker(stock_name, strategy_names = ('bb', 'macd'), date_range = None, search = 'grid', budget = None):
+    """
+    Optimized parameters of one ticker as a row of opt_params.csv, None for an empty data file.
+    date_range restricts the bars the parameters are optimized on, see utils.datastore.dateRange.
+    search and budget select the search of every strategy, see bestParams.
+    """
+    stock_df = sharedStockData(stock_name, date_range)
+    if stock_df.shape[0] == 0: return None
+
+    row = {"ticker": tickerFromPath(stock_name)}
+    for strategy_name in ['bb', 'macd']:
+        if strategy_name in strategy_names:
+            row.update(bestParams(stock_df, strategy_name, search=search, budget=budget))
+        else:
+            row.update(asdict(STRATEGY_PARAMS[strategy_name]()))
+    return row
+
+
+def optimizeFolder(data_folder, workers = 1, strategy_names = ('bb', 'macd'), date_range = None, search = 'grid', budget = None, shared_panel = False):
+    """
+    Runs the grid search on every ticker of data_folder, tickers being spread over a process pool.
+    With shared_panel the bars are loaded once into a SharedPanel the workers attach to (see
+    utils/sharedpanel.py) instead of every worker reading its tickers.
+
+    Returns:
+    - opt_params (DataFrame): in the layout of ./data/opt_params.csv
+    """
+    stock_names = listStockNames(data_folder)
+    if workers <= 1:
+        rows = [optimizeTicker(stock_name, strategy_names, date_range, search, budget) for stock_name in tqdm(stock_names)]
+    else:
+        panel = SharedPanel.create(stock_names, date_range) if shared_panel else None
+        try:
+            with ProcessPoolExecutor(max_workers=workers, initializer=attachPanel, initargs=(panel.spec if panel is not None else None,)) as executor:
+                n = len(stock_names)
+                rows = list(tqdm(executor.map(optimizeTicker, stock_names, [strategy_names]*n, [date_range]*n, [search]*n, [budget]*n), total=n))
+        finally:
+            if panel is not None: panel.close()
+    return pd.DataFrame([row for row in rows if row is not None], columns=['ticker'] + PARAM_COLUMNS['bb'] + PARAM_COLUMNS['macd'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='Parameter Optimization',
+                    description='grid searches the bb and macd strategy parameters maximizing SQN for every ticker of the insample data')
+    parser.add_argument('--data_folder', default="./data/raw/history")
+    parser.add_argument('--split', default='insample', choices=list(SPLITS.keys()) + ['all'], help="\
+                        period of the data the parameters are optimized on, all for every bar of data_folder")
+    parser.add_argument('--start_date', default=None, help="overrides the first day of the split, e.g. 2022-04-01")
+    parser.add_argument('--end_date', default=None, help="overrides the last day of the split, e.g. 2022-06-30")
+    parser.add_argument('--output', default='./data/opt_params.csv')
+    parser.add_argument('--strategies', nargs='+', default=['bb', 'macd'], choices=['bb', 'macd'],
+                        help="strategies to optimize, the others keep their default parameters")
+    parser.add_argument('--search', default='grid', choices=list(SEARCHES.keys()), help="\
+                        grid scores every combination, random --budget combinations drawn at random per ticker and strategy, \
+                        adaptive --budget combinations drawn in rounds around the best ones scored so far")
+    parser.add_argument('--budget', default=60, type=int, help="evaluations of the random and adaptive searches")
+    parser.add_argument('--workers', default=os.cpu_count(), type=int)
+    parser.add_argument('--shared_panel', action='store_true', help="\
+                        loads the bars once into shared memory, the workers reading them as views (see utils/sharedpanel.py)")
+    args = parser.parse_args()
+
+    date_range = dateRange(None if args.split == 'all' else args.split, args.start_date, args.end_date)
+    opt_params = optimizeFolder(args.data_folder, args.workers, tuple(args.strategies), date_range, args.search, args.budget, args.shared_panel)
+    opt_params.to_csv(args.output, index = False)
+    print(f"Optimized parameters of {opt_params.shape[0]} tickers saved in {args.output}")
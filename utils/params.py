@@ -0,0 +1,112 @@
+from dataclasses import dataclass, fields, asdict
+
+import pandas as pd
+
+
+# the defaults are the class attributes of the strategies of utils/strategies.py, repeated here so
+# that reading parameters does not import backtesting (and bokeh with it)
+@dataclass(frozen=True)
+class BollingerBandsParams:
+    bb_window: int = 30
+    rsi_window: int = 14
+    rsi_smooth_window: int = 3
+    rsi_upper_thres: int = 70
+    rsi_lower_thres: int = 30
+
+
+@dataclass(frozen=True)
+class MACDParams:
+    macd_fast_ma_length: int = 26
+    macd_slow_ma_length: int = 12
+    macd_signal_ma_length: int = 9
+
+
+@dataclass(frozen=True)
+class ExperimentalParams:
+    bb_window: int = 30
+    rsi_window: int = 14
+    rsi_smooth_window: int = 3
+    macd_fast_ma_length: int = 26
+    macd_slow_ma_length: int = 12
+    macd_signal_ma_length: int = 9
+
+
+# parameters of every strategy
+STRATEGY_PARAMS = {
+    "bb": BollingerBandsParams,
+    "macd": MACDParams,
+    "experimental": ExperimentalParams
+}
+
+PARAM_COLUMNS = {strategy_name: [field.name for field in fields(params)] for strategy_name, params in STRATEGY_PARAMS.items()}
+
+
+class ParamsTable:
+    """
+    The optimized parameters of opt_params.csv indexed by ticker: every lookup is a dict access
+    returning a frozen params dataclass, instead of a scan of the whole table per ticker.
+
+    Tickers without a row get the defaults of the strategy, explicitly (see get and missing).
+
+    Parameters:
+    - params (dict): ticker -> {strategy name: params dataclass}.
+    """
+    def __init__(self, params = None):
+        self.params = params or {}
+
+    @classmethod
+    def fromFrame(cls, opt_params, strategy_names = ('bb', 'macd')):
+        """
+            Validates and indexes a DataFrame in the layout of opt_params.csv. Every strategy of
+            strategy_names needs all its columns, holding integers. The first row of a duplicated
+            ticker is used.
+        """
+        if 'ticker' not in opt_params.columns:
+            raise ValueError("optimized parameters need a 'ticker' column")
+        opt_params = opt_params.drop_duplicates('ticker')
+        tickers = opt_params.ticker.astype(str).values
+
+        params = {ticker: {} for ticker in tickers}
+        for strategy_name in strategy_names:
+            columns = PARAM_COLUMNS[strategy_name]
+            missing = [column for column in columns if column not in opt_params.columns]
+            if missing:
+                raise ValueError(f"optimized parameters of the {strategy_name} strategy miss the columns {missing}")
+            values = opt_params[columns].apply(pd.to_numeric, errors='coerce')
+            invalid = values.isna().any(axis=1).values | (values.round() != values).any(axis=1).values
+            if invalid.any():
+                raise ValueError(f"non integer {strategy_name} parameters for the tickers {list(tickers[invalid])}")
+            for ticker, row in zip(tickers, values.astype(int).itertuples(index=False)):
+                params[ticker][strategy_name] = STRATEGY_PARAMS[strategy_name](*row)
+        return cls(params)
+
+    @classmethod
+    def read(cls, path, strategy_names = ('bb', 'macd')):
+        return cls.fromFrame(pd.read_csv(path), strategy_names)
+
+    def __contains__(self, ticker):
+        return ticker in self.params
+
+    def __len__(self):
+        return len(self.params)
+
+    def get(self, ticker, strategy_name):
+        """
+            Parameters of the strategy for the ticker, the defaults of the strategy when the ticker
+            has no optimized parameters.
+        """
+        params = self.params.get(ticker, {}).get(strategy_name)
+        return params if params is not None else STRATEGY_PARAMS[strategy_name]()
+
+    def missing(self, tickers):
+        """
+            The tickers of tickers without optimized parameters.
+        """
+        return [ticker for ticker in tickers if ticker not in self.params]
+
+    def frame(self, tickers, strategy_name):
+        """
+            Parameters of the strategy for every ticker as a DataFrame indexed by ticker.
+        """
+        return pd.DataFrame([asdict(self.get(ticker, strategy_name)) for ticker in tickers],
+                            index=pd.Index(tickers, name='ticker'), columns=PARAM_COLUMNS[strategy_name])
@@ -0,0 +1,203 @@
+import os
+import json
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+PLOT_FOLDER = './results/plots'
+
+# bumped when the rendering changes, so that every plot is rendered again
+PLOT_VERSION = 1
+
+TRADE_COLUMNS = ['EntryBar', 'ExitBar', 'EntryPrice', 'ExitPrice', 'PnL']
+
+
+def plotPaths(strategy_name, ticker, folder = PLOT_FOLDER):
+    """
+    Returns:
+    - inputs_path (str): npz file of the bars, equity and trades the plot of the ticker is rendered from.
+    - html_path (str): the plot, recorded as plot_path in the results csv.
+    """
+    base = os.path.join(folder, strategy_name, ticker)
+    return base + '.npz', base + '.html'
+
+
+def savePlotInputs(path, stock_df, timestamps, equity, trades):
+    """
+    Persists what the plot of a ticker needs: its OHLC bars, the timestamps of the bars, the equity
+    curve of the strategy and its closed trades (the _trades DataFrame of the stats, or the trades
+    of the vectorized engine). Written by the backtest of the ticker, rendered later by renderPlots.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    arrays = {column.lower(): np.asarray(stock_df[column], dtype=np.float64) for column in ['Open', 'High', 'Low', 'Close']}
+    arrays.update({column: trades[column].values for column in TRADE_COLUMNS})
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, timestamps=np.asarray(timestamps, dtype=np.int64), equity=np.asarray(equity, dtype=np.float64), **arrays)
+    os.replace(tmp_path, path)
+
+
+def inputsKey(inputs_path, max_bars = None):
+    """
+        Content hash of the inputs of a plot and of the rendering options: a plot is only rendered
+        again when it changes.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(inputs_path, 'rb') as f:
+        digest.update(f.read())
+    digest.update(json.dumps([PLOT_VERSION, max_bars]).encode())
+    return digest.hexdigest()
+
+
+def downsampleBars(inputs, max_bars):
+    """
+    Merges consecutive bars into at most max_bars bars (first open, highest high, lowest low, last
+    close, last equity) so that the plot of a very long history stays light. The trades are moved to
+    the merged bar holding their entry and exit bars. Inputs with fewer bars are returned as they are.
+
+    Returns:
+    - inputs (dict): same arrays as the inputs, plus 'x' the position of every bar (the first of
+      the merged bars).
+    """
+    n = inputs['close'].shape[0]
+    if not max_bars or n <= max_bars:
+        return {**inputs, "x": np.arange(n)}
+    bucket = -(-n//max_bars)
+    starts = np.arange(0, n, bucket)
+    last = np.minimum(starts + bucket, n) - 1
+    return {
+        **inputs,
+        "x": starts,
+        "timestamps": inputs['timestamps'][starts],
+        "open": inputs['open'][starts],
+        "high": np.maximum.reduceat(inputs['high'], starts),
+        "low": np.minimum.reduceat(inputs['low'], starts),
+        "close": inputs['close'][last],
+        "equity": inputs['equity'][last],
+        "EntryBar": inputs['EntryBar']//bucket*bucket,
+        "ExitBar": inputs['ExitBar']//bucket*bucket
+    }
+
+
+def renderPlot(inputs_path, html_path, title, max_bars = None):
+    """
+    Renders the plot of one ticker from its inputs (see savePlotInputs) into a standalone html file:
+    the candles with the trades drawn from entry to exit (green when profitable, red otherwise) and
+    the equity curve below, both sharing the x axis. The bokeh resources are loaded from the CDN.
+    """
+    from bokeh.plotting import figure, save
+    from bokeh.layouts import gridplot
+    from bokeh.models import ColumnDataSource, HoverTool, CustomJSTickFormatter
+    from bokeh.resources import CDN
+
+    with np.load(inputs_path) as f:
+        inputs = downsampleBars({name: f[name] for name in f.files}, max_bars)
+    x = inputs['x']
+    step = int(x[1] - x[0]) if len(x) > 1 else 1
+    times = pd.to_datetime(inputs['timestamps']).strftime('%Y-%m-%d %H:%M')
+    bars = ColumnDataSource({
+        "x": x, "time": times, "open": inputs['open'], "high": inputs['high'], "low": inputs['low'],
+        "close": inputs['close'], "equity": inputs['equity'],
+        "color": np.where(inputs['close'] >= inputs['open'], '#26a69a', '#ef5350')
+    })
+
+    tools = 'xpan,xwheel_zoom,box_zoom,reset,save'
+    price = figure(title=title, height=400, sizing_mode='stretch_width', tools=tools)
+    price.segment('x', 'high', 'x', 'low', source=bars, color='black')
+    price.vbar('x', 0.8*step, 'open', 'close', source=bars, fill_color='color', line_color='black')
+    price.add_tools(HoverTool(tooltips=[("time", "@time"), ("open", "@open"), ("high", "@high"), ("low", "@low"), ("close", "@close")],
+                              mode='vline', renderers=price.renderers[-1:]))
+    if len(inputs['EntryBar']):
+        trades = ColumnDataSource({
+            "entry": inputs['EntryBar'], "exit": inputs['ExitBar'],
+            "entry_price": inputs['EntryPrice'], "exit_price": inputs['ExitPrice'], "pnl": inputs['PnL'],
+            "color": np.where(inputs['PnL'] > 0, 'green', 'red')
+        })
+        price.segment('entry', 'entry_price', 'exit', 'exit_price', source=trades, color='color', line_width=3, line_dash='dotted')
+        price.scatter('entry', 'entry_price', source=trades, marker='triangle', size=9, color='color')
+        price.scatter('exit', 'exit_price', source=trades, marker='inverted_triangle', size=9, color='color')
+
+    equity = figure(height=160, sizing_mode='stretch_width', x_range=price.x_range, tools=tools)
+    equity.line('x', 'equity', source=bars, color='blue')
+    equity.add_tools(HoverTool(tooltips=[("time", "@time"), ("equity", "@equity{0,0.00}")], mode='vline'))
+    # the x axis is the bar position, its ticks are labelled with the time of the bar
+    formatter = CustomJSTickFormatter(args={"times": list(times), "step": step},
+                                      code="return times[Math.min(Math.max(Math.round(tick/step), 0), times.length - 1)] || '';")
+    for fig in (price, equity):
+        fig.xaxis.formatter = formatter
+
+    layout = gridplot([[price], [equity]], sizing_mode='stretch_width', toolbar_location='right', merge_tools=True)
+    tmp_path = html_path + '.tmp'
+    save(layout, filename=tmp_path, resources=CDN, title=title)
+    os.replace(tmp_path, html_path)
+    return html_path
+
+
+def _renderJob(job):
+    return renderPlot(*job)
+
+
+def renderPlots(strategy_name, tickers, workers = 1, max_bars = None, folder = PLOT_FOLDER, force = False):
+    """
+    Renders the plots of tickers (the ones with saved inputs) over a process pool. A plot whose
+    inputs and options did not change since it was rendered (see inputsKey, recorded in plots.json
+    of the folder of the strategy) is skipped unless force.
+
+    Returns:
+    - rendered (list): tickers whose plot was rendered.
+    - unchanged (list): tickers whose plot was up to date.
+    """
+    manifest_path = os.path.join(folder, strategy_name, 'plots.json')
+    manifest = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    jobs, keys, unchanged = [], {}, []
+    for ticker in tickers:
+        inputs_path, html_path = plotPaths(strategy_name, ticker, folder)
+        if not os.path.exists(inputs_path): continue
+        keys[ticker] = inputsKey(inputs_path, max_bars)
+        if not force and manifest.get(ticker) == keys[ticker] and os.path.exists(html_path):
+            unchanged.append(ticker)
+            continue
+        jobs.append((ticker, (inputs_path, html_path, f"{ticker} {strategy_name}", max_bars)))
+
+    if workers <= 1 or len(jobs) <= 1:
+        for _, job in jobs: _renderJob(job)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(_renderJob, [job for _, job in jobs], chunksize=max(1, len(jobs)//(workers*4))))
+
+    rendered = [ticker for ticker, _ in jobs]
+    manifest.update({ticker: keys[ticker] for ticker in rendered})
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    return rendered, unchanged
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='Trade Plots',
+                    description='renders the trade plots of the tickers backtested by main.py --plots True from their saved equity and trades')
+    parser.add_argument('--strategy', default='bb', choices=['bb', 'macd'])
+    parser.add_argument('--folder', default=PLOT_FOLDER)
+    parser.add_argument('--tickers', nargs='+', default=None, help="tickers plotted, all the tickers with saved inputs by default")
+    parser.add_argument('--max_bars', default=None, type=int, help="longer histories are merged into this many bars")
+    parser.add_argument('--workers', default=os.cpu_count(), type=int)
+    parser.add_argument('--force', action='store_true', help="renders the plots whose inputs did not change as well")
+    args = parser.parse_args()
+
+    tickers = args.tickers
+    if tickers is None:
+        strategy_folder = os.path.join(args.folder, args.strategy)
+        tickers = sorted(name[:-4] for name in os.listdir(strategy_folder) if name.endswith('.npz')) if os.path.exists(strategy_folder) else []
+    rendered, unchanged = renderPlots(args.strategy, tickers, args.workers, args.max_bars, args.folder, args.force)
+    print(f"{len(rendered)} plots rendered, {len(unchanged)} unchanged, in {os.path.join(args.folder, args.strategy)}")
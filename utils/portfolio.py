@@ -0,0 +1,282 @@
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from utils.datastore import tickerFromPath, openStore, readStockData, readStockTimestamps, listStockNames, dateRange, SPLITS
+from utils.params import ParamsTable
+from utils.vectorized import TRADE_SIZE, tickerParams, bollingerBandsSignals, macdSignals, _tradesFrame
+
+
+SIGNALS = {
+    "bb": bollingerBandsSignals,
+    "macd": macdSignals
+}
+
+
+def loadAlignedPanel(stock_files, date_range = None):
+    """
+    Loads the tickers like utils.vectorized.loadPanel (every ticker keeps its own bar numbering, so
+    that the signals are computed exactly as for a single ticker) and aligns them on the union of
+    their bar timestamps.
+
+    Returns:
+    - panel (dict): 'Open', 'High', 'Low', 'Close' DataFrames of shape (bars, tickers), own numbering.
+    - lengths (ndarray): number of bars of every ticker.
+    - timestamps (ndarray): sorted int64 timestamps of the shared axis.
+    - rows (list of ndarray): for every ticker, the row of the shared axis of each of its bars.
+    """
+    frames, stamps = {}, {}
+    for ticker, stock_name in stock_files.items():
+        store = openStore(os.path.dirname(stock_name))
+        stock_df = readStockData(stock_name, store, date_range)
+        if stock_df.shape[0] == 0: continue
+        frames[ticker] = stock_df
+        stamps[ticker] = readStockTimestamps(stock_name, store, date_range)
+
+    panel = {
+        column: pd.DataFrame({ticker: df[column] for ticker, df in frames.items()}, dtype=float)
+        for column in ['Open', 'High', 'Low', 'Close']
+    }
+    lengths = np.array([df.shape[0] for df in frames.values()], dtype=int)
+    timestamps = np.unique(np.concatenate(list(stamps.values()))) if stamps else np.array([], dtype='int64')
+    rows = [np.searchsorted(timestamps, ticker_stamps) for ticker_stamps in stamps.values()]
+    return panel, lengths, timestamps, rows
+
+
+def _align(values, lengths, rows, n_rows, fill):
+    """
+    Scatters (own bars x tickers) values onto the shared axis, fill where a ticker has no bar.
+    """
+    aligned = np.full((n_rows, values.shape[1]), fill, dtype=np.asarray(values).dtype)
+    for j, (n, ticker_rows) in enumerate(zip(lengths, rows)):
+        aligned[ticker_rows, j] = values[:n, j]
+    return aligned
+
+
+def _acceptEntries(cost, cash, slots):
+    """
+    Entries filled out of the candidates (in priority order) of one bar: every order is filled when
+    cash and the free position slots cover it and cancelled otherwise, like the broker does with a
+    single ticker.
+
+    Returns:
+    - accepted, no_cash (bool ndarray): the filled orders and the orders cancelled for lack of cash,
+      the others being cancelled for lack of position slots.
+    """
+    if len(cost) <= slots and cost.sum() <= cash:
+        return np.ones(len(cost), dtype=bool), np.zeros(len(cost), dtype=bool)
+    accepted = np.zeros(len(cost), dtype=bool)
+    no_cash = np.zeros(len(cost), dtype=bool)
+    for k, value in enumerate(cost):
+        if slots <= 0: break
+        if value <= cash:
+            accepted[k] = True
+            cash -= value
+            slots -= 1
+        else:
+            no_cash[k] = True
+    return accepted, no_cash
+
+
+def simulatePortfolio(panel, lengths, timestamps, rows, start, entries, exits, stop_loss, cash = 1_000_000, size = TRADE_SIZE, max_positions = None):
+    """
+    Steps all tickers on the shared timestamp axis against one cash balance. Orders follow the rules
+    of utils.vectorized.simulate (fills on the next bar of the ticker's open, stop-loss at
+    min(open, stop) as soon as the low goes below it, open trades closed on the last bar of the ticker
+and the entries placed on that bar cancelled),
+    with portfolio accounting instead of an isolated account per ticker:
+
+    - an entry pays size*open out of the shared cash, an exit gets the proceeds back;
+    - on every bar the exits are processed first, then the entries in ticker order, each one being
+      cancelled when the remaining cash or the free position slots (max_positions) do not cover it.
+
+    Parameters:
+    - panel, lengths, timestamps, rows: see loadAlignedPanel.
+    - start, entries, exits, stop_loss: signals on the own bars of every ticker, see utils.vectorized.bollingerBandsSignals.
+    - cash (float): starting cash of the portfolio.
+    - size (int): number of shares bought on every entry.
+    - max_positions (int): maximum number of positions held at once, None for no limit.
+
+    Returns:
+    - timeline (DataFrame): per timestamp, the cash, the positions value, equity, exposure (positions
+      value / equity), positions held and turnover (traded value / equity).
+    - trades (DataFrame): closed trades in backtesting's _trades layout with the ticker, bars being rows of the shared axis.
+    - rejected (dict): entries cancelled for lack of cash and for lack of position slots.
+    """
+    n_rows = len(timestamps)
+    tickers = list(panel['Close'].columns)
+    n_tickers = len(tickers)
+    open_, high, low, close = (_align(panel[column].values, lengths, rows, n_rows, np.nan) for column in ['Open', 'High', 'Low', 'Close'])
+    entries = _align(entries, lengths, rows, n_rows, False)
+    exits = _align(exits, lengths, rows, n_rows, False)
+    stop_loss = _align(stop_loss, lengths, rows, n_rows, np.nan)
+    bar = _align(np.arange(max(lengths.max(initial=0), 1))[:, None].repeat(n_tickers, axis=1), lengths, rows, n_rows, -1)
+    # positions are marked to market on the last close of their ticker
+    last_close = pd.DataFrame(close).ffill().values
+    first_bar = np.maximum(start, 1)
+    slot_limit = n_tickers if max_positions is None else max_positions
+
+    balance = float(cash)
+    in_position = np.zeros(n_tickers, dtype=bool)
+    entry_price = np.zeros(n_tickers)
+    entry_row = np.zeros(n_tickers, dtype=int)
+    sl = np.full(n_tickers, np.nan)
+    pending_entry = np.zeros(n_tickers, dtype=bool)
+    pending_sl = np.full(n_tickers, np.nan)
+    pending_close = np.zeros(n_tickers, dtype=bool)
+    columns = np.arange(n_tickers)
+    cash_curve, value_curve, held_curve, traded_curve = (np.zeros(n_rows) for _ in range(4))
+    rejected = {"cash": 0, "positions": 0}
+    closed = []
+
+    def closeTrades(mask, price, i):
+        nonlocal balance
+        idx = columns[mask]
+        if not len(idx): return 0.0
+        exit_price = price[idx]
+        balance += size*exit_price.sum()
+        in_position[idx] = False
+        closed.append((idx, entry_row[idx].copy(), np.broadcast_to(i, idx.shape).copy(),
+                       entry_price[idx].copy(), exit_price.copy(), sl[idx].copy()))
+        return size*exit_price.sum()
+
+    def processOrders(i, active):
+        nonlocal balance
+        o, l = open_[i], low[i]
+        traded = closeTrades(active & in_position & pending_close, o, i)
+        pending_close[active] = False
+        traded += closeTrades(active & in_position & (l < sl), np.fmin(o, sl), i)
+
+        candidates = columns[active & pending_entry]
+        pending_entry[active] = False
+        if len(candidates):
+            cost = size*o[candidates]
+            slots = slot_limit - int(in_position.sum())
+            accepted, no_cash = _acceptEntries(cost, balance, slots)
+            rejected["cash"] += int(no_cash.sum())
+            rejected["positions"] += int((~accepted & ~no_cash).sum())
+            filled = candidates[accepted]
+            balance -= cost[accepted].sum()
+            traded += cost[accepted].sum()
+            in_position[filled] = True
+            entry_price[filled] = o[filled]
+            entry_row[filled] = i
+            sl[filled] = pending_sl[filled]
+            # the stop-loss of a new trade may already be hit within its entry bar
+            hit = np.zeros(n_tickers, dtype=bool)
+            hit[filled] = l[filled] < sl[filled]
+            traded += closeTrades(hit, np.fmin(o, sl), i)
+        traded_curve[i] += traded
+
+    for i in range(n_rows):
+        active = (bar[i] >= first_bar) & (bar[i] < lengths)
+        if active.any():
+            processOrders(i, active)
+
+            # strategy.next() on the close of the bar of every active ticker
+            new_entries = active & ~in_position & entries[i]
+            pending_entry[new_entries] = True
+            pending_sl[new_entries] = stop_loss[i, new_entries]
+            pending_close[active & in_position & exits[i]] = True
+
+            # end of the data of a ticker: its open trade is closed and the broker runs once more,
+            # without filling the entries placed on that bar, they would hold their cash and a slot forever
+            last = active & (bar[i] == lengths - 1)
+            if last.any():
+                pending_close[last & in_position] = True
+                pending_entry[last] = False
+                processOrders(i, last)
+
+        cash_curve[i] = balance
+        value_curve[i] = size*np.nansum(last_close[i][in_position])
+        held_curve[i] = in_position.sum()
+
+    equity = cash_curve + value_curve
+    timeline = pd.DataFrame({
+        "cash": cash_curve,
+        "positions_value": value_curve,
+        "equity": equity,
+        "exposure": value_curve/equity,
+        "positions": held_curve.astype(int),
+        "turnover": traded_curve/equity
+    }, index=pd.DatetimeIndex(pd.to_datetime(timestamps), name='time'))
+
+    trades = _tradesFrame(closed, tickers, size)
+    times = pd.to_datetime(timestamps)
+    trades['EntryTime'] = times[trades['EntryBar'].values]
+    trades['ExitTime'] = times[trades['ExitBar'].values]
+    trades['Duration'] = trades['ExitTime'] - trades['EntryTime']
+    return timeline, trades, rejected
+
+
+def portfolioStats(timeline, trades, rejected, cash = 1_000_000):
+    """
+    Summary of a portfolio simulation started with cash: returns, drawdown, exposure and turnover.
+    """
+    equity = timeline['equity'].values
+    drawdown = 1 - equity/np.maximum.accumulate(equity) if len(equity) else np.array([np.nan])
+    pnl = trades['PnL'].values
+    return pd.Series({
+        "Start": timeline.index[0] if len(timeline) else None,
+        "End": timeline.index[-1] if len(timeline) else None,
+        "Equity Final [$]": equity[-1] if len(equity) else np.nan,
+        "Return [%]": (equity[-1]/cash - 1)*100 if len(equity) else np.nan,
+        "Max. Drawdown [%]": -np.nanmax(drawdown)*100,
+        "Avg. Exposure [%]": timeline['exposure'].mean()*100,
+        "Max. Exposure [%]": timeline['exposure'].max()*100,
+        "Max. Positions": int(timeline['positions'].max()) if len(timeline) else 0,
+        "Turnover [x]": (timeline['turnover']*timeline['equity']).sum()/timeline['equity'].mean() if len(timeline) else np.nan,
+        "# Trades": len(trades),
+        "Win Rate [%]": (pnl > 0).mean()*100 if len(pnl) else np.nan,
+        "Rejected Entries (cash)": rejected['cash'],
+        "Rejected Entries (positions)": rejected['positions']
+    })
+
+
+def runPortfolio(stock_names, strategy_name, opt_params = None, date_range = None, cash = 1_000_000, size = TRADE_SIZE, max_positions = None):
+    """
+    Runs BollingerBandsStrategy ('bb') or MACDStrategy ('macd') on all tickers with one shared cash
+    pool, see simulatePortfolio. The signals of every ticker are those of the vectorized engine.
+
+    Returns:
+    - timeline, trades, rejected: see simulatePortfolio.
+    """
+    panel, lengths, timestamps, rows = loadAlignedPanel({tickerFromPath(stock_name): stock_name for stock_name in stock_names}, date_range)
+    params = tickerParams(panel['Close'].columns, strategy_name, opt_params)
+    entries, exits, stop_loss, start = SIGNALS[strategy_name](panel, params)
+    return simulatePortfolio(panel, lengths, timestamps, rows, start, entries, exits, stop_loss, cash, size, max_positions)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='Portfolio Simulation',
+                    description='trades the strategy on all tickers at once against a single cash balance')
+    parser.add_argument('--strategy', default='bb', choices=['bb', 'macd'])
+    parser.add_argument('--data_folder', default="./data/raw/history")
+    parser.add_argument('--split', default='outsample', choices=list(SPLITS.keys()) + ['all'])
+    parser.add_argument('--start_date', default=None, help="overrides the first day of the split, e.g. 2022-07-01")
+    parser.add_argument('--end_date', default=None, help="overrides the last day of the split, e.g. 2022-07-31")
+    parser.add_argument('--opt_params', default='./data/opt_params.csv')
+    parser.add_argument('--cash', default=1_000_000, type=float, help="starting cash of the portfolio")
+    parser.add_argument('--size', default=TRADE_SIZE, type=int, help="shares bought on every entry")
+    parser.add_argument('--max_positions', default=None, type=int, help="maximum number of positions held at once")
+    parser.add_argument('--output_folder', default='./results')
+    args = parser.parse_args()
+
+    opt_params = None
+    if os.path.exists(args.opt_params):
+        opt_params = ParamsTable.read(args.opt_params, [args.strategy])
+        print("Using Optimized Params...")
+    date_range = dateRange(None if args.split == 'all' else args.split, args.start_date, args.end_date)
+
+    timeline, trades, rejected = runPortfolio(listStockNames(args.data_folder), args.strategy, opt_params, date_range,
+                                              args.cash, args.size, args.max_positions)
+    os.makedirs(args.output_folder, exist_ok=True)
+    timeline_path = os.path.join(args.output_folder, f'portfolio_{args.strategy}.csv')
+    trades_path = os.path.join(args.output_folder, f'portfolio_trades_{args.strategy}.csv')
+    timeline.to_csv(timeline_path)
+    trades.to_csv(trades_path, index=False)
+    print(portfolioStats(timeline, trades, rejected, args.cash).to_string())
+    print(f"Portfolio saved in {timeline_path}, trades in {trades_path}")
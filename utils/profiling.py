@@ -0,0 +1,175 @@
+import time
+import pstats
+import cProfile
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+
+
+# stages of the run of a ticker, in the order they happen (see main.runTicker)
+STAGES = ['load', 'buy_and_hold', 'setup', 'init', 'next_loop', 'stats', 'plot', 'results']
+
+
+class TickerProfile:
+    """
+    Timers and counters of the run of one ticker with main.py --profile, sent back from the worker
+    processes with the outcome of the ticker.
+
+    Timers are the seconds spent in every stage of STAGES, counters count the bars processed by the
+    strategy, the indicators it declared (Strategy.I) and the orders it placed. With cprofile the
+    ticker also runs under cProfile, its raw stats are merged by dumpCProfile.
+    """
+    def __init__(self, ticker, cprofile = False):
+        self.ticker = ticker
+        self.timers = {}
+        self.counters = {}
+        self.marks = {}
+        self.profiler = cProfile.Profile() if cprofile else None
+        self.cprofile = None
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, seconds):
+        self.timers[name] = self.timers.get(name, 0.0) + seconds
+
+    def count(self, name, n = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def __enter__(self):
+        if self.profiler is not None: self.profiler.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self.profiler is not None:
+            self.profiler.disable()
+            self.profiler.create_stats()
+            # the raw stats dict pickles, the Profile object does not
+            self.cprofile, self.profiler = self.profiler.stats, None
+        return False
+
+    def row(self):
+        return {"ticker": self.ticker, **{f"{name}_s": self.timers.get(name, 0.0) for name in STAGES},
+                "total_s": sum(self.timers.values()), **self.counters}
+
+
+def stage(profile, name):
+    """
+        Times the block as stage name of profile, does nothing when profile is None.
+    """
+    return profile.stage(name) if profile is not None else nullcontext()
+
+
+def profiledStrategy(strategy, profile):
+    """
+    Subclass of the Strategy class strategy that records the time of init and of the per bar loop
+    and counts the bars, the indicators and the orders into profile. strategy itself when profile
+    is None, so that a run without --profile is not slowed down.
+    """
+    if profile is None:
+        return strategy
+
+    class Profiled(strategy):
+        def init(self):
+            start = time.perf_counter()
+            super().init()
+            profile.marks['loop_start'] = profile.marks['loop_end'] = time.perf_counter()
+            profile.add('init', profile.marks['loop_start'] - start)
+
+        def next(self):
+            super().next()
+            profile.count('bars')
+            profile.marks['loop_end'] = time.perf_counter()
+
+        def I(self, *args, **kwargs):
+            profile.count('indicator_calls')
+            return super().I(*args, **kwargs)
+
+        def buy(self, *args, **kwargs):
+            profile.count('orders')
+            return super().buy(*args, **kwargs)
+
+        def sell(self, *args, **kwargs):
+            profile.count('orders')
+            return super().sell(*args, **kwargs)
+
+    Profiled.__name__ = Profiled.__qualname__ = strategy.__name__
+    return Profiled
+
+
+def runProfiled(bt, profile, **params):
+    """
+    bt.run(**params), split into the stages of profile: setup (Backtest.run up to Strategy.init),
+    init, next_loop (the bars, broker included) and stats (closing the last trades and computing
+    the stats). bt must have been built with profiledStrategy.
+    """
+    if profile is None:
+        return bt.run(**params)
+    start = time.perf_counter()
+    stats = bt.run(**params)
+    end = time.perf_counter()
+    loop_start, loop_end = profile.marks.pop('loop_start', start), profile.marks.pop('loop_end', start)
+    profile.add('next_loop', loop_end - loop_start)
+    profile.add('stats', end - loop_end)
+    profile.add('setup', (end - start) - profile.timers.get('init', 0.0) - (loop_end - loop_start) - (end - loop_end))
+    profile.count('trades', int(stats['# Trades']))
+    return stats
+
+
+def profileReport(profiles, top = 10):
+    """
+    Summary of the TickerProfile of every ticker of a run.
+
+    Returns:
+    - tickers (DataFrame): one row per ticker with the seconds of every stage and its counters.
+    - stages (DataFrame): seconds of every stage summed over the tickers, their share of the total
+      and the mean per ticker.
+    - slowest (DataFrame): the top tickers with the largest total.
+    """
+    tickers = pd.DataFrame([profile.row() for profile in profiles])
+    if tickers.empty:
+        return tickers, pd.DataFrame(), tickers
+    seconds = tickers[[f"{name}_s" for name in STAGES]].sum()
+    stages = pd.DataFrame({
+        "stage": STAGES,
+        "seconds": seconds.values,
+        "share [%]": seconds.values/max(seconds.sum(), 1e-12)*100,
+        "per ticker [ms]": seconds.values/len(tickers)*1e3
+    })
+    bars = tickers['bars'].sum() if 'bars' in tickers else 0
+    if bars:
+        stages['per bar [us]'] = seconds.values/bars*1e6
+    slowest = tickers.sort_values('total_s', ascending=False).head(top)
+    return tickers, stages, slowest
+
+
+class _RawStats:
+    # pstats.Stats loads any object with a stats dict and a create_stats method
+    def __init__(self, stats):
+        self.stats = stats
+
+    def create_stats(self):
+        pass
+
+
+def dumpCProfile(profiles, path):
+    """
+        Merges the cProfile stats of the tickers (workers included) into one pstats file, readable
+        with pstats, snakeviz or flameprof. Returns False when no ticker was run under cProfile.
+    """
+    merged = None
+    for profile in profiles:
+        if profile.cprofile is None: continue
+        if merged is None:
+            merged = pstats.Stats(_RawStats(profile.cprofile))
+        else:
+            merged.add(_RawStats(profile.cprofile))
+    if merged is None:
+        return False
+    merged.dump_stats(path)
+    return True
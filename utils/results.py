@@ -0,0 +1,82 @@
+import os
+
+import pandas as pd
+
+
+# columns of ./results/results_<strategy>.csv taken from the stats of a ticker (the Series of
+# Backtest.run or of utils.vectorized.computeStats), column -> stat
+RESULT_STATS = {
+    "return": 'Return [%]',
+    "buy and hold return": 'Buy & Hold Return [%]',
+    "Max. Drawdown [%]": 'Max. Drawdown [%]',
+    "Avg. Drawdown [%]": 'Avg. Drawdown [%]',
+    "Max. Drawdown Duration": 'Max. Drawdown Duration',
+    "Avg. Drawdown Duration": 'Avg. Drawdown Duration',
+    "Num Trades": '# Trades',
+    "Win Rate [%]": 'Win Rate [%]',
+    "Best Trade [%]": 'Best Trade [%]',
+    "Worst Trade [%]": 'Worst Trade [%]',
+    "Avg. Trade [%]": 'Avg. Trade [%]',
+    "Max. Trade Duration": 'Max. Trade Duration',
+    "Avg. Trade Duration": 'Avg. Trade Duration'
+}
+
+# columns of ./results/results_<strategy>.csv, one row per ticker
+RESULT_COLUMNS = ["ticker", *RESULT_STATS, "plot_path"]
+
+
+class ResultsWriter:
+    """
+    Streams the outcome of every ticker to disk as soon as it is available: one row of the results
+    csv and the trades of the ticker appended to the trade log. Nothing is kept in memory and both
+    files are flushed after every ticker, so a run that crashes keeps the tickers completed so far.
+
+    Parameters:
+    - results_path (str): results csv, e.g. ./results/results_bb.csv
+    - trades_path (str): trade log csv, e.g. ./results/trades_bb.csv, one row per trade with its ticker.
+    - append (bool): append to existing files (keeping their header) instead of overwriting them.
+    """
+    def __init__(self, results_path, trades_path, append = False):
+        self.results_file = self._open(results_path, append)
+        self.trades_file = self._open(trades_path, append)
+        self.results_header = self.results_file.tell() == 0
+        self.trades_columns = None
+        if self.trades_file.tell() > 0:
+            with open(trades_path) as f:
+                self.trades_columns = f.readline().rstrip('\n').split(',')[1:]
+
+    @staticmethod
+    def _open(path, append):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        return open(path, 'a' if append else 'w', newline='')
+
+    def write(self, result, trades = None):
+        """
+            Appends the result row of one ticker and its trades (the _trades DataFrame of the stats).
+        """
+        pd.DataFrame([result], columns=RESULT_COLUMNS).to_csv(self.results_file, header=self.results_header, index=False)
+        self.results_header = False
+        self.results_file.flush()
+
+        if trades is None or trades.shape[0] == 0:
+            return
+        # the columns of the first trades written are kept, the log stays a single rectangular csv
+        if self.trades_columns is None:
+            self.trades_columns = list(trades.columns)
+            header = True
+        else:
+            header = False
+        trades = trades.reindex(columns=self.trades_columns)
+        trades.insert(0, 'ticker', result['ticker'])
+        trades.to_csv(self.trades_file, header=header, index=False)
+        self.trades_file.flush()
+
+    def close(self):
+        self.results_file.close()
+        self.trades_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
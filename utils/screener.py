@@ -0,0 +1,208 @@
+import os
+import time
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from utils.datastore import tickerFromPath, openStore, readStockData, listStockNames
+from utils.params import ParamsTable
+from utils.streaming import BollingerBandsSignals, MACDSignals
+
+
+# streaming rules of every strategy, their parameters being the columns of utils.params
+SCREENS = {
+    "bb": BollingerBandsSignals,
+    "macd": MACDSignals
+}
+
+PRICE_COLUMNS = ['Open', 'High', 'Low', 'Close']
+
+
+def loadHistory(stock_files, n_bars, date_range = None):
+    """
+    The last n_bars bars of every ticker, stacked into (n_bars x tickers) arrays. Row k is the k-th
+    of the last n_bars bars of every ticker, the tickers with fewer bars are left out.
+
+    Parameters:
+    - stock_files (dict): ticker -> path of its csv file, see utils.vectorized.loadPanel.
+    - n_bars (int): number of bars kept per ticker.
+    - date_range (tuple): (start_date, end_date) of the bars to read, see utils.datastore.dateRange.
+
+    Returns:
+    - bars (dict): 'Open', 'High', 'Low', 'Close' float64 arrays of shape (n_bars, tickers).
+    - tickers (list): tickers of the columns.
+    - skipped (list): tickers with less than n_bars bars.
+    """
+    columns, tickers, skipped = {column: [] for column in PRICE_COLUMNS}, [], []
+    for ticker, stock_name in stock_files.items():
+        stock_df = readStockData(stock_name, openStore(os.path.dirname(stock_name)), date_range)
+        if stock_df.shape[0] < n_bars:
+            skipped.append(ticker)
+            continue
+        tickers.append(ticker)
+        for column in PRICE_COLUMNS:
+            columns[column].append(stock_df[column].values[stock_df.shape[0] - n_bars:].astype(np.float64))
+    bars = {column: np.column_stack(values) if values else np.empty((n_bars, 0)) for column, values in columns.items()}
+    return bars, tickers, skipped
+
+
+class UniverseScreener:
+    """
+    Evaluates the entry and exit rules of the strategies on every ticker of a universe at once, bar
+    after bar. Every strategy is one streaming signal object of utils/streaming.py updated with the
+    prices of all tickers as arrays, every ticker with its own optimized parameters (windows, spans
+    and thresholds are per ticker arrays). A new bar therefore costs a few numpy operations over
+    the universe instead of recomputing the indicators on the history.
+
+    The rules are the ones of the strategies (see BollingerBandsSignals and MACDSignals): the
+    screener reports when they hold, position checks and stop-losses are left to the caller. Like
+    BollingerBandsStrategy, bb never signals an exit.
+
+    Parameters:
+    - tickers (list): tickers of the universe, in the order of the price arrays given to update.
+    - opt_params (ParamsTable): optimized parameters, tickers without a row get the defaults.
+    - strategy_names (tuple): strategies screened, keys of SCREENS.
+    """
+    def __init__(self, tickers, opt_params = None, strategy_names = ('bb', 'macd')):
+        self.tickers = np.array(tickers, dtype=object)
+        opt_params = opt_params if opt_params is not None else ParamsTable()
+        self.params = {strategy_name: opt_params.frame(list(tickers), strategy_name) for strategy_name in strategy_names}
+        self.screens = {strategy_name: SCREENS[strategy_name](**{column: params[column].values for column in params.columns})
+                        for strategy_name, params in self.params.items()}
+        self.latest = {}
+
+    def update(self, bar):
+        """
+        Feeds one bar of every ticker: a dict (or any object readable by utils.streaming) of Open,
+        High, Low, Close arrays in the order of tickers. A ticker without a bar gets NaN prices, its
+        rules do not hold on that bar.
+
+        Returns:
+        - signals (dict): strategy name -> (entry, exit) bool arrays of the tickers.
+        """
+        self.latest = {strategy_name: screen.update(bar) for strategy_name, screen in self.screens.items()}
+        return self.latest
+
+    def warmUp(self, bars):
+        """
+            Feeds the history bars (see loadHistory) one row at a time, so that the indicators of
+            the first live bar are warmed up.
+        """
+        for row in range(bars['Close'].shape[0]):
+            self.update({column: bars[column][row] for column in PRICE_COLUMNS})
+
+    def _scores(self, strategy_name, close):
+        """
+            Entry and exit scores of every ticker: for bb the distance of the close beyond the band
+            it crossed in band widths, for macd the distance between the MACD and its signal line
+            relative to the close.
+        """
+        screen = self.screens[strategy_name]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            if strategy_name == 'bb':
+                _, bb_upper, bb_lower = (np.asarray(band) for band in screen.bands)
+                width = bb_upper - bb_lower
+                return (bb_lower - close)/width, (close - bb_upper)/width
+            macd, signal = screen.prev
+            return (macd - signal)/close, (signal - macd)/close
+
+    def scan(self, bar):
+        """
+        Feeds one bar (see update) and ranks the tickers whose rules hold on it.
+
+        Returns:
+        - candidates (DataFrame): one row per ticker, strategy and signal ('entry' or 'exit') with its
+          score (see _scores), its rank within the strategy and signal (1 is the strongest) and its
+          close, sorted by strategy, signal and rank.
+        """
+        close = np.asarray(bar['Close'], dtype=np.float64)
+        # the candidates are gathered as arrays and framed once, the frame being most of the cost of a scan
+        columns = {"ticker": [], "strategy": [], "signal": [], "score": [], "rank": []}
+        for strategy_name, signals in self.update(bar).items():
+            for signal, mask, score in zip(('entry', 'exit'), signals, self._scores(strategy_name, close)):
+                idx = np.flatnonzero(mask)
+                if idx.size == 0: continue
+                order = idx[np.argsort(-score[idx], kind='stable')]
+                columns["ticker"].append(order)
+                columns["strategy"].append(np.full(order.size, strategy_name, dtype=object))
+                columns["signal"].append(np.full(order.size, signal, dtype=object))
+                columns["score"].append(score[order])
+                columns["rank"].append(np.arange(1, order.size + 1))
+        columns = {name: np.concatenate(values) if values else np.empty(0, dtype=object if name in ('strategy', 'signal') else int)
+                   for name, values in columns.items()}
+        idx = columns["ticker"]
+        return pd.DataFrame({**columns, "ticker": self.tickers[idx], "close": close[idx]},
+                            columns=['ticker', 'strategy', 'signal', 'score', 'rank', 'close'])
+
+
+def checkScreener(stock_files, opt_params = None, warmup_bars = 400, live_bars = 50, date_range = None, strategy_names = ('bb', 'macd')):
+    """
+    Replays the last live_bars bars of every ticker through a UniverseScreener warmed up on the
+    warmup_bars bars before them, timing every scan, and compares its signals with the batch
+    signals of the vectorized engine (utils.vectorized) computed on the same bars.
+
+    Returns:
+    - screener (UniverseScreener): the screener after the last bar.
+    - candidates (DataFrame): candidates of the last bar.
+    - timings (ndarray): seconds of every scan.
+    - mismatches (list of str): one line per strategy and signal that differs from the batch signals.
+    """
+    from utils.vectorized import SIGNALS, tickerParams
+
+    bars, tickers, skipped = loadHistory(stock_files, warmup_bars + live_bars, date_range)
+    if skipped:
+        print(f"{len(skipped)} tickers have less than {warmup_bars + live_bars} bars and are not screened")
+    screener = UniverseScreener(tickers, opt_params, strategy_names)
+    screener.warmUp({column: values[:warmup_bars] for column, values in bars.items()})
+
+    streamed = {strategy_name: ([], []) for strategy_name in strategy_names}
+    timings = []
+    candidates = None
+    for row in range(warmup_bars, warmup_bars + live_bars):
+        bar = {column: bars[column][row] for column in PRICE_COLUMNS}
+        begin = time.perf_counter()
+        candidates = screener.scan(bar)
+        timings.append(time.perf_counter() - begin)
+        for strategy_name, (entry, exit) in screener.latest.items():
+            streamed[strategy_name][0].append(entry)
+            streamed[strategy_name][1].append(exit)
+
+    mismatches = []
+    panel = {column: pd.DataFrame(values, columns=tickers) for column, values in bars.items()}
+    for strategy_name in strategy_names:
+        entries, exits, _, _ = SIGNALS[strategy_name](panel, tickerParams(tickers, strategy_name, opt_params))
+        for signal, batch, stream in zip(('entry', 'exit'), (entries, exits), streamed[strategy_name]):
+            differs = np.array(stream) != batch[warmup_bars:]
+            if differs.any():
+                mismatches.append(f"{strategy_name} {signal}: {int(differs.sum())} of {differs.size} ticker bars differ")
+    return screener, candidates, np.array(timings), mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='Universe Screener',
+                    description='ranks the tickers whose bb/macd entry or exit rules hold on the latest bar, all tickers being evaluated at once')
+    parser.add_argument('--data_folder', default="./data/raw/history")
+    parser.add_argument('--opt_params', default='./data/opt_params_bb_macd.csv')
+    parser.add_argument('--strategies', nargs='+', default=['bb', 'macd'], choices=list(SCREENS.keys()))
+    parser.add_argument('--warmup_bars', default=400, type=int, help="bars of every ticker replayed before the live bars")
+    parser.add_argument('--live_bars', default=50, type=int, help="last bars of every ticker scanned one at a time like live bars")
+    parser.add_argument('--top', default=10, type=int, help="candidates printed per strategy and signal")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    opt_params = None
+    if not os.path.exists(args.opt_params):
+        print("Optimized Parameters not found, Continueing with Default Parameter Values")
+    else:
+        opt_params = ParamsTable.read(args.opt_params, args.strategies)
+    stock_files = {tickerFromPath(stock_name): stock_name for stock_name in listStockNames(args.data_folder)}
+
+    screener, candidates, timings, mismatches = checkScreener(stock_files, opt_params, args.warmup_bars, args.live_bars,
+                                                              strategy_names=tuple(args.strategies))
+    print(f"{len(screener.tickers)} tickers, scan of a bar: median {np.median(timings)*1e3:.2f} ms, "
+          f"max {timings.max()*1e3:.2f} ms over {len(timings)} bars")
+    print("\n".join(mismatches) if mismatches else "screener signals identical to the batch signals")
+    print(candidates[candidates['rank'] <= args.top].to_string(index=False))
@@ -0,0 +1,221 @@
+import os
+import time
+import argparse
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from utils.datastore import openStore, readStockData, readStockTimestamps, listStockNames, dateRange, SPLITS, PRECISIONS, OHLCV_COLUMNS
+
+
+# panel the process attached to with attachPanel, read by sharedStockData
+_attached = None
+
+
+class SharedPanel:
+    """
+    Bars of many tickers loaded once into a single block of OS shared memory
+    (multiprocessing.shared_memory). Worker processes attach to the block by name and read their
+    tickers as numpy views of it, instead of every worker reading the data again or receiving a
+    pickled copy.
+
+    The block holds the timestamps, the prices (4 x bars, one row per Open/High/Low/Close) and the
+    volume of all bars, the tickers one after the other. spec records the offset and length of every
+    ticker, so a column of a ticker is one contiguous view and frame() builds its OHLCV DataFrame
+    without copying. The views of attached processes are read-only.
+
+    Create the panel with SharedPanel.create in the parent, preferably as a context manager: the
+    block is freed (unlinked) when the creator closes it. Workers attach with attachPanel(panel.spec),
+    typically as the initializer of their pool.
+    """
+    def __init__(self, spec, shm, owner = False):
+        self.spec = spec
+        self.shm = shm
+        self.owner = owner
+        n = spec['n_bars']
+        prices_dtype, volume_dtype = np.dtype(spec['prices_dtype']), np.dtype(spec['volume_dtype'])
+        # timestamps first, every array then starts aligned on its itemsize
+        self.timestamps = np.ndarray(n, dtype=np.int64, buffer=shm.buf)
+        self.prices = np.ndarray((4, n), dtype=prices_dtype, buffer=shm.buf, offset=8*n)
+        self.volume = np.ndarray(n, dtype=volume_dtype, buffer=shm.buf, offset=8*n + 4*n*prices_dtype.itemsize)
+        if not owner:
+            for array in (self.timestamps, self.prices, self.volume):
+                array.flags.writeable = False
+
+    @staticmethod
+    def _size(n_bars, prices_dtype, volume_dtype):
+        return max(n_bars*(8 + 4*np.dtype(prices_dtype).itemsize + np.dtype(volume_dtype).itemsize), 1)
+
+    @classmethod
+    def create(cls, stock_names, date_range = None, precision = None):
+        """
+        Loads the bars of stock_names with utils.datastore.readStockData (store or csv files) into a
+        new shared memory block.
+
+        Parameters:
+        - stock_names (list): paths of the history_stock_*.csv files, tickers without bars are kept
+          with a length of 0.
+        - date_range (tuple): (start_date, end_date) of the bars loaded, see utils.datastore.dateRange.
+        - precision (str): precision the bars are loaded in, see utils.datastore.readStockData.
+        """
+        frames, timestamps = {}, {}
+        for stock_name in stock_names:
+            store = openStore(os.path.dirname(stock_name))
+            frames[stock_name] = readStockData(stock_name, store, date_range, precision)
+            timestamps[stock_name] = readStockTimestamps(stock_name, store, date_range) if frames[stock_name].shape[0] \
+                else np.empty(0, dtype=np.int64)
+        loaded = [stock_df for stock_df in frames.values() if stock_df.shape[0]]
+        prices_dtype = np.result_type(*[stock_df[column].dtype for stock_df in loaded for column in OHLCV_COLUMNS[:4]]) if loaded else np.float64
+        volume_dtype = np.result_type(*[stock_df['Volume'].dtype for stock_df in loaded]) if loaded else np.float64
+
+        tickers, offset = {}, 0
+        for stock_name, stock_df in frames.items():
+            tickers[stock_name] = (offset, stock_df.shape[0])
+            offset += stock_df.shape[0]
+        shm = shared_memory.SharedMemory(create=True, size=cls._size(offset, prices_dtype, volume_dtype))
+        spec = {
+            "name": shm.name,
+            "n_bars": offset,
+            "prices_dtype": np.dtype(prices_dtype).str,
+            "volume_dtype": np.dtype(volume_dtype).str,
+            "date_range": date_range,
+            "precision": precision,
+            "tickers": tickers
+        }
+        panel = cls(spec, shm, owner=True)
+        for stock_name, (offset, length) in tickers.items():
+            if length == 0: continue
+            stock_df = frames.pop(stock_name)
+            panel.timestamps[offset:offset + length] = timestamps.pop(stock_name)
+            for k, column in enumerate(OHLCV_COLUMNS[:4]):
+                panel.prices[k, offset:offset + length] = stock_df[column].values
+            panel.volume[offset:offset + length] = stock_df['Volume'].values
+        return panel
+
+    @classmethod
+    def attach(cls, spec):
+        """
+            Attaches to the block of a panel created by another process, from its spec.
+        """
+        return cls(spec, shared_memory.SharedMemory(name=spec['name']))
+
+    def holds(self, stock_name, date_range = None, precision = None):
+        """
+            Whether the panel holds the bars readStockData(stock_name, store, date_range, precision) loads.
+        """
+        return stock_name in self.spec['tickers'] and date_range == self.spec['date_range'] and precision == self.spec['precision']
+
+    def frame(self, stock_name):
+        """
+            OHLCV DataFrame of a ticker, its columns being views of the shared block.
+        """
+        offset, length = self.spec['tickers'][stock_name]
+        columns = {column: self.prices[k, offset:offset + length] for k, column in enumerate(OHLCV_COLUMNS[:4])}
+        return pd.DataFrame({**columns, "Volume": self.volume[offset:offset + length]}, copy=False)
+
+    def tickerTimestamps(self, stock_name):
+        offset, length = self.spec['tickers'][stock_name]
+        return self.timestamps[offset:offset + length]
+
+    def close(self):
+        # the views must be released before the block
+        self.timestamps = self.prices = self.volume = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+
+def attachPanel(spec):
+    """
+        Attaches the process to the panel of spec (None detaches it), sharedStockData then serves
+        the tickers of the panel from it. Meant as the initializer of the worker processes.
+    """
+    global _attached
+    _attached = SharedPanel.attach(spec) if spec is not None else None
+
+
+def sharedStockData(stock_name, date_range = None, precision = None):
+    """
+        readStockData(stock_name, store, date_range, precision), from the panel attached to the
+        process when it holds the ticker for the same date range and precision, from the store or
+        the csv file otherwise.
+    """
+    if _attached is not None and _attached.holds(stock_name, date_range, precision):
+        return _attached.frame(stock_name)
+    return readStockData(stock_name, openStore(os.path.dirname(stock_name)), date_range, precision)
+
+
+def sharedStockTimestamps(stock_name, date_range = None):
+    """
+        readStockTimestamps(stock_name, store, date_range), from the attached panel when it holds the ticker.
+    """
+    if _attached is not None and stock_name in _attached.spec['tickers'] and date_range == _attached.spec['date_range']:
+        return _attached.tickerTimestamps(stock_name)
+    return readStockTimestamps(stock_name, openStore(os.path.dirname(stock_name)), date_range)
+
+
+def _checkTicker(stock_name, date_range, precision):
+    """
+        Compares the shared frame of a ticker with readStockData, in a worker attached to the panel.
+    """
+    begin = time.perf_counter()
+    shared = sharedStockData(stock_name, date_range, precision)
+    elapsed = time.perf_counter() - begin
+    stock_df = readStockData(stock_name, openStore(os.path.dirname(stock_name)), date_range, precision)
+    columns = OHLCV_COLUMNS if stock_df.shape[0] else []
+    same = shared.shape[0] == stock_df.shape[0] and all(
+        shared[column].dtype == stock_df[column].dtype and np.array_equal(shared[column].values, stock_df[column].values) for column in columns)
+    view = _attached is not None and shared.shape[0] > 0 and np.shares_memory(shared['Close'].values, _attached.prices)
+    return same, elapsed, view
+
+
+def checkSharedPanel(stock_names, date_range = None, precision = None, workers = 2):
+    """
+    Loads stock_names into a SharedPanel and reads every ticker back from worker processes attached
+    to it, comparing the frames with readStockData.
+
+    Returns:
+    - report (dict): bytes of the block, seconds to create it, mean seconds to read a ticker in the
+      workers, number of tickers read as views of the block.
+    - mismatches (list of str): tickers whose shared frame differs from readStockData.
+    """
+    begin = time.perf_counter()
+    with SharedPanel.create(stock_names, date_range, precision) as panel:
+        created = time.perf_counter() - begin
+        with ProcessPoolExecutor(max_workers=workers, initializer=attachPanel, initargs=(panel.spec,)) as executor:
+            checks = list(executor.map(_checkTicker, stock_names, [date_range]*len(stock_names), [precision]*len(stock_names)))
+        report = {
+            "tickers": len(stock_names),
+            "bars": panel.spec['n_bars'],
+            "bytes": panel.shm.size,
+            "create_s": created,
+            "read_ms": np.mean([elapsed for _, elapsed, _ in checks])*1e3 if checks else 0.0,
+            "views": sum(view for _, _, view in checks)
+        }
+    mismatches = [stock_name for stock_name, (same, _, _) in zip(stock_names, checks) if not same]
+    return report, mismatches
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='Shared Panel',
+                    description='loads the bars into shared memory and checks that worker processes read them back as zero-copy views')
+    parser.add_argument('--data_folder', default="./data/raw/history")
+    parser.add_argument('--split', default='insample', choices=list(SPLITS.keys()) + ['all'])
+    parser.add_argument('--precision', default=None, choices=list(PRECISIONS.keys()))
+    parser.add_argument('--workers', default=os.cpu_count(), type=int)
+    args = parser.parse_args()
+
+    report, mismatches = checkSharedPanel(listStockNames(args.data_folder), dateRange(None if args.split == 'all' else args.split),
+                                          args.precision, args.workers)
+    print(pd.Series(report).to_string())
+    print(f"{len(mismatches)} tickers differ from readStockData: {mismatches}" if mismatches else "shared frames identical to readStockData")
@@ -0,0 +1,209 @@
+import os
+import time
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from utils.datastore import tickerFromPath, openStore, readStockData, listStockNames, dateRange, SPLITS
+from utils.indicators import bollingerBands
+from utils.vectorized import TRADE_SIZE, STRATEGIES, simulate, validateAgainstBacktest, _tradesFrame
+
+# numba is optional: without it the same state machine runs as plain Python
+try:
+    from numba import njit
+    JIT_AVAILABLE = True
+except ImportError:
+    JIT_AVAILABLE = False
+
+
+def _jit(func):
+    return njit(cache=True, nogil=True)(func) if JIT_AVAILABLE else func
+
+
+@_jit
+def _closeTrade(trades, n_trades, entry_bar, exit_bar, entry_price, exit_price, sl, balance, size):
+    trades[n_trades, 0] = entry_bar
+    trades[n_trades, 1] = exit_bar
+    trades[n_trades, 2] = entry_price
+    trades[n_trades, 3] = exit_price
+    trades[n_trades, 4] = sl
+    return balance + size*(exit_price - entry_price), n_trades + 1
+
+
+@_jit
+def _processOrders(i, o, l, trades, n_trades, balance, in_position, entry_price, entry_bar, sl,
+                   pending_entry, pending_sl, pending_close, size):
+    # trade.close() order, in front of the broker's queue so it fills before a stop-loss
+    if in_position and pending_close:
+        balance, n_trades = _closeTrade(trades, n_trades, entry_bar, i, entry_price, o, sl, balance, size)
+        in_position = False
+    pending_close = False
+    # stop-loss of a trade opened on an earlier bar
+    if in_position and l < sl:
+        balance, n_trades = _closeTrade(trades, n_trades, entry_bar, i, entry_price, min(o, sl), sl, balance, size)
+        in_position = False
+    # entry order, cancelled by the broker when there isn't enough cash
+    if pending_entry and size*o <= balance:
+        in_position = True
+        entry_price = o
+        entry_bar = i
+        sl = pending_sl
+        # the stop-loss of a new trade may already be hit within its entry bar
+        if l < sl:
+            balance, n_trades = _closeTrade(trades, n_trades, entry_bar, i, entry_price, min(o, sl), sl, balance, size)
+            in_position = False
+    pending_entry = False
+    return n_trades, balance, in_position, entry_price, entry_bar, sl, pending_entry, pending_close
+
+
+@_jit
+def stepTicker(open_, low, close, entries, exits, stop_loss, start, n_bars, cash, size, equity, trades):
+    """
+    Per bar state machine of one ticker with the order handling of utils.vectorized.simulate: the
+    position, its entry and its stop are carried from bar to bar, orders placed on the close of a
+    bar are filled on the open of the next one.
+
+    Parameters:
+    - open_, low, close (float ndarray): prices of the ticker.
+    - entries, exits (bool ndarray): signals evaluated on the close of every bar.
+    - stop_loss (float ndarray): stop price of an entry placed on that bar, NaN for none.
+    - start (int): first traded bar, n_bars (int): number of bars of the ticker.
+    - cash (float), size (int): starting cash and shares bought on every entry.
+    - equity (float ndarray): filled with the equity curve, trades ((n_bars x 5) float ndarray):
+      filled with the closed trades (entry bar, exit bar, entry price, exit price, stop).
+
+    Returns:
+    - n_trades (int): number of rows of trades filled.
+    """
+    balance = cash
+    in_position = False
+    entry_price = 0.0
+    entry_bar = 0
+    sl = np.nan
+    pending_entry = False
+    pending_sl = np.nan
+    pending_close = False
+    n_trades = 0
+    first = -1
+
+    for i in range(max(start, 1), n_bars):
+        n_trades, balance, in_position, entry_price, entry_bar, sl, pending_entry, pending_close = _processOrders(
+            i, open_[i], low[i], trades, n_trades, balance, in_position, entry_price, entry_bar, sl,
+            pending_entry, pending_sl, pending_close, size)
+        equity[i] = balance + (size*(close[i] - entry_price) if in_position else 0.0)
+        if first < 0: first = i
+
+        # strategy.next() on the close of bar i
+        if not in_position and entries[i]:
+            pending_entry = True
+            pending_sl = stop_loss[i]
+        if in_position and exits[i]:
+            pending_close = True
+
+        # end of the data: the open trade is closed and the broker runs once more on the last bar
+        if i == n_bars - 1:
+            if in_position: pending_close = True
+            n_trades, balance, in_position, entry_price, entry_bar, sl, pending_entry, pending_close = _processOrders(
+                i, open_[i], low[i], trades, n_trades, balance, in_position, entry_price, entry_bar, sl,
+                pending_entry, pending_sl, pending_close, size)
+            equity[i] = balance + (size*(close[i] - entry_price) if in_position else 0.0)
+
+    # bars before the first traded bar hold the starting cash
+    for i in range(0, first if first >= 0 else n_bars):
+        equity[i] = equity[first] if first >= 0 else cash
+    return n_trades
+
+
+def simulateStateMachine(panel, lengths, start, entries, exits, stop_loss, cash = 10_000, size = TRADE_SIZE):
+    """
+    Drop-in replacement of utils.vectorized.simulate stepping every ticker through stepTicker, one
+    ticker at a time: compiled with numba when it is installed (JIT_AVAILABLE), plain Python otherwise.
+    Same parameters and outputs as simulate.
+    """
+    open_, low, close = (np.asfortranarray(panel[column].values, dtype=np.float64) for column in ['Open', 'Low', 'Close'])
+    entries, exits = np.asfortranarray(entries, dtype=np.bool_), np.asfortranarray(exits, dtype=np.bool_)
+    stop_loss = np.asfortranarray(stop_loss, dtype=np.float64)
+    n_bars, n_tickers = close.shape
+    equity = np.full((n_bars, n_tickers), np.nan, order='F')
+
+    closed = []
+    for j in range(n_tickers):
+        n = int(lengths[j])
+        trades = np.empty((max(n, 1), 5))
+        n_trades = stepTicker(open_[:, j], low[:, j], close[:, j], entries[:, j], exits[:, j], stop_loss[:, j],
+                              int(start[j]), n, float(cash), size, equity[:, j], trades)
+        if n_trades:
+            trades = trades[:n_trades]
+            closed.append((np.full(n_trades, j), trades[:, 0].astype(int), trades[:, 1].astype(int), trades[:, 2], trades[:, 3], trades[:, 4]))
+    return np.ascontiguousarray(equity), _tradesFrame(closed, list(panel['Close'].columns), size)
+
+
+def experimentalColumns(stock_df, ema_span = 100, bb_window = 30):
+    """
+    Adds the Ema_100 (EMA of the close) and Bb_basis (Bollinger Bands basis) columns that
+    ExperimentalStrategy reads from its data.
+    """
+    close = stock_df['Close'].astype(float)
+    return stock_df.assign(Ema_100 = close.ewm(span=ema_span, adjust=False).mean().values,
+                           Bb_basis = bollingerBands(stock_df, bb_window)["bb_basis"].values)
+
+
+def checkParity(stock_names, strategy_names = ('bb', 'macd', 'experimental'), date_range = None):
+    """
+    Parity checks of the state machine: every ticker and strategy is run through backtesting.Backtest
+    and through the vectorized engine with simulateStateMachine, trade for trade (see
+    utils.vectorized.validateAgainstBacktest). Both simulators are timed on the whole panel as well.
+
+    Returns:
+    - mismatches (list of str): one line per ticker and strategy that differs, empty on parity.
+    - timings (DataFrame): seconds of simulate and simulateStateMachine per strategy.
+    """
+    from utils.vectorized import SIGNALS, loadPanel, tickerParams
+
+    mismatches = []
+    frames = {}
+    for stock_name in stock_names:
+        stock_df = readStockData(stock_name, openStore(os.path.dirname(stock_name)), date_range)
+        if stock_df.shape[0] == 0: continue
+        frames[tickerFromPath(stock_name)] = stock_df = experimentalColumns(stock_df)
+        for strategy_name in strategy_names:
+            for difference in validateAgainstBacktest(stock_df, strategy_name, simulator=simulateStateMachine):
+                mismatches.append(f"{tickerFromPath(stock_name)} {strategy_name}: {difference}")
+
+    timings = []
+    if frames:
+        lengths = np.array([df.shape[0] for df in frames.values()], dtype=int)
+        panel = {column: pd.DataFrame({ticker: df[column] for ticker, df in frames.items()}, dtype=float)
+                 for column in ['Open', 'High', 'Low', 'Close', 'Ema_100', 'Bb_basis']}
+        for strategy_name in strategy_names:
+            signals = SIGNALS[strategy_name](panel, tickerParams(panel['Close'].columns, strategy_name))
+            row = {"strategy": strategy_name, "tickers": len(frames)}
+            for name, simulator in [("simulate", simulate), ("simulateStateMachine", simulateStateMachine)]:
+                begin = time.perf_counter()
+                simulator(panel, lengths, signals[3], *signals[:3])
+                row[f"{name}_s"] = time.perf_counter() - begin
+            timings.append(row)
+    return mismatches, pd.DataFrame(timings)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='State Machine Parity',
+                    description='checks the per bar state machine trade for trade against backtesting.Backtest')
+    parser.add_argument('--data_folder', default="./data/raw/history")
+    parser.add_argument('--split', default='outsample', choices=list(SPLITS.keys()) + ['all'])
+    parser.add_argument('--strategies', nargs='+', default=['bb', 'macd', 'experimental'], choices=list(STRATEGIES.keys()))
+    parser.add_argument('--num_stocks', default=20, type=int, help="tickers checked, the first ones of data_folder")
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    # compiles the state machine before timing it
+    stepTicker(np.ones(2), np.ones(2), np.ones(2), np.zeros(2, dtype=np.bool_), np.zeros(2, dtype=np.bool_),
+               np.full(2, np.nan), 1, 2, 1.0, TRADE_SIZE, np.empty(2), np.empty((2, 5)))
+    date_range = dateRange(None if args.split == 'all' else args.split)
+    mismatches, timings = checkParity(listStockNames(args.data_folder)[:args.num_stocks], tuple(args.strategies), date_range)
+    print(f"numba {'available, state machine compiled' if JIT_AVAILABLE else 'not installed, state machine running as plain Python'}")
+    print(timings.to_string(index=False))
+    print("\n".join(mismatches) if mismatches else "state machine trades identical to Backtest.run")
@@ -1,16 +1,15 @@
-import pandas as pd 
-import os 
-from tqdm import tqdm
-import mplfinance as fplt
-from glob import glob 
-from utils.indicators import movingAverageConverganceDivergance as macdI
-from utils.indicators import relativeStrengthIndex as rsiI
-from utils.indicators import averageTrueRange as atrI
-from utils.indicators import bollingerBands as bbI 
-from utils.indicators import stochasticIndicator as stiI
+from utils.indicators import movingAverageConverganceDivergance, relativeStrengthIndex, averageTrueRange, bollingerBands, stochasticIndicator
+from utils.cache import cachedIndicator
+
+# memoized, an indicator is computed once per (data, parameters) across backtests, see utils/cache.py
+macdI = cachedIndicator(movingAverageConverganceDivergance)
+rsiI = cachedIndicator(relativeStrengthIndex)
+atrI = cachedIndicator(averageTrueRange)
+bbI = cachedIndicator(bollingerBands)
+stiI = cachedIndicator(stochasticIndicator)
 
 from backtesting import Backtest, Strategy 
-from backtesting.lib import crossover, barssince, SignalStrategy, TrailingStrategy
+from backtesting.lib import crossover
 
 
 class BuyAndHoldStrategy(Strategy): 
@@ -45,13 +44,8 @@ class MACDStrategy(Strategy):
     macd_signal_ma_length = 9
 
     def init(self): 
-        stock_df = pd.DataFrame({ 
-            "Open": self.data.Open, 
-            "High": self.data.High, 
-            "Low": self.data.Low, 
-            "Close": self.data.Close, 
-            "Volume": self.data.Volume
-        })
+        # the indicators read the price arrays of self.data directly, see priceColumn in utils/indicators.py
+        stock_df = self.data
         self.macd, self.macd_signal, self.hist = self.I(macdI, 
                         stock_df, 'EMA', 'EMA',
                         self.macd_fast_ma_length, 
@@ -81,13 +75,8 @@ class BollingerBandsStrategy(Strategy):
     macd_signal_ma_length = 9
 
     def init(self): 
-        stock_df = pd.DataFrame({ 
-            "Open": self.data.Open, 
-            "High": self.data.High, 
-            "Low": self.data.Low, 
-            "Close": self.data.Close, 
-            "Volume": self.data.Volume
-        })
+        # the indicators read the price arrays of self.data directly, see priceColumn in utils/indicators.py
+        stock_df = self.data
         self.bb_basis, self.bb_upper, self.bb_lower = self.I(bbI, stock_df, self.bb_window)
         self.rsi, self.rsi_signal = self.I(rsiI, stock_df, self.rsi_window, self.rsi_smooth_window)
         
@@ -117,13 +106,8 @@ class ExperimentalStrategy(Strategy):
     macd_signal_ma_length = 9
 
     def init(self): 
-        stock_df = pd.DataFrame({ 
-            "Open": self.data.Open, 
-            "High": self.data.High, 
-            "Low": self.data.Low, 
-            "Close": self.data.Close, 
-            "Volume": self.data.Volume
-        })
+        # the indicators read the price arrays of self.data directly, see priceColumn in utils/indicators.py
+        stock_df = self.data
         self.bb_basis, self.bb_upper, self.bb_lower = self.I(bbI, 
                         stock_df, self.bb_window)
         self.rsi, self.rsi_signal = self.I(rsiI, 
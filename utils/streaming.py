@@ -0,0 +1,309 @@
+from collections import deque
+
+import numpy as np
+
+from utils.params import BollingerBandsParams
+from utils.params import MACDParams
+
+
+# Incremental counterparts of the indicators in utils/indicators.py for live bar feeds.
+# Every object keeps only the state it needs and is updated in O(1) per bar with update(...).
+# Values may be floats (one ticker) or numpy arrays (one element per ticker, all updated at once).
+# With arrays, the windows, spans and thresholds may be arrays too, one per ticker.
+
+
+def _field(bar, name):
+    """
+    Reads a price from a bar given as a dict, a pandas row or any object with Open/High/Low/Close attributes.
+    """
+    try:
+        return np.asarray(bar[name], dtype=np.float64)
+    except (KeyError, TypeError, IndexError):
+        return np.asarray(getattr(bar, name), dtype=np.float64)
+
+
+def _output(value):
+    return float(value) if np.ndim(value) == 0 else value
+
+
+class ExponentialMovingAverage:
+    """
+    Exponential moving average with the recurrence of pandas ewm(...).mean(), so that its values
+    are identical to the batch computation (including the adjust=True weighting and NaN handling).
+    """
+    def __init__(self, span = None, alpha = None, adjust = True):
+        self.alpha = alpha if alpha is not None else 2/(span + 1)
+        self.adjust = adjust
+        self.new_wt = 1. if adjust else self.alpha
+        self.weighted = None
+        self.old_wt = None
+        self.nobs = None
+        self.value = np.nan
+
+    def update(self, value):
+        value = np.asarray(value, dtype=np.float64)
+        is_observation = ~np.isnan(value)
+        if self.weighted is None:
+            self.weighted = value.copy()
+            self.old_wt = np.ones_like(value)
+            self.nobs = is_observation.astype(int)
+        else:
+            self.nobs = self.nobs + is_observation
+            has_value = ~np.isnan(self.weighted)
+            self.old_wt = np.where(has_value, self.old_wt*(1 - self.alpha), self.old_wt)
+            update = has_value & is_observation
+            with np.errstate(invalid='ignore'):
+                blended = np.where(self.weighted != value,
+                                   (self.old_wt*self.weighted + self.new_wt*value)/(self.old_wt + self.new_wt),
+                                   self.weighted)
+            self.weighted = np.where(update, blended, np.where(~has_value & is_observation, value, self.weighted))
+            self.old_wt = np.where(update, self.old_wt + self.new_wt if self.adjust else 1., self.old_wt)
+        self.value = _output(np.where(self.nobs >= 1, self.weighted, np.nan))
+        return self.value
+
+
+class RollingMeanStd:
+    """
+    Rolling mean and sample standard deviation over the last `window` values, kept up to date with
+    Welford's add/remove updates on a ring buffer. NaN until `window` valid values are in the window.
+    Like pandas, a window of identical values has exactly that mean and a zero deviation, instead of
+    the rounding residue the removals leave.
+    window may be an array with the window of every ticker, the ring buffer then holds the longest
+    one and every ticker removes the value that leaves its own window.
+    """
+    def __init__(self, window):
+        self.window = window
+        self.size = int(np.max(window))
+        self.buffer = None
+        self.position = 0
+
+    def update(self, value):
+        value = np.asarray(value, dtype=np.float64)
+        if self.buffer is None:
+            self.buffer = np.full((self.size,) + value.shape, np.nan)
+            self.nobs = np.zeros(value.shape)
+            self.mean = np.zeros(value.shape)
+            self.ssqdm = np.zeros(value.shape)
+            self.last = np.full(value.shape, np.nan)
+            self.same = np.zeros(value.shape)
+
+        if np.ndim(self.window) == 0:
+            old = self.buffer[self.position].copy()
+        else:
+            old = self.buffer[(self.position - self.window) % self.size, np.arange(value.size)]
+        self.buffer[self.position] = value
+        self.position = (self.position + 1) % self.size
+
+        removed = ~np.isnan(old)
+        nobs = self.nobs - removed
+        with np.errstate(invalid='ignore', divide='ignore'):
+            delta = np.where(removed, old - self.mean, 0)
+            mean = np.where(removed, np.where(nobs > 0, self.mean - delta/nobs, 0), self.mean)
+            ssqdm = np.where(removed, np.where(nobs > 0, self.ssqdm - delta*(old - mean), 0), self.ssqdm)
+
+            added = ~np.isnan(value)
+            nobs = nobs + added
+            delta = np.where(added, value - mean, 0)
+            mean = np.where(added, mean + delta/np.maximum(nobs, 1), mean)
+            ssqdm = np.where(added, ssqdm + delta*(value - mean), ssqdm)
+        self.nobs, self.mean, self.ssqdm = nobs, mean, ssqdm
+        # run of identical valid values ending with this one
+        self.same = np.where(added, np.where(value == self.last, self.same + 1, 1), self.same)
+        self.last = np.where(added, value, self.last)
+
+        complete = nobs == self.window
+        constant = self.same >= nobs
+        with np.errstate(invalid='ignore', divide='ignore'):
+            std = np.where(np.asarray(self.window) > 1, np.sqrt(np.maximum(ssqdm, 0)/(np.asarray(self.window) - 1)), np.nan)
+        mean, std = np.where(constant, self.last, mean), np.where(constant, 0, std)
+        return _output(np.where(complete, mean, np.nan)), _output(np.where(complete, std, np.nan))
+
+
+class RollingExtreme:
+    """
+    Rolling maximum (or minimum) over the last `window` values with a monotonic deque per ticker,
+    amortized O(1) per update. NaN until `window` values have been seen.
+    """
+    def __init__(self, window, mode = 'max'):
+        self.window = window
+        self.better = (lambda a, b: a >= b) if mode == 'max' else (lambda a, b: a <= b)
+        self.deques = None
+        self.count = 0
+
+    def update(self, value):
+        value = np.asarray(value, dtype=np.float64)
+        if self.deques is None:
+            self.deques = [deque() for _ in range(value.size)]
+        i = self.count
+        self.count += 1
+
+        result = np.full(value.size, np.nan)
+        for k, (candidates, x) in enumerate(zip(self.deques, value.reshape(-1))):
+            while candidates and candidates[0][0] <= i - self.window:
+                candidates.popleft()
+            if not np.isnan(x):
+                while candidates and self.better(x, candidates[-1][1]):
+                    candidates.pop()
+                candidates.append((i, x))
+            if self.count >= self.window and candidates:
+                result[k] = candidates[0][1]
+        return _output(result.reshape(value.shape))
+
+
+class BollingerBands:
+    """
+    Streaming bollingerBands: update(bar) returns (bb_basis, bb_upper, bb_lower) of the latest bar.
+    """
+    def __init__(self, ma_window = 20):
+        self.rolling = RollingMeanStd(ma_window)
+
+    def update(self, bar):
+        basis_ma, deviation = self.rolling.update(_field(bar, 'Close'))
+        return basis_ma, basis_ma + 2*deviation, basis_ma - 2*deviation
+
+
+class RelativeStrengthIndex:
+    """
+    Streaming relativeStrengthIndex: update(bar) returns (rsi, rsi_signal) of the latest bar.
+    Average gain/loss and the signal line use the same span based EMAs as the batch function.
+    """
+    def __init__(self, rsi_window = 14, ma_length = 14, smooth_signal = 'EMA'):
+        self.avg_gain = ExponentialMovingAverage(span = rsi_window)
+        self.avg_loss = ExponentialMovingAverage(span = rsi_window)
+        self.smooth = ExponentialMovingAverage(span = ma_length) if smooth_signal == 'EMA' else RollingMeanStd(ma_length)
+        self.smooth_signal = smooth_signal
+        self.prev_close = None
+
+    def update(self, bar):
+        close = _field(bar, 'Close')
+        delta = close - self.prev_close if self.prev_close is not None else np.full(close.shape, np.nan)
+        self.prev_close = close
+
+        avg_gain = np.asarray(self.avg_gain.update(np.where(delta > 0, delta, 0.)))
+        avg_loss = np.asarray(self.avg_loss.update(-np.where(delta < 0, delta, 0.)))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rsi = 100 - (100/(1 + avg_gain/avg_loss))
+        rsi_signal = self.smooth.update(rsi)
+        if self.smooth_signal != 'EMA':
+            rsi_signal = rsi_signal[0]
+        return _output(rsi), rsi_signal
+
+
+class MovingAverageConverganceDivergance:
+    """
+    Streaming movingAverageConverganceDivergance with EMA sources and signal line:
+    update(bar) returns (macd, macd_signal, macd_hist) of the latest bar.
+    """
+    def __init__(self, fast_ma_length = 12, slow_ma_length = 26, signal_ma_length = 9):
+        self.fast = ExponentialMovingAverage(span = fast_ma_length, adjust=False)
+        self.slow = ExponentialMovingAverage(span = slow_ma_length, adjust=False)
+        self.signal = ExponentialMovingAverage(span = signal_ma_length, adjust=False)
+
+    def update(self, bar):
+        close = _field(bar, 'Close')
+        macd = np.asarray(self.fast.update(close)) - np.asarray(self.slow.update(close))
+        signal = np.asarray(self.signal.update(macd))
+        return _output(macd), _output(signal), _output(macd - signal)
+
+
+class AverageTrueRange:
+    """
+    Streaming averageTrueRange (Wilder's rma of the true range): update(bar) returns the latest atr.
+    """
+    def __init__(self, period = 14):
+        self.rma = ExponentialMovingAverage(alpha = 1/period)
+        self.prev_close = None
+
+    def update(self, bar):
+        high, low, close = _field(bar, 'High'), _field(bar, 'Low'), _field(bar, 'Close')
+        prev_close = self.prev_close if self.prev_close is not None else np.full(close.shape, np.nan)
+        self.prev_close = close
+        tr = np.fmax(np.fmax(np.abs(high - low), np.abs(high - prev_close)), np.abs(low - prev_close))
+        return self.rma.update(tr)
+
+
+class StochasticIndicator:
+    """
+    Streaming stochastic oscillator: update(bar) returns (stoch, stoch_smooth) of the latest bar.
+    The highest high and lowest low come from monotonic deques. Like stochasticIndicatorBatch the
+    given periods are used.
+    """
+    def __init__(self, k_period = 14, d_period = 3):
+        self.highest = RollingExtreme(k_period, 'max')
+        self.lowest = RollingExtreme(k_period, 'min')
+        self.smooth = RollingMeanStd(d_period)
+
+    def update(self, bar):
+        high_rolling = np.asarray(self.highest.update(_field(bar, 'High')))
+        low_rolling = np.asarray(self.lowest.update(_field(bar, 'Low')))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            percent_k = 100 * (_field(bar, 'Close') - low_rolling)/(high_rolling - low_rolling)
+        smooth_k, _ = self.smooth.update(percent_k)
+        return _output(percent_k), smooth_k
+
+
+class BollingerBandsSignals:
+    """
+    Evaluates the rules of BollingerBandsStrategy on every new bar.
+
+    update(bar) returns (entry, exit): entry when the close is below the lower band and the smoothed
+    RSI below rsi_lower_thres. exit is always False like in the strategy, whose exit rule (the close
+    above the upper band and the smoothed RSI above rsi_upper_thres) never closes the position, the
+    position only being left through the stop-loss (see utils.vectorized.bollingerBandsSignals). That
+    rule is kept in band_exit. Acting on the signals (position checks, the 2.5% stop-loss) is left to
+    the caller. The bands and the smoothed RSI of the latest bar are kept in bands and rsi_signal.
+    """
+    def __init__(self, bb_window = BollingerBandsParams.bb_window,
+                 rsi_window = BollingerBandsParams.rsi_window,
+                 rsi_smooth_window = BollingerBandsParams.rsi_smooth_window,
+                 rsi_upper_thres = BollingerBandsParams.rsi_upper_thres,
+                 rsi_lower_thres = BollingerBandsParams.rsi_lower_thres):
+        self.bbands = BollingerBands(bb_window)
+        self.rsi = RelativeStrengthIndex(rsi_window, rsi_smooth_window)
+        self.rsi_upper_thres = rsi_upper_thres
+        self.rsi_lower_thres = rsi_lower_thres
+
+    def update(self, bar):
+        close = _field(bar, 'Close')
+        bb_basis, bb_upper, bb_lower = self.bands = self.bbands.update(bar)
+        rsi, rsi_signal = self.rsi.update(bar)
+        self.rsi_signal = rsi_signal
+        with np.errstate(invalid='ignore'):
+            entry = (close < bb_lower) & (np.asarray(rsi_signal) < self.rsi_lower_thres)
+            self.band_exit = (close > bb_upper) & (np.asarray(rsi_signal) > self.rsi_upper_thres)
+        return entry, np.zeros_like(self.band_exit)
+
+
+class MACDSignals:
+    """
+    Evaluates the rules of MACDStrategy on every new bar.
+
+    update(bar) returns (entry, exit): entry when the MACD crosses above its signal line at or
+    below zero, exit when it crosses below its signal line above zero. The MACD and signal line of
+    the latest bar are kept in prev.
+    """
+    def __init__(self, macd_fast_ma_length = MACDParams.macd_fast_ma_length,
+                 macd_slow_ma_length = MACDParams.macd_slow_ma_length,
+                 macd_signal_ma_length = MACDParams.macd_signal_ma_length):
+        self.macd = MovingAverageConverganceDivergance(macd_fast_ma_length, macd_slow_ma_length, macd_signal_ma_length)
+        self.prev = None
+
+    def update(self, bar):
+        macd, signal, _ = (np.asarray(value) for value in self.macd.update(bar))
+        prev_macd, prev_signal = self.prev if self.prev is not None else (np.full(macd.shape, np.nan),)*2
+        self.prev = (macd, signal)
+        with np.errstate(invalid='ignore'):
+            entry = (prev_macd < prev_signal) & (macd > signal) & (macd <= 0)
+            exit = (prev_signal < prev_macd) & (signal > macd) & (macd > 0)
+        return entry, exit
+
+
+def replay(stock_df, indicator):
+    """
+    Feeds the bars of stock_df one by one into an indicator or signal object and collects its outputs,
+    e.g. to compare a streaming object with the batch functions.
+
+    Returns:
+    - list: one update(...) output per bar.
+    """
+    return [indicator.update(bar) for bar in stock_df.to_dict('records')]
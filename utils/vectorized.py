@@ -0,0 +1,438 @@
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+from utils.datastore import openStore, readStockData, PRECISIONS
+from utils.params import PARAM_COLUMNS, STRATEGY_PARAMS, ParamsTable
+from utils.metrics import computeMetrics
+from utils.indicators import bollingerBandsBatch, relativeStrengthIndexBatch, exponentialMovingAverageBatch, selectPerTicker
+
+
+# Strategy classes of utils/strategies.py, imported only by validateAgainstBacktest so that the engine
+# does not load backtesting
+STRATEGIES = {
+    "bb": "BollingerBandsStrategy",
+    "macd": "MACDStrategy",
+    "experimental": "ExperimentalStrategy"
+}
+
+# version of backtesting.py (pinned in requirements.txt) whose order handling the engines mirror. Its
+# end of data handling is the one of simulate: the trades still open are closed and the broker runs
+# once more on the last bar, while later versions leave them open (unless finalize_trades=True) and
+# start the buy and hold return after the warm-up of the indicators
+BACKTESTING_VERSION = '0.3.3'
+
+TRADE_SIZE = 100
+STOP_LOSS = 0.975
+EXPERIMENTAL_STOP_LOSS = 0.95
+
+# data columns (not indicators) read by ExperimentalStrategy, see utils.statemachine.experimentalColumns
+EXPERIMENTAL_COLUMNS = ['Ema_100', 'Bb_basis']
+
+# backtesting.py sizes `self.buy()` without arguments as (almost) the full equity
+_FULL_EQUITY = 1 - sys.float_info.epsilon
+
+
+def requireBacktesting():
+    """
+        Imports backtesting, raising when the installed version is not BACKTESTING_VERSION: the
+        parity checks against Backtest.run would otherwise report differences of the library.
+    """
+    import backtesting
+    if backtesting.__version__ != BACKTESTING_VERSION:
+        raise RuntimeError(f"backtesting {backtesting.__version__} is installed, the engines mirror backtesting "
+                           f"{BACKTESTING_VERSION}: pip install backtesting=={BACKTESTING_VERSION} (see requirements.txt)")
+    return backtesting
+
+
+def loadPanel(stock_files, date_range = None, precision = 'float64'):
+    """
+    Loads the history_stock_*.csv files (through the store when it is up to date, see
+    utils/datastore.py) into a (bars x tickers) panel.
+
+    Every ticker keeps its own bar numbering (row 0 is its first bar) exactly as a per-ticker
+    Backtest sees it, shorter tickers are padded with NaN at the end.
+
+    Parameters:
+    - stock_files (dict): ticker -> path of its csv file, empty files are skipped.
+    - date_range (tuple): (start_date, end_date) of the bars to load, None for all, see utils.datastore.dateRange.
+    - precision (str): dtype of the prices of the panel, see utils.datastore.PRECISIONS. float32
+      halves the memory of the panel, the simulation itself still accumulates cash in float64.
+
+    Returns:
+    - panel (dict): 'Open', 'High', 'Low', 'Close' DataFrames of shape (bars, tickers).
+    - lengths (ndarray): number of bars of every ticker.
+    """
+    frames = {}
+    for ticker, stock_name in stock_files.items():
+        stock_df = readStockData(stock_name, openStore(os.path.dirname(stock_name)), date_range, precision)
+        if stock_df.shape[0] == 0: continue
+        frames[ticker] = stock_df
+
+    panel = {
+        column: pd.DataFrame({ticker: df[column] for ticker, df in frames.items()}, dtype=PRECISIONS[precision])
+        for column in ['Open', 'High', 'Low', 'Close']
+    }
+    lengths = np.array([df.shape[0] for df in frames.values()], dtype=int)
+    return panel, lengths
+
+
+def tickerParams(tickers, strategy_name, opt_params = None):
+    """
+    Returns a DataFrame indexed by ticker with the parameters of the strategy for every ticker.
+    Tickers without optimized parameters (or opt_params None) get the defaults of the Strategy class.
+
+    Parameters:
+    - opt_params (ParamsTable or DataFrame): optimized parameters, a DataFrame in the layout of opt_params.csv is indexed first.
+    """
+    if opt_params is None:
+        opt_params = ParamsTable()
+    elif not isinstance(opt_params, ParamsTable):
+        opt_params = ParamsTable.fromFrame(opt_params, (strategy_name,))
+    return opt_params.frame(list(tickers), strategy_name)
+
+
+def _crossover(series1, series2):
+    """
+    Vectorized backtesting.lib.crossover: True on the bars where series1 just crossed above series2.
+    """
+    previous1 = np.vstack([np.full((1, series1.shape[1]), np.nan), series1[:-1]])
+    previous2 = np.vstack([np.full((1, series2.shape[1]), np.nan), series2[:-1]])
+    return (previous1 < previous2) & (series1 > series2)
+
+
+def _warmupBars(indicators):
+    """
+    Same rule as backtesting.py: trading starts one bar after the bar where the slowest indicator
+    produced its first non NaN value.
+    """
+    return 1 + np.max([np.isnan(indicator).argmin(axis=0) for indicator in indicators], axis=0)
+
+
+def _positions(values):
+    """
+    The distinct values and, for every element, the position of its value among them.
+    """
+    distinct, idx = np.unique(np.asarray(values, dtype=int), return_inverse=True)
+    return list(distinct), idx
+
+
+def bollingerBandsSignals(panel, params):
+    """
+    Entry signals, exit signals and stop-loss levels of BollingerBandsStrategy for the whole panel.
+
+    The bands are computed once per distinct bb_window and the RSI once per distinct rsi_window for
+    all tickers together (see the batch kernels of utils/indicators.py), then every ticker picks its own.
+
+    Note that BollingerBandsStrategy.next references `self.position.close` without calling it, so a
+    position is only ever left through the stop-loss (or at the end of the data). The exit mask is
+    therefore empty, to stay trade-for-trade identical with Backtest.run.
+
+    Returns:
+    - entries, exits (bool ndarray): (bars x tickers) signals evaluated at the close of every bar.
+    - stop_loss (ndarray): stop-loss price attached to an entry order placed on that bar.
+    - start (ndarray): first bar on which every ticker is traded.
+    """
+    close = panel['Close'].values
+    tickers = np.arange(close.shape[1])
+    windows, window_idx = _positions(params['bb_window'])
+    rsi_windows, rsi_idx = _positions(params['rsi_window'])
+    smooth_windows, smooth_idx = _positions(params['rsi_smooth_window'])
+
+    bands = [selectPerTicker(band, window_idx) for band in bollingerBandsBatch(close, windows)]
+    rsi, rsi_smooth = relativeStrengthIndexBatch(close, rsi_windows, smooth_windows)
+    rsi = selectPerTicker(rsi, rsi_idx)
+    rsi_signal = rsi_smooth[rsi_idx, smooth_idx, :, tickers].T
+
+    with np.errstate(invalid='ignore'):
+        entries = (close < bands[2]) & (rsi_signal < params['rsi_lower_thres'].values)
+    exits = np.zeros_like(entries)
+    stop_loss = close*STOP_LOSS
+    start = _warmupBars(bands + [rsi, rsi_signal])
+    return entries, exits, stop_loss, start
+
+
+def _macdLines(close, params):
+    """
+    MACD and signal lines of every ticker with its own lengths: every distinct EMA span is computed
+    once for all tickers, the signal line once per distinct signal length.
+    """
+    spans, span_idx = _positions(np.r_[params['macd_fast_ma_length'], params['macd_slow_ma_length']])
+    emas = exponentialMovingAverageBatch(close, spans, adjust=False)
+    macd = selectPerTicker(emas, span_idx[:len(params)]) - selectPerTicker(emas, span_idx[len(params):])
+
+    macd_signal = np.empty_like(macd)
+    signal_lengths = params['macd_signal_ma_length'].values
+    for length in np.unique(signal_lengths):
+        columns = signal_lengths == length
+        macd_signal[:, columns] = exponentialMovingAverageBatch(macd[:, columns], [int(length)], adjust=False)[0]
+    return macd, macd_signal
+
+
+def macdSignals(panel, params):
+    """
+    Entry and exit signals of MACDStrategy for the whole panel, see bollingerBandsSignals and
+    _macdLines. MACDStrategy does not use a stop-loss so stop_loss is all NaN.
+    """
+    close = panel['Close'].values
+    macd, macd_signal = _macdLines(close, params)
+
+    with np.errstate(invalid='ignore'):
+        entries = _crossover(macd, macd_signal) & (macd <= 0)
+        exits = _crossover(macd_signal, macd) & (macd > 0)
+    stop_loss = np.full(close.shape, np.nan)
+    start = _warmupBars([macd, macd_signal, macd - macd_signal])
+    return entries, exits, stop_loss, start
+
+
+def experimentalSignals(panel, params):
+    """
+    Entry and exit signals of ExperimentalStrategy for the whole panel: buyOpportunity (whose rules
+    depend on isUptrend) gives the entries, danger the exits, and entries carry a 5% stop-loss.
+    The strategy reads the Ema_100 and Bb_basis columns of the data, the panel needs them as well.
+    """
+    missing = [column for column in EXPERIMENTAL_COLUMNS if column not in panel]
+    if missing:
+        raise ValueError(f"ExperimentalStrategy reads the {missing} columns of the data, see utils.statemachine.experimentalColumns")
+    close = panel['Close'].values
+    tickers = np.arange(close.shape[1])
+    windows, window_idx = _positions(params['bb_window'])
+    rsi_windows, rsi_idx = _positions(params['rsi_window'])
+    smooth_windows, smooth_idx = _positions(params['rsi_smooth_window'])
+
+    basis, upper, lower = (selectPerTicker(band, window_idx) for band in bollingerBandsBatch(close, windows))
+    rsi, rsi_smooth = relativeStrengthIndexBatch(close, rsi_windows, smooth_windows)
+    rsi = selectPerTicker(rsi, rsi_idx)
+    rsi_signal = rsi_smooth[rsi_idx, smooth_idx, :, tickers].T
+    macd, macd_signal = _macdLines(close, params)
+    ema, data_basis = panel['Ema_100'].values, panel['Bb_basis'].values
+
+    with np.errstate(invalid='ignore'):
+        uptrend = (close > ema) & (data_basis > ema)
+        close_over_lower = _crossover(close, lower)
+        macd_over_signal = _crossover(macd, macd_signal)
+        buy_uptrend = close_over_lower | (_crossover(close, basis) & (rsi_signal < 40)) | (macd_over_signal & (macd < 0))
+        buy_confirmed = (close_over_lower & (rsi_signal < 25)) | (macd_over_signal & (macd <= 0) & (rsi_signal < 25))
+        entries = np.where(uptrend, buy_uptrend, buy_confirmed)
+        exits = _crossover(upper, close) | _crossover(basis, close) | _crossover(lower, close) | (rsi_signal >= 80)
+    stop_loss = close*EXPERIMENTAL_STOP_LOSS
+    start = _warmupBars([basis, upper, lower, rsi, rsi_signal, macd, macd_signal, macd - macd_signal])
+    return entries, exits, stop_loss, start
+
+
+SIGNALS = {
+    "bb": bollingerBandsSignals,
+    "macd": macdSignals,
+    "experimental": experimentalSignals
+}
+
+
+def simulate(panel, lengths, start, entries, exits, stop_loss, cash = 10_000, size = TRADE_SIZE):
+    """
+    Steps all tickers bar by bar at once, mirroring the order handling of backtesting.Backtest with
+    its default settings: orders placed on the close of a bar are filled on the open of the next bar,
+    an entry is cancelled when cash does not cover size*open, a stop-loss fills at min(open, stop) as
+    soon as the low goes below it (also on the entry bar), and trades still open at the end are closed
+    on the open of the last bar (as in BACKTESTING_VERSION). Each ticker has its own isolated cash.
+
+    Parameters:
+    - panel (dict): 'Open', 'High', 'Low', 'Close' (bars x tickers) frames, see loadPanel.
+    - lengths (ndarray): number of bars of every ticker.
+    - start (ndarray): first traded bar of every ticker.
+    - entries, exits (bool ndarray): (bars x tickers) signals evaluated on the close of every bar.
+    - stop_loss (ndarray): (bars x tickers) stop price for an entry placed on that bar, NaN for none.
+    - cash (float): starting cash of every ticker.
+    - size (int): number of shares bought on every entry.
+
+    Returns:
+    - equity (ndarray): (bars x tickers) equity curves, NaN after the last bar of a ticker.
+    - trades (DataFrame): closed trades in backtesting's _trades layout with an extra 'Ticker' column.
+    """
+    open_, high, low, close = (panel[column].values for column in ['Open', 'High', 'Low', 'Close'])
+    n_bars, n_tickers = close.shape
+    columns = np.arange(n_tickers)
+
+    balance = np.full(n_tickers, float(cash))
+    in_position = np.zeros(n_tickers, dtype=bool)
+    entry_price = np.zeros(n_tickers)
+    entry_bar = np.zeros(n_tickers, dtype=int)
+    sl = np.full(n_tickers, np.nan)
+    pending_entry = np.zeros(n_tickers, dtype=bool)
+    pending_sl = np.full(n_tickers, np.nan)
+    pending_close = np.zeros(n_tickers, dtype=bool)
+    equity = np.full((n_bars, n_tickers), np.nan)
+    closed = []
+
+    def closeTrades(mask, price, bar):
+        idx = columns[mask]
+        if not len(idx): return
+        exit_price = price[idx]
+        balance[idx] += size*(exit_price - entry_price[idx])
+        in_position[idx] = False
+        closed.append((idx, entry_bar[idx].copy(), np.broadcast_to(bar, idx.shape).copy(),
+                       entry_price[idx].copy(), exit_price.copy(), sl[idx].copy()))
+
+    def processOrders(i, active):
+        o, l = open_[i], low[i]
+        # trade.close() orders, the broker puts them in front of its queue so they fill before a stop-loss
+        closeTrades(active & in_position & pending_close, o, i)
+        pending_close[active] = False
+        # stop-loss orders of trades opened on earlier bars
+        hit = active & in_position & (l < sl)
+        closeTrades(hit, np.fmin(o, sl), i)
+        # entry orders, cancelled by the broker when there isn't enough cash
+        filled = active & pending_entry & (size*o <= balance)
+        in_position[filled] = True
+        entry_price[filled] = o[filled]
+        entry_bar[filled] = i
+        sl[filled] = pending_sl[filled]
+        pending_entry[active] = False
+        # the stop-loss of a new trade may already be hit within its entry bar
+        hit = filled & (l < sl)
+        closeTrades(hit, np.fmin(o, sl), i)
+
+    def markToMarket(i, active):
+        value = balance + np.where(in_position, size*(close[i] - entry_price), 0)
+        equity[i, active] = value[active]
+
+    for i in range(1, n_bars):
+        active = (i >= start) & (i < lengths)
+        if not active.any(): continue
+
+        processOrders(i, active)
+        markToMarket(i, active)
+
+        # strategy.next() on the close of bar i
+        new_entries = active & ~in_position & entries[i]
+        pending_entry[new_entries] = True
+        pending_sl[new_entries] = stop_loss[i, new_entries]
+        pending_close[active & in_position & exits[i]] = True
+
+        # end of the data: open trades are closed and the broker runs once more on the last bar
+        last = active & (i == lengths - 1)
+        if last.any():
+            pending_close[last & in_position] = True
+            processOrders(i, last)
+            markToMarket(i, last)
+
+    # bars before the first traded bar hold the starting cash
+    for j in range(n_tickers):
+        equity[:lengths[j], j] = pd.Series(equity[:lengths[j], j]).bfill().fillna(cash).values
+
+    trades = _tradesFrame(closed, list(panel['Close'].columns), size)
+    return equity, trades
+
+
+def _tradesFrame(closed, tickers, size):
+    if closed:
+        idx, entry_bar, exit_bar, entry_price, exit_price, sl = (np.concatenate(values) for values in zip(*closed))
+    else:
+        idx = entry_bar = exit_bar = np.array([], dtype=int)
+        entry_price = exit_price = sl = np.array([], dtype=float)
+    trades = pd.DataFrame({
+        "Ticker": np.array(tickers, dtype=object)[idx],
+        "Size": size,
+        "EntryBar": entry_bar,
+        "ExitBar": exit_bar,
+        "EntryPrice": entry_price,
+        "ExitPrice": exit_price,
+        "SL": sl,
+        "PnL": size*(exit_price - entry_price),
+        "ReturnPct": exit_price/entry_price - 1,
+        "EntryTime": entry_bar,
+        "ExitTime": exit_bar,
+        "Duration": exit_bar - entry_bar
+    })
+    # per ticker in the order the trades were closed, like broker.closed_trades
+    trades['_order'] = np.arange(len(trades))
+    trades['_column'] = idx
+    trades = trades.sort_values(['_column', '_order'], kind='stable').drop(columns=['_order', '_column'])
+    return trades.reset_index(drop=True)
+
+
+def buyAndHold(panel, lengths, cash = 10_000):
+    """
+    Final equity of BuyAndHoldStrategy for every ticker. The strategy buys with (almost) all of its
+    cash on the first bar, which is filled on the open of the second traded bar (bar 2) and closed on
+    the open of the last bar.
+    """
+    open_ = panel['Open'].values
+    final_equity = np.full(len(lengths), float(cash))
+    for j, n in enumerate(lengths):
+        if n < 3: continue
+        shares = int((cash*_FULL_EQUITY) // open_[2, j])
+        final_equity[j] += shares*(open_[n-1, j] - open_[2, j])
+    return final_equity
+
+
+def computeStats(equity, trades, close):
+    """
+    The subset of backtesting's stats that main.py reports, for a single ticker (see
+    utils.metrics.computeMetrics).
+
+    Parameters:
+    - equity (ndarray): equity curve of the ticker.
+    - trades (DataFrame): closed trades of the ticker, as returned by simulate.
+    - close (ndarray): close prices of the ticker.
+
+    Returns:
+    - dict: keyed like the stats Series returned by Backtest.run.
+    """
+    return computeMetrics(equity, trades['PnL'].values, trades['ReturnPct'].values, trades['Duration'].values.astype(float), close)
+
+
+def runVectorizedBacktest(panel, lengths, strategy_name, opt_params = None, cash = 10_000, simulator = None):
+    """
+    Runs BollingerBandsStrategy ('bb'), MACDStrategy ('macd') or ExperimentalStrategy ('experimental')
+    on every ticker of the panel at once. simulator replaces simulate, e.g. with the compiled
+    utils.statemachine.simulateStateMachine.
+
+    Returns:
+    - equity (ndarray): (bars x tickers) equity curves.
+    - trades (DataFrame): closed trades of all tickers, see simulate.
+    - params (DataFrame): parameters used for every ticker.
+    """
+    params = tickerParams(panel['Close'].columns, strategy_name, opt_params)
+    entries, exits, stop_loss, start = SIGNALS[strategy_name](panel, params)
+    equity, trades = (simulator or simulate)(panel, lengths, start, entries, exits, stop_loss, cash)
+    return equity, trades, params
+
+
+def validateAgainstBacktest(stock_df, strategy_name, params = None, cash = 10_000, simulator = None):
+    """
+    Runs one ticker through both backtesting.Backtest and the vectorized engine and compares them
+    trade for trade. Raises when backtesting is not BACKTESTING_VERSION, see requireBacktesting.
+
+    Parameters:
+    - stock_df (DataFrame): history of a single ticker with Open, High, Low, Close columns (and the
+      EXPERIMENTAL_COLUMNS for 'experimental').
+    - strategy_name (str): 'bb', 'macd' or 'experimental'.
+    - params (dict): strategy parameters, None for the defaults.
+    - simulator (function): replaces simulate in the vectorized engine, see runVectorizedBacktest.
+
+    Returns:
+    - mismatches (list of str): empty when both engines produced the same trades and final equity.
+    """
+    from utils import strategies
+
+    Backtest = requireBacktesting().Backtest
+    params = params or {}
+    bt = Backtest(stock_df, getattr(strategies, STRATEGIES[strategy_name]), cash = cash)
+    stats = bt.run(**params)
+    expected = stats._trades
+
+    columns = ['Open', 'High', 'Low', 'Close'] + [column for column in EXPERIMENTAL_COLUMNS if column in stock_df]
+    panel = {column: stock_df[[column]].astype(float).set_axis(['ticker'], axis=1) for column in columns}
+    opt_params = ParamsTable({'ticker': {strategy_name: STRATEGY_PARAMS[strategy_name](**params)}})
+    equity, trades, _ = runVectorizedBacktest(panel, np.array([stock_df.shape[0]]), strategy_name, opt_params, cash, simulator)
+
+    mismatches = []
+    if len(expected) != len(trades):
+        mismatches.append(f"{len(expected)} trades in Backtest.run, {len(trades)} in the vectorized engine")
+    for column in ['EntryBar', 'ExitBar', 'EntryPrice', 'ExitPrice', 'PnL']:
+        if len(expected) == len(trades) and not np.allclose(expected[column].values.astype(float), trades[column].values.astype(float)):
+            mismatches.append(f"{column} differs")
+    if not np.isclose(stats['Equity Final [$]'], equity[stock_df.shape[0] - 1, 0]):
+        mismatches.append(f"final equity {stats['Equity Final [$]']} != {equity[stock_df.shape[0] - 1, 0]}")
+    return mismatches
@@ -0,0 +1,181 @@
+import os
+import argparse
+from dataclasses import asdict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from utils.datastore import tickerFromPath, openStore, readStockData, readStockTimestamps, listStockNames, SPLITS
+from utils.params import PARAM_COLUMNS, STRATEGY_PARAMS
+from utils.optimize import GRIDS, SIGNALS, gridCombinations
+from utils.metrics import sqnByColumn
+from utils.vectorized import simulate
+
+
+def walkForwardFolds(start_date, end_date, train_months = 3, test_months = 1, step_months = None):
+    """
+    Rolling in-sample/out-of-sample windows between start_date and end_date: every fold trains on
+    train_months and tests on the test_months that follow, the next fold starting step_months
+    (test_months by default, so that the test windows are contiguous) later. The default 3/1 months
+    reproduce the insample/outsample split of SPLITS as the first fold.
+
+    Returns:
+    - folds (list): ((train_start, train_end), (test_start, test_end)) date ranges, both days included
+      like utils.datastore.dateRange. The last test window is cut at end_date.
+    """
+    step = pd.DateOffset(months=step_months or test_months)
+    end = pd.Timestamp(end_date)
+    day = pd.Timedelta(days=1)
+    folds = []
+    train_start = pd.Timestamp(start_date)
+    while True:
+        test_start = train_start + pd.DateOffset(months=train_months)
+        if test_start > end: break
+        test_end = min(test_start + pd.DateOffset(months=test_months) - day, end)
+        folds.append(((str(train_start.date()), str((test_start - day).date())), (str(test_start.date()), str(test_end.date()))))
+        train_start += step
+    return folds
+
+
+def _foldBars(timestamps, date_range):
+    """
+    [first, last) bar positions of date_range in the sorted timestamps of a ticker.
+    """
+    start, end = date_range
+    return (int(np.searchsorted(timestamps, pd.Timestamp(start).value)),
+            int(np.searchsorted(timestamps, (pd.Timestamp(end) + pd.Timedelta(days=1)).value)))
+
+
+def _simulateWindows(stock_df, signals, windows, combos, cash):
+    """
+    Simulates every (first bar, last bar, combination) window at once, every window being a column
+    of one panel: its bars and the signals of its combination are sliced from the signals computed
+    on the whole history, so the indicators are computed only once per ticker.
+    """
+    entries, exits, stop_loss, start = signals
+    first = np.array([window[0] for window in windows], dtype=int)
+    lengths = np.array([window[1] - window[0] for window in windows], dtype=int)
+    combo = np.array(combos, dtype=int)
+
+    rows = np.minimum(first[None, :] + np.arange(max(lengths.max(), 1))[:, None], stock_df.shape[0] - 1)
+    columns = range(len(windows))
+    panel = {column: pd.DataFrame(stock_df[column].values.astype(float)[rows], columns=columns)
+             for column in ['Open', 'High', 'Low', 'Close']}
+    # the warm-up only holds back the windows starting before the indicators are available
+    window_start = np.maximum(start[combo] - first, 0)
+    return simulate(panel, lengths, window_start, entries[rows, combo], exits[rows, combo], stop_loss[rows, combo], cash)
+
+
+def walkForwardTicker(stock_name, strategy_name, folds, cash = 10_000):
+    """
+    Walk-forward optimization of one ticker: the parameters maximizing the SQN on the train window
+    of every fold (see utils.optimize.bestParams) are traded on its test window.
+
+    The signals of every combination of the grid are computed once on the whole history and sliced
+    for every window, a window therefore sees indicators warmed up on the bars before it (like a live
+    run) instead of starting cold. The train windows of all folds are scored in a single simulation,
+    as are the test windows. Every test window starts flat with `cash`.
+
+    Returns:
+    - None for a ticker without bars, otherwise (folds, equity):
+    - folds (list of dict): one row per fold with its windows, the chosen parameters, the train SQN
+      and the test return and number of trades.
+    - equity (Series): out-of-sample equity stitched over the test windows (the PnL of the previous
+      folds carried over), indexed by the bar timestamps.
+    """
+    store = openStore(os.path.dirname(stock_name))
+    span = (folds[0][0][0], folds[-1][1][1])
+    stock_df = readStockData(stock_name, store, span)
+    if stock_df.shape[0] == 0: return None
+    timestamps = readStockTimestamps(stock_name, store, span)
+
+    # the defaults are appended to the grid, they are traded when no combination has an SQN
+    grid = gridCombinations(*GRIDS[strategy_name])
+    defaults = pd.DataFrame([asdict(STRATEGY_PARAMS[strategy_name]())])[PARAM_COLUMNS[strategy_name]]
+    combos = pd.concat([grid, defaults], ignore_index=True)
+    close = stock_df.Close.astype(float).reset_index(drop=True)
+    signals = SIGNALS[strategy_name](close, combos)
+
+    train_bars = [_foldBars(timestamps, train) for train, _ in folds]
+    test_bars = [_foldBars(timestamps, test) for _, test in folds]
+    n_grid = len(grid)
+    windows = [bars for bars in train_bars for _ in range(n_grid)]
+    _, trades = _simulateWindows(stock_df, signals, windows, list(range(n_grid))*len(folds), cash)
+    sqn = sqnByColumn(trades, len(windows)).reshape(len(folds), n_grid)
+    chosen = [n_grid if np.all(np.isnan(scores)) else int(np.nanargmax(scores)) for scores in sqn]
+
+    equity, trades = _simulateWindows(stock_df, signals, test_bars, chosen, cash)
+    ticker = tickerFromPath(stock_name)
+    rows, curves = [], []
+    carried = 0.0
+    for k, ((train, test), (first, last)) in enumerate(zip(folds, test_bars)):
+        pnl = equity[:last - first, k] - cash
+        rows.append({
+            "ticker": ticker,
+            "fold": k,
+            "train_start": train[0],
+            "train_end": train[1],
+            "test_start": test[0],
+            "test_end": test[1],
+            **{column: int(value) for column, value in combos.iloc[chosen[k]].items()},
+            "train_sqn": sqn[k, chosen[k]] if chosen[k] < n_grid else np.nan,
+            "test_return": pnl[-1]/cash*100 if len(pnl) else np.nan,
+            "test_trades": int((trades['Ticker'] == k).sum())
+        })
+        curves.append(pd.Series(cash + carried + pnl, index=pd.to_datetime(timestamps[first:last])))
+        if len(pnl): carried += pnl[-1]
+    return rows, pd.concat(curves).rename(ticker)
+
+
+def walkForwardFolder(data_folder, strategy_name, folds, workers = 1):
+    """
+    Runs walkForwardTicker on every ticker of data_folder, tickers being spread over a process pool.
+
+    Returns:
+    - folds (DataFrame): one row per ticker and fold, see walkForwardTicker.
+    - equity (DataFrame): stitched out-of-sample equity, one row per ticker and test bar.
+    """
+    stock_names = listStockNames(data_folder)
+    if workers <= 1:
+        outcomes = [walkForwardTicker(stock_name, strategy_name, folds) for stock_name in tqdm(stock_names)]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            outcomes = list(tqdm(executor.map(walkForwardTicker, stock_names, [strategy_name]*len(stock_names), [folds]*len(stock_names)), total=len(stock_names)))
+    outcomes = [outcome for outcome in outcomes if outcome is not None]
+    fold_rows = pd.DataFrame([row for rows, _ in outcomes for row in rows])
+    equity = pd.concat([curve.rename('equity').rename_axis('time').reset_index().assign(ticker=curve.name) for _, curve in outcomes], ignore_index=True) \
+        if outcomes else pd.DataFrame(columns=['time', 'equity', 'ticker'])
+    return fold_rows, equity[['ticker', 'time', 'equity']]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+                    prog='Walk-Forward Optimization',
+                    description='re-optimizes the strategy parameters on rolling train windows and trades them on the test window that follows')
+    parser.add_argument('--data_folder', default="./data/raw/history")
+    parser.add_argument('--strategy', default='bb', choices=['bb', 'macd'])
+    parser.add_argument('--start_date', default=SPLITS['insample'][0], help="first day of the first train window")
+    parser.add_argument('--end_date', default=SPLITS['outsample'][1], help="last day of the last test window")
+    parser.add_argument('--train_months', default=3, type=int)
+    parser.add_argument('--test_months', default=1, type=int)
+    parser.add_argument('--step_months', default=None, type=int, help="months between two folds, test_months by default")
+    parser.add_argument('--output_folder', default='./results')
+    parser.add_argument('--workers', default=os.cpu_count(), type=int)
+    args = parser.parse_args()
+
+    folds = walkForwardFolds(args.start_date, args.end_date, args.train_months, args.test_months, args.step_months)
+    if not folds:
+        parser.error("no fold fits between start_date and end_date, lower train_months or extend the dates")
+    print(f"{len(folds)} folds, from {folds[0][0]} / {folds[0][1]} to {folds[-1][0]} / {folds[-1][1]}")
+
+    fold_rows, equity = walkForwardFolder(args.data_folder, args.strategy, folds, args.workers)
+    os.makedirs(args.output_folder, exist_ok=True)
+    folds_path = os.path.join(args.output_folder, f'walkforward_{args.strategy}.csv')
+    equity_path = os.path.join(args.output_folder, f'walkforward_equity_{args.strategy}.csv')
+    fold_rows.to_csv(folds_path, index=False)
+    equity.to_csv(equity_path, index=False)
+    if fold_rows.shape[0]:
+        print(fold_rows.groupby('fold')['test_return'].mean().rename('mean out-of-sample return [%]').to_string())
+    print(f"Folds saved in {folds_path}, out-of-sample equity in {equity_path}")